@@ -36,7 +36,7 @@ if not os.path.exists("engine.db"):
             if not new:
                 table_id = word[block_id, position, "table"]
                 new_table_id = entries.insert(table_id, {"index": i})
-                if new_table_id > table_id:
+                if new_table_id != table_id:
                     word[block_id, position, "table"] = new_table_id
             else:
                 table_id = entries.insert(entries.new_table(), {"index": i})
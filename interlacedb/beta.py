@@ -1,6 +1,7 @@
 import os
 
 from .database import InterlaceDB
+from .datastructure.cache import LRU
 
 
 class DataFrame:
@@ -73,7 +74,6 @@ class DataFrame:
 
 class Graph:
     def __init__(self, filename, cache_len=1000000):
-        from lru import LRU
         self.out_cache = LRU(cache_len)
         self.in_cache = LRU(cache_len)
 
@@ -95,6 +95,7 @@ class Graph:
                     "edge", node="U15")
                 nodes = LayerTable(node, key="key",
                                    n_bloom_filters=50,
+                                   bloom_fp_rate=.01,
                                    probe_factor=.1,
                                    growth_factor=2,
                                    cache_len=cache_len)
@@ -124,7 +125,7 @@ class Graph:
             p, position = self.nodes.find_lookup_position(u, key_hash)
             found = True
         except KeyError:
-            p, position = self.nodes.find_insert_position(u, key_hash)
+            p, position, status = self.nodes._find_insert_slot(u, key_hash)
         table_id = self.nodes.tables_id[p - self.nodes.p_init]
 
         if found:
@@ -139,9 +140,11 @@ class Graph:
         data["_in_table"] = in_table
 
         self._node.set(table_id, position, data)
+        self.nodes._update_counts(status, 1)
         self.header["n_nodes"] += 1
         self.nodes._insert_in_bloom(p, u)
         self.nodes.cache[u] = p, position
+        self.nodes._discard_record(u)
 
         if commit:
             self.db.end_transaction()
@@ -179,12 +182,14 @@ class Graph:
         new_u_out = self.edges.insert(u_out_table, {"node": v})
         new_v_in = self.edges.insert(v_in_table, {"node": u})
 
-        if new_u_out > u_out_table:
+        if new_u_out != u_out_table:
             self._node.set_value(u_t, u_pos, "_out_table", new_u_out)
             self.out_cache[u] = new_u_out
-        if new_v_in > v_in_table:
+            self.nodes._discard_record(u)
+        if new_v_in != v_in_table:
             self._node.set_value(v_t, v_pos, "_in_table", new_v_in)
             self.in_cache[v] = new_v_in
+            self.nodes._discard_record(v)
 
         self.header["n_edges"] += 1
 
@@ -193,9 +198,37 @@ class Graph:
     def neighbors(self, u):
         u_t, u_pos = self.get_node_position(u)
         u_out_table = self._node.get_value(u_t, u_pos, "_out_table")
-        return list(self.edges.iterate(u_out_table, "node"))
+        return self.edges.iterate_array(u_out_table, "node").tolist()
 
     def predecessors(self, u):
         u_t, u_pos = self.get_node_position(u)
         u_in_table = self._node.get_value(u_t, u_pos, "_in_table")
-        return list(self.edges.iterate(u_in_table, "node"))
+        return self.edges.iterate_array(u_in_table, "node").tolist()
+
+    def out_degree(self, u):
+        u_t, u_pos = self.get_node_position(u)
+        u_out_table = self._node.get_value(u_t, u_pos, "_out_table")
+        return self.edges.len(u_out_table)
+
+    def in_degree(self, u):
+        u_t, u_pos = self.get_node_position(u)
+        u_in_table = self._node.get_value(u_t, u_pos, "_in_table")
+        return self.edges.len(u_in_table)
+
+    def compact(self, min_tables=2):
+        """
+        rebuilds every adjacency chain of at least `min_tables` tables into
+        a single table
+        """
+        self.db.begin_transaction()
+        for node in self.nodes:
+            u = node["key"]
+            updates = {}
+            for field, cache in (("_out_table", self.out_cache),
+                                 ("_in_table", self.in_cache)):
+                new_ids = self.edges.compact_many([node[field]], min_tables)
+                if new_ids:
+                    updates[field] = cache[u] = new_ids[int(node[field])]
+            if updates:
+                self.nodes.upsert(u, update_fn=lambda _: updates)
+        self.db.end_transaction()
@@ -1,9 +1,12 @@
 import os
+import weakref
 from pickle import HIGHEST_PROTOCOL, dumps, loads
 
-from numpy import array, ceil, dtype, frombuffer, int8, uint32, where
+from numpy import (array, ceil, dtype, frombuffer, int8, memmap, uint32, uint64,
+                   where)
 
-from .dataset import Array, BoolArray, Dataset, Group, blob_dt
+from .dataset import (Array, Bitmap, BoolArray, Dataset, Group, category_dt,
+                      get_dtype)
 from .exception import DatasetExistsError, HeaderExistsError
 
 STEP_SIZE = 10000
@@ -43,6 +46,18 @@ class InterlaceDB:
         self._index = None
         self._blob_identifier = int8(1).tobytes()
 
+        # extents released during this session, reused by allocations
+        self._free_blocks = {}
+        self._free_sizes = {}
+        self._free_ends = {}
+
+        # number of memory-mapped views of the file that are still alive
+        self._n_views = 0
+
+        # shared dictionary of category fields, loaded on first use
+        self._categories = None
+        self._category_codes = None
+
         # open file
         self.flag = flag
         if flag == "n" and os.path.exists(filename):
@@ -148,6 +163,11 @@ class InterlaceDB:
         for datastructure in self.datastructures.values():
             datastructure._add_database_reference(self)
 
+    def _add_header_from_dtypes(self, dtypes):
+        if any(dt == category_dt for _, dt in dtypes):
+            self._header_fields["_categories"] = dtype("uint64")
+            self._header_fields["_n_categories"] = dtype("uint32")
+
     def _add_header_from_datastructures(self):
         for dstruct in self.datastructures.values():
             fields = dstruct._get_header_fields()
@@ -216,12 +236,8 @@ class InterlaceDB:
                 f"A dataset named '{name}' already exists")
 
         identifier = len(self.datasets) + 3
-        dtypes = []
-        for key, dt in kwargs.items():
-            if not isinstance(dt, str) or dt != "blob":
-                dtypes.append((key, dtype(dt)))
-            else:
-                dtypes.append((key, blob_dt))
+        dtypes = [(key, get_dtype(dt)) for key, dt in kwargs.items()]
+        self._add_header_from_dtypes(dtypes)
 
         dset = Dataset(identifier, self, name, dtypes)
         self.datasets[name] = dset
@@ -235,12 +251,8 @@ class InterlaceDB:
                 f"A dataset named '{name}' already exists")
 
         identifier = len(self.datasets) + 3
-        dtypes = []
-        for key, dt in kwargs.items():
-            if not isinstance(dt, str) or dt != "blob":
-                dtypes.append((key, dtype(dt)))
-            else:
-                dtypes.append((key, blob_dt))
+        dtypes = [(key, get_dtype(dt)) for key, dt in kwargs.items()]
+        self._add_header_from_dtypes(dtypes)
 
         dset = Group(identifier, dataset, name, dtypes)
         self.datasets[name] = dset
@@ -256,6 +268,10 @@ class InterlaceDB:
         identifier = len(self.datasets) + 3
         if dt == "bool":
             dset = BoolArray(identifier, self, name)
+        elif dt == "bit":
+            dset = BoolArray(identifier, self, name, packed=True)
+        elif dt == "bitmap":
+            dset = Bitmap(identifier, self, name)
         else:
             dset = Array(identifier, self, name, dt)
         self.datasets[name] = dset
@@ -294,12 +310,103 @@ class InterlaceDB:
     # =========================================================================
 
     def _allocate(self, bytes_size):
-        # returns start and end indices of allocated data
+        """
+        returns the start of a zeroed extent of `bytes_size` bytes, taken
+        from the released extents when one is large enough, and from the
+        write head otherwise. Extents are reused, so that a new extent may
+        start before extents allocated earlier: ids are not monotonic
+        """
+        start = self._take_free_extent(bytes_size)
+        if start is not None:
+            self._write_at(start, bytes(bytes_size))
+            return start
+
         self._extend_file(bytes_size)
         start = self.index
         self.index += bytes_size
         return start
 
+    def _take_free_extent(self, bytes_size):
+        # exact fit first, then the smallest larger extent, whose
+        # remainder is released again
+        starts = self._free_sizes.get(bytes_size)
+        if starts:
+            start = min(starts)
+            self._unregister_free_block(start)
+            return start
+        sizes = [size for size in self._free_sizes if size > bytes_size]
+        if not sizes:
+            return None
+        size = min(sizes)
+        start = min(self._free_sizes[size])
+        self._unregister_free_block(start)
+        self._release(start + bytes_size, size - bytes_size)
+        return start
+
+    def _release(self, start, bytes_size):
+        """
+        marks an extent as unused so that it can be handed out again by
+        _allocate or _extend_in_place. Adjacent free extents are merged,
+        and free space ending at the write head moves the head back, after
+        being zeroed, as space taken from the head is not zeroed again.
+        Released extents are only tracked in memory: after reopening the
+        file, their space is lost
+        """
+        if bytes_size <= 0:
+            return
+        start = int(start)
+        bytes_size = int(bytes_size)
+        # merge with the following free extent
+        next_size = self._free_blocks.get(start + bytes_size)
+        if next_size is not None:
+            self._unregister_free_block(start + bytes_size)
+            bytes_size += next_size
+        # merge with the preceding free extent
+        previous = self._free_ends.get(start)
+        if previous is not None:
+            bytes_size += self._unregister_free_block(previous)
+            start = previous
+        if start + bytes_size == self.index:
+            self._write_at(start, bytes(bytes_size))
+            self.index = start
+            return
+        self._free_blocks[start] = bytes_size
+        self._free_ends[start + bytes_size] = start
+        self._free_sizes.setdefault(bytes_size, set()).add(start)
+
+    def _unregister_free_block(self, start):
+        bytes_size = self._free_blocks.pop(start)
+        del self._free_ends[start + bytes_size]
+        starts = self._free_sizes[bytes_size]
+        starts.discard(start)
+        if not starts:
+            del self._free_sizes[bytes_size]
+        return bytes_size
+
+    def _extend_in_place(self, start, bytes_size, new_bytes_size):
+        """
+        grows the extent [start, start + bytes_size) to new_bytes_size
+        bytes without moving it, when it ends at the write head or right
+        before a released extent. Returns whether it succeeded
+        """
+        end = int(start + bytes_size)
+        extra = new_bytes_size - bytes_size
+        if end == self.index:
+            n_empty_slots = self._n_empty_slots
+            if n_empty_slots < extra:
+                self._extend_file(extra - n_empty_slots)
+            self.index += extra
+            return True
+
+        free_size = self._free_blocks.get(end)
+        if free_size is None or free_size < extra:
+            return False
+        self._unregister_free_block(end)
+        self._write_at(end, bytes(extra))
+        if free_size > extra:
+            self._release(end + extra, free_size - extra)
+        return True
+
     def _append(self, data_bytes):
         data_size = len(data_bytes)
         # if there's no place left in the file, truncate
@@ -312,7 +419,9 @@ class InterlaceDB:
         return index
 
     def append_blob(self, blob):
-        blob_bytes = self.encode(blob)
+        return self._append_blob_bytes(self.encode(blob))
+
+    def _append_blob_bytes(self, blob_bytes):
         blob_size = len(blob_bytes)
 
         data_bytes = b''.join((
@@ -328,6 +437,76 @@ class InterlaceDB:
         blob_bytes = self.f.read(size)
         return self.decode(blob_bytes)
 
+    def get_blobs(self, indices):
+        """
+        blobs at many indices, in the order of the indices. Sizes, then
+        contents, are read in file order with nearby reads merged
+        """
+        indices = [int(index) for index in indices]
+        sizes = [
+            int(frombuffer(data, dtype=uint32)[0])
+            for data in self._read_many([(index + 1, 4) for index in indices])]
+        data = self._read_many(
+            [(index + 5, size) for index, size in zip(indices, sizes)])
+        return [self.decode(blob_bytes) for blob_bytes in data]
+
+    # =========================================================================
+    # category dictionary
+    # =========================================================================
+
+    @staticmethod
+    def _get_category_capacity(size):
+        capacity = 64
+        while capacity < size:
+            capacity *= 2
+        return capacity
+
+    def _load_categories(self):
+        # the dictionary is an array of blob offsets indexed by code, code 0
+        # being reserved for the empty string
+        self._categories = [""]
+        self._category_codes = {"": 0}
+        n = int(self.header["_n_categories"])
+        if n == 0:
+            return
+        block_id = int(self.header["_categories"])
+        offsets = frombuffer(self._read_at(block_id + 8, 8 * n), dtype=uint64)
+        for code, offset in enumerate(offsets, 1):
+            value = self.get_blob(int(offset))
+            self._categories.append(value)
+            self._category_codes[value] = code
+
+    def _encode_category(self, value):
+        if self._categories is None:
+            self._load_categories()
+        code = self._category_codes.get(value)
+        if code is not None:
+            return code
+
+        code = len(self._categories)
+        offset = self.append_blob(value)
+        block_id = int(self.header["_categories"])
+        if block_id == 0 or code == self._get_category_capacity(code):
+            # full: move the dictionary to a block twice as large
+            capacity = self._get_category_capacity(code + 1)
+            new_block_id = self._allocate(8 * capacity)
+            if block_id != 0:
+                self._write_at(new_block_id,
+                               self._read_at(block_id, 8 * code))
+            block_id = new_block_id
+            self.header["_categories"] = block_id
+        self._write_at(block_id + 8 * code, uint64(offset).tobytes())
+        self.header["_n_categories"] = code
+
+        self._categories.append(value)
+        self._category_codes[value] = code
+        return code
+
+    def _decode_category(self, code):
+        if self._categories is None:
+            self._load_categories()
+        return self._categories[code]
+
     # =========================================================================
     # file IO management methods
     # =========================================================================
@@ -341,13 +520,69 @@ class InterlaceDB:
     def _write_at(self, index, data):
         self.f.seek(index)
         self.f.write(data)
-        if self.commit:
+        # live views only see the writes that reached the file, even
+        # within a transaction
+        if self.commit or self._n_views:
             self.f.flush()
 
     def _read_at(self, start, size):
+        if self._n_views:
+            # flushing drops read buffers that may predate writes made
+            # through memory-mapped views
+            self.f.flush()
         self.f.seek(start)
         return self.f.read(size)
 
+    def _read_many(self, requests, max_gap=4096):
+        """
+        reads a list of (start, size) regions in file order, merging
+        regions less than `max_gap` bytes apart into a single read, and
+        returns their bytes in the order of the requests
+        """
+        if len(requests) == 1:
+            start, size = requests[0]
+            return [self._read_at(int(start), int(size))]
+        order = sorted(range(len(requests)), key=lambda i: requests[i][0])
+        results = [None] * len(requests)
+        i = 0
+        while i < len(order):
+            span_start = int(requests[order[i]][0])
+            span_end = span_start + int(requests[order[i]][1])
+            j = i + 1
+            while j < len(order):
+                start, size = requests[order[j]]
+                if start - span_end > max_gap:
+                    break
+                span_end = max(span_end, int(start + size))
+                j += 1
+            data = self._read_at(span_start, span_end - span_start)
+            for k in order[i:j]:
+                start, size = requests[k]
+                offset = int(start) - span_start
+                results[k] = data[offset:offset + int(size)]
+            i = j
+        return results
+
+    def _view(self, start, dt, shape):
+        """
+        returns a numpy memmap of the file region starting at `start`.
+        Assignments to the view are written to the file directly. While a
+        view is alive, every write is flushed, transactions included, and
+        reads drop the file buffers, so that both sides stay consistent.
+        Slices of the view count as long as they are alive as well
+        """
+        self.f.flush()
+        mode = "r" if self.flag == "r" else "r+"
+        view = memmap(self.filename, dtype=dt, mode=mode,
+                      offset=int(start), shape=shape)
+        self._n_views += 1
+        # the mapping is shared by every array derived from the view
+        weakref.finalize(view._mmap, self._drop_view)
+        return view
+
+    def _drop_view(self):
+        self._n_views -= 1
+
     def close(self):
         self.f.close()
 
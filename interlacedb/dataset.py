@@ -1,11 +1,128 @@
-from numpy import array, dtype, frombuffer, int8, str_, uint32, uint64, int64, int32
+from collections.abc import Mapping
+
+from numpy import (array, dtype, frombuffer, int8, int32, int64, packbits, str_,
+                   uint8, uint32, uint64, unpackbits, zeros)
 
 blob_dt = dtype([("blob", uint32)])
+category_dt = dtype([("category", uint32)])
 PREFIX_DTYPE = int8
 integer = (int, uint64, int64, uint32, int32)
+# varlen size marking a value spilled to the blob heap
+VARLEN_SPILLED = 0xFFFFFFFF
+
+
+class BlobId(int):
+    """
+    offset of a blob already in the file: a blob field given one stores it
+    as is, instead of appending the value as a new blob
+    """
+
+
+def utf8_dt(size, overflow="raise"):
+    """
+    (int) size: maximum number of bytes of the UTF-8 encoded string
+    (str) overflow: "raise" to reject longer strings, "truncate" to cut
+    them at the last complete character
+    """
+    if overflow not in ("raise", "truncate"):
+        raise ValueError(f"unknown overflow policy '{overflow}'")
+    name = "utf8" if overflow == "raise" else "utf8_truncate"
+    return dtype([(name, f"S{int(size)}")])
+
+
+def varlen_dt(size):
+    """
+    (int) size: number of bytes of encoded value stored inline in the row.
+    Longer values are spilled to the blob heap
+    """
+    size = int(size)
+    if size < 8:
+        raise ValueError("varlen fields need at least 8 inline bytes")
+    return dtype([("varlen", uint32), ("inline", f"V{size}")])
+
+
+def get_dtype(dt):
+    """
+    converts a field declaration into its on-disk dtype. Besides numpy
+    dtypes, accepts "blob", "category", "utf8:<size>[:truncate]" and
+    "varlen:<size>"
+    """
+    if not isinstance(dt, str):
+        return dtype(dt)
+    if dt == "blob":
+        return blob_dt
+    if dt == "category":
+        return category_dt
+    if dt.startswith("utf8:"):
+        return utf8_dt(*dt.split(":")[1:])
+    if dt.startswith("varlen:"):
+        return varlen_dt(dt.split(":")[1])
+    return dtype(dt)
+
+
+class Record(Mapping):
+    """
+    read-only view over a row buffer. Fields are decoded to native Python
+    values on first access, blobs are only fetched when touched
+    """
+    __slots__ = ("_dataset", "_row", "_values")
+
+    def __init__(self, dataset, row):
+        self._dataset = dataset
+        self._row = row
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        dataset = self._dataset
+        value = self._row[key]
+        if key in dataset._blob_fields:
+            if value[0] == 0:
+                raise KeyError(key)
+            value = dataset._db_get_blob(value[0])
+        elif dataset._has_codec and key in dataset._field_codecs:
+            value = dataset._decode_value(key, value)
+            if value is None:
+                raise KeyError(key)
+        else:
+            value = value.item()
+        self._values[key] = value
+        return value
+
+    def _is_set(self, key):
+        # blobs and variable-length values are missing when their id or
+        # size is 0, which is known without fetching or decoding them
+        dataset = self._dataset
+        if key in dataset._blob_fields or key in dataset._varlen_fields:
+            return self._row[key][0] != 0
+        return True
+
+    def __contains__(self, key):
+        return key in self._dataset._field and self._is_set(key)
+
+    def __iter__(self):
+        for key in self._dataset._field:
+            if self._is_set(key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Record({dict(self)})"
 
 
 class Dataset:
+    # defaults for datasets pickled before encoded fields existed
+    _utf8_fields = {}
+    _category_fields = set()
+    _varlen_fields = {}
+    _field_codecs = set()
+    _has_codec = False
+
     def __init__(self, identifier, db, name, dtypes, offset=0):
         self.name = name
         self._identifier = identifier
@@ -30,6 +147,24 @@ class Dataset:
             del self._db_append_blob
         if hasattr(self, "_db_get_blob"):
             del self._db_get_blob
+        if hasattr(self, "_db_encode_category"):
+            del self._db_encode_category
+        if hasattr(self, "_db_decode_category"):
+            del self._db_decode_category
+        if hasattr(self, "_db_encode"):
+            del self._db_encode
+        if hasattr(self, "_db_decode"):
+            del self._db_decode
+        if hasattr(self, "_db_append_blob_bytes"):
+            del self._db_append_blob_bytes
+        if hasattr(self, "_db_release"):
+            del self._db_release
+        if hasattr(self, "_db_extend_in_place"):
+            del self._db_extend_in_place
+        if hasattr(self, "_db_view"):
+            del self._db_view
+        if hasattr(self, "_read_many"):
+            del self._read_many
 
     def _add_database_reference(self, db):
         self._read_at = db._read_at
@@ -38,10 +173,24 @@ class Dataset:
         self._db_allocate = db._allocate
         self._db_get_blob = db.get_blob
         self._db_append_blob = db.append_blob
+        self._db_encode_category = db._encode_category
+        self._db_decode_category = db._decode_category
+        self._db_encode = db.encode
+        self._db_decode = db.decode
+        self._db_append_blob_bytes = db._append_blob_bytes
+        self._db_release = db._release
+        self._db_extend_in_place = db._extend_in_place
+        self._db_view = db._view
+        self._read_many = db._read_many
 
     def _compile(self):
         self._blob_fields = set()
         self._string_fields = set()
+        # utf8 field -> (size, truncate)
+        self._utf8_fields = {}
+        self._category_fields = set()
+        # varlen field -> inline size
+        self._varlen_fields = {}
         self._field = {}
         self._field_list = ["prefix"]
 
@@ -49,20 +198,72 @@ class Dataset:
         for i, (key, dt) in enumerate(self._dtypes, 1):
             dt_size = dt.itemsize
             self._field[key] = (i, dt.itemsize, position, dt)
-            if dt != blob_dt:
-                if dt.type is str_:  # faster that way
-                    self._string_fields.add(key)
-            else:
+            if dt == blob_dt:
                 self._blob_fields.add(key)
+            elif dt == category_dt:
+                self._category_fields.add(key)
+            elif dt.names is not None and dt.names[0] == "varlen":
+                self._varlen_fields[key] = dt["inline"].itemsize
+            elif dt.names is not None and dt.names[0].startswith("utf8"):
+                self._utf8_fields[key] = (
+                    dt_size, dt.names[0] == "utf8_truncate")
+            elif dt.type is str_:  # faster that way
+                self._string_fields.add(key)
             position += dt_size
             self._field_list.append(key)
         self._len = position
         self._has_blob = len(self._blob_fields) != 0
+        self._field_codecs = (set(self._utf8_fields) |
+                              self._category_fields |
+                              set(self._varlen_fields))
+        self._has_codec = len(self._field_codecs) != 0
 
     # =========================================================================
     # encoding and decoding functions
     # =========================================================================
 
+    def _encode_value(self, key, value):
+        if key in self._utf8_fields:
+            size, truncate = self._utf8_fields[key]
+            value = value.encode("utf8")
+            if len(value) > size:
+                if not truncate:
+                    raise ValueError(
+                        f"'{key}' value is longer than {size} bytes")
+                value = value[:size].decode("utf8", "ignore").encode("utf8")
+            return value
+        elif key in self._category_fields:
+            return self._db_encode_category(value)
+        elif key in self._varlen_fields:
+            blob_bytes = self._db_encode(value)
+            if len(blob_bytes) <= self._varlen_fields[key]:
+                return len(blob_bytes), blob_bytes
+            blob_id = self._db_append_blob_bytes(blob_bytes)
+            return VARLEN_SPILLED, uint64(blob_id).tobytes()
+        return value
+
+    def _decode_value(self, key, value):
+        if key in self._utf8_fields:
+            return value[0].decode("utf8")
+        elif key in self._category_fields:
+            return self._db_decode_category(value[0])
+        elif key in self._varlen_fields:
+            size = value[0]
+            if size == 0:
+                return None
+            elif size == VARLEN_SPILLED:
+                blob_id = frombuffer(value[1].tobytes(), uint64, count=1)[0]
+                return self._db_get_blob(int(blob_id))
+            return self._db_decode(value[1].tobytes()[:size])
+        return value
+
+    def _get_default(self, key):
+        if key in self._utf8_fields:
+            return b""
+        elif key in self._varlen_fields:
+            return 0, b""
+        return 0
+
     def _to_numpy(self, data):
         for f in self._string_fields:
             if f not in data:
@@ -71,9 +272,15 @@ class Dataset:
             for f in self._blob_fields:
                 if f not in data:
                     data[f] = 0
-                else:
+                elif not isinstance(data[f], BlobId):
                     data[f] = self._db_append_blob(data[f])
-        res = tuple(data.get(key, 0) for key in self._field)
+        if self._has_codec:
+            res = tuple(
+                self._encode_value(key, data[key]) if key in data
+                else self._get_default(key)
+                for key in self._field)
+        else:
+            res = tuple(data.get(key, 0) for key in self._field)
         return array(res, dtype=self._dtypes)
 
     def _to_bytes(self, data):
@@ -83,12 +290,26 @@ class Dataset:
         arr = self._to_numpy(data)
         return self._prefix + arr.tobytes()
 
+    def _decode(self, res):
+        for field in self._utf8_fields:
+            res[field] = res[field][0].decode("utf8")
+        for field in self._category_fields:
+            res[field] = self._db_decode_category(res[field][0])
+        for field in self._varlen_fields:
+            value = self._decode_value(field, res[field])
+            if value is None:
+                del res[field]
+            else:
+                res[field] = value
+
     def _parse(self, res):
         res = frombuffer(res, dtype=self._dtypes)[0]
-        if not self._has_blob:
+        if not self._has_blob and not self._has_codec:
             return dict(zip(self._field, res))
 
         res = dict(zip(self._field, res))
+        if self._has_codec:
+            self._decode(res)
         for field in self._blob_fields:
             blob_id = res[field][0]
             if blob_id == 0:
@@ -97,40 +318,43 @@ class Dataset:
             res[field] = self._db_get_blob(blob_id)
         return res
 
-    def _parse_with_prefix(self, res):
+    def _parse_lazy(self, res):
+        return Record(self, frombuffer(res, dtype=self._dtypes)[0])
+
+    def _parse_with_prefix(self, res, mask=None):
         _dtypes = [("prefix", PREFIX_DTYPE)] + self._dtypes
         res = frombuffer(res, dtype=_dtypes)
+        if mask is None:
+            mask = res["prefix"] == self._identifier
 
         f = self._field_list
-        id_ = self._identifier
         data = []
-        for r in res:
-            tmp = {}
-            for i, field in enumerate(f):
-                if i != 0:
-                    tmp[field] = r[i]
-                else:
-                    if r[0] == id_:
-                        continue
-                    else:
-                        tmp = None
-                        break
+        for r, live in zip(res, mask):
+            if not live:
+                data.append(None)
+                continue
+            tmp = {field: r[i] for i, field in enumerate(f) if i != 0}
+            if self._has_codec:
+                self._decode(tmp)
             data.append(tmp)
         return data
-    
-    def _parse_values(self, res, key):
+
+    def _parse_values(self, res, key, mask=None):
         _dtypes = [("prefix", PREFIX_DTYPE)] + self._dtypes
         res = frombuffer(res, dtype=_dtypes)
+        if mask is None:
+            mask = res["prefix"] == self._identifier
 
         index, _, _, _ = self._field[key]
-        f = self._field_list
-        id_ = self._identifier
         data = []
-        for r in res:
-            if r[0] == id_:
-                data.append(r[index])
-            else:
+        decode = self._has_codec and key in self._field_codecs
+        for r, live in zip(res, mask):
+            if not live:
                 data.append(None)
+            elif decode:
+                data.append(self._decode_value(key, r[index]))
+            else:
+                data.append(r[index])
         return data
 
     # =========================================================================
@@ -171,40 +395,54 @@ class Dataset:
     def append(self, **data):
         return self._db_append(self._to_bytes(data))
 
-    def get(self, block_index, row_index=0):
+    def get(self, block_index, row_index=0, lazy=False):
         index = self._get_index_from(block_index, row_index)
-        data_bytes = self._read_at(index, 1)
+        data_bytes = self._read_at(index, self._len)
 
-        identifier = frombuffer(data_bytes, dtype="int8")[0]
+        identifier = frombuffer(data_bytes, dtype="int8", count=1)[0]
         if identifier != self._identifier:
             raise KeyError
-        data_bytes = self._read_at(index + self._prefix_size,
-                                   self._len - self._prefix_size)
-        return self._parse(data_bytes)
-
-    def get_slice(self, block_index, s):
+        if lazy:
+            return self._parse_lazy(data_bytes[self._prefix_size:])
+        return self._parse(data_bytes[self._prefix_size:])
+
+    def get_slice(self, block_index, s, mask=None):
+        """
+        (array) mask: optional liveness of the rows, e.g. from a Bitmap,
+        used instead of the row prefixes
+        """
         start = s.start or 0
         stop = s.stop
         length = stop - start
         index = self._get_index_from(block_index, start)
         data_bytes = self._read_at(index,
                                    self._len * length)
-        return self._parse_with_prefix(data_bytes)
+        return self._parse_with_prefix(data_bytes, mask)
     
-    def get_slice_values(self, block_index, s, field):
+    def get_slice_values(self, block_index, s, field, mask=None):
         start = s.start or 0
         stop = s.stop
         length = stop - start
         index = self._get_index_from(block_index, start)
         data_bytes = self._read_at(index,
                                    self._len * length)
-        return self._parse_values(data_bytes, field)
+        return self._parse_values(data_bytes, field, mask)
+
+    def view(self, block_index, size):
+        """
+        writable structured memmap over `size` rows of a block, prefix
+        included. A row is only live if its prefix is the dataset identifier
+        """
+        _dtypes = [("prefix", PREFIX_DTYPE)] + self._dtypes
+        return self._db_view(block_index, _dtypes, (size,))
 
     def get_value(self, block_index, row_index, key):
         _, dt_size, align, dt = self._field[key]
         index = self._get_index_from(block_index, row_index) + align
         data_bytes = self._read_at(index, dt_size)
         res = frombuffer(data_bytes, dtype=dt)[0]
+        if self._has_codec:
+            return self._decode_value(key, res)
         return res
 
     def set(self, block_index, row_index, data):
@@ -216,6 +454,8 @@ class Dataset:
         _, _, align, dt = self._field[key]
         index = self._get_index_from(block_index, row_index) + align
 
+        if self._has_codec:
+            value = self._encode_value(key, value)
         data = array(value, dtype=dt).tobytes()
         self._write_at(index, data)
 
@@ -341,10 +581,39 @@ class Group(Dataset):
         self._write_at(block_id, self._prefix)
         return block_id
 
+    def resize(self, block_id, new_size, size):
+        """
+        (int) new_size: number of dataset rows the block should hold
+        (int) size: number of dataset rows the block currently holds
+        returns the id of the resized block: the same one when it could be
+        resized in place, else the id of a copy (the old block is released)
+        """
+        bytes_size = self._len + self._dataset_len * size
+        new_bytes_size = self._len + self._dataset_len * new_size
+        if new_bytes_size <= bytes_size:
+            self._db_release(block_id + new_bytes_size,
+                             bytes_size - new_bytes_size)
+            return block_id
+        if self._db_extend_in_place(block_id, bytes_size, new_bytes_size):
+            return block_id
+
+        new_block_id = self._db_allocate(new_bytes_size)
+        self._write_at(new_block_id, self._read_at(block_id, bytes_size))
+        self._db_release(block_id, bytes_size)
+        return new_block_id
+
+    def view(self, block_index, size):
+        """
+        writable structured memmap over the `size` dataset rows of a block
+        """
+        return self._dataset.view(block_index + self._len, size)
+
     def set_value(self, block_index, key, value):
         _, _, align, dt = self._field[key]
         index = int(block_index + align)
 
+        if self._has_codec:
+            value = self._encode_value(key, value)
         data = array(value, dtype=dt).tobytes()
         self._write_at(index, data)
 
@@ -353,6 +622,8 @@ class Group(Dataset):
         index = int(block_index + align)
         data_bytes = self._read_at(index, dt_size)
         res = frombuffer(data_bytes, dtype=dt)[0]
+        if self._has_codec:
+            return self._decode_value(key, res)
         return res
 
     def set_data(self, block_index, row_index, data):
@@ -365,19 +636,21 @@ class Group(Dataset):
         _, _, align, dt = self._dataset_field[key]
         index = int(self._dataset_get_index_from(
             block_index, row_index) + align + self._len)
+        if self._dataset._has_codec:
+            value = self._dataset._encode_value(key, value)
         data = array(value, dtype=dt).tobytes()
         self._write_at(index, data)
 
-    def get_data(self, block_index, row_index):
+    def get_data(self, block_index, row_index, lazy=False):
         index = int(self._dataset_get_index_from(
             block_index, row_index) + self._len)
-        data_bytes = self._read_at(index, 1)
-        identifier = frombuffer(data_bytes, dtype="int8")[0]
+        data_bytes = self._read_at(index, self._dataset_len)
+        identifier = frombuffer(data_bytes, dtype="int8", count=1)[0]
         if identifier != self._dataset_identifier:
             raise KeyError
-        data_bytes = self._read_at(index + self._prefix_size,
-                                   self._dataset_len - self._prefix_size)
-        return self._dataset_parse(data_bytes)
+        if lazy:
+            return self._dataset._parse_lazy(data_bytes[self._prefix_size:])
+        return self._dataset_parse(data_bytes[self._prefix_size:])
 
     def get_data_value(self, block_index, row_index, key):
         _, dt_size, align, dt = self._dataset_field[key]
@@ -385,6 +658,8 @@ class Group(Dataset):
             block_index, row_index) + self._len + align)
         data_bytes = self._read_at(index, dt_size)
         res = frombuffer(data_bytes, dtype=dt)[0]
+        if self._dataset._has_codec:
+            return self._dataset._decode_value(key, res)
         return res
 
     def get(self, index):
@@ -456,6 +731,7 @@ class Array(Dataset):
         self._db_allocate = db._allocate
         self._write_at = db._write_at
         self._read_at = db._read_at
+        self._db_view = db._view
 
     def new_block(self, size):
         return self._db_allocate(self._dt_size * size + self._prefix_size)
@@ -478,6 +754,18 @@ class Array(Dataset):
         res = frombuffer(data_bytes, dtype=self._dtype)
         return res
 
+    def set_values(self, block_index, start, values):
+        index = int(block_index + self._dt_size * start + self._prefix_size)
+        data = array(values, dtype=self._dtype).tobytes()
+        self._write_at(index, data)
+
+    def view(self, block_index, size):
+        """
+        writable memmap over the `size` items of a block
+        """
+        return self._db_view(
+            block_index + self._prefix_size, self._dtype, (size,))
+
     def __getitem__(self, args):
         block_index, position = args
         if isinstance(position, int):
@@ -493,9 +781,17 @@ class Array(Dataset):
 
 
 class BoolArray(Dataset):
-    def __init__(self, identifier, db, name):
+    # default for arrays pickled before bit-packing existed
+    _packed = False
+
+    def __init__(self, identifier, db, name, packed=False):
+        """
+        (bool) packed: store 8 booleans per byte. The layout is part of
+        the array definition, blocks themselves are not marked
+        """
         self.name = name
         self._identifier = identifier
+        self._packed = packed
         self._byte_to_bool = {
             b'\x01': True,
             b'\x00': False
@@ -510,25 +806,119 @@ class BoolArray(Dataset):
 
         # db methods
         self._db_allocate = db._allocate
+        self._db_release = db._release
         self._write_at = db._write_at
         self._read_at = db._read_at
+        self._read_many = db._read_many
+        self._db_view = db._view
+
+    @staticmethod
+    def _get_packed_size(size):
+        return (size + 7) // 8
+
+    def get_block_size(self, size):
+        # number of bytes of a block of `size` booleans
+        if not self._packed:
+            return size + self._prefix_size
+        return self._get_packed_size(size) + self._prefix_size
 
     def new_block(self, size):
-        return self._db_allocate(size + self._prefix_size)
+        return self._db_allocate(self.get_block_size(size))
+
+    def pack(self, block_index, size):
+        """
+        copies a block of a byte-per-boolean array into a new block of this
+        packed array, releases the old one and returns the new block id
+        """
+        index = int(block_index + self._prefix_size)
+        values = frombuffer(self._read_at(index, size), dtype=uint8)
+        block_id = self.new_block(size)
+        self._write_at(block_id + self._prefix_size, packbits(
+            values != 0, bitorder="little").tobytes())
+        self._db_release(block_index, size + self._prefix_size)
+        return block_id
+
+    def view(self, block_index, size):
+        """
+        writable boolean memmap over the `size` items of a block. For packed
+        arrays, the view holds the raw uint8 bytes of the bits
+        """
+        if self._packed:
+            return self._db_view(block_index + self._prefix_size, uint8,
+                                 (self._get_packed_size(size),))
+        return self._db_view(block_index + self._prefix_size, bool, (size,))
 
     def set_value(self, block_index, index, value):
-        index = int(block_index + index + self._prefix_size)
-        self._write_at(index, self._bool_to_byte[value])
+        if not self._packed:
+            index = int(block_index + index + self._prefix_size)
+            self._write_at(index, self._bool_to_byte[value])
+            return
+        position = int(block_index + self._prefix_size + index // 8)
+        byte = self._read_at(position, 1)[0]
+        if value:
+            byte |= 1 << (index % 8)
+        else:
+            byte &= ~(1 << (index % 8))
+        self._write_at(position, bytes((byte & 0xFF,)))
 
     def get_value(self, block_index, index):
-        index = int(block_index + index + self._prefix_size)
-        data_bytes = self._read_at(index, 1)
-        return self._byte_to_bool[data_bytes]
+        if not self._packed:
+            index = int(block_index + index + self._prefix_size)
+            data_bytes = self._read_at(index, 1)
+            return self._byte_to_bool[data_bytes]
+        position = int(block_index + self._prefix_size + index // 8)
+        return bool(self._read_at(position, 1)[0] >> (index % 8) & 1)
+
+    def _get_packed_bits(self, block_index, start, end):
+        # returns the bits of the bytes covering [start, end) and the
+        # position of `start` among them
+        first = start // 8
+        last = self._get_packed_size(end)
+        position = int(block_index + self._prefix_size + first)
+        data_bytes = self._read_at(position, last - first)
+        bits = unpackbits(frombuffer(data_bytes, dtype=uint8),
+                          bitorder="little")
+        return bits, start - 8 * first
+
+    def _get_bits(self, block_index, start, end):
+        # values of [start, end) as a uint8 array of 0 and 1
+        if not self._packed:
+            index = int(block_index + start + self._prefix_size)
+            return frombuffer(self._read_at(index, end - start), dtype=uint8)
+        bits, offset = self._get_packed_bits(block_index, start, end)
+        return bits[offset:offset + end - start]
 
     def get_values(self, block_index, start, end):
-        index = int(block_index + start + self._prefix_size)
-        data_bytes = self._read_at(index, end-start)
-        return list(data_bytes)
+        return self._get_bits(block_index, start, end).tolist()
+
+    def set_values(self, block_index, start, values):
+        values = array(values, dtype=bool)
+        end = start + len(values)
+        if not self._packed:
+            index = int(block_index + start + self._prefix_size)
+            self._write_at(index, values.astype(uint8).tobytes())
+            return
+        bits, offset = self._get_packed_bits(block_index, start, end)
+        bits[offset:offset + len(values)] = values
+        position = int(block_index + self._prefix_size + start // 8)
+        self._write_at(position, packbits(bits, bitorder="little").tobytes())
+
+    def count(self, block_index, start, end):
+        """
+        number of true values in [start, end)
+        """
+        return int(self._get_bits(block_index, start, end).sum())
+
+    def get_bytes(self, block_index, start, size):
+        """
+        raw bytes [start, start + size) of a packed block
+        """
+        return self._read_at(int(block_index + self._prefix_size + start),
+                             size)
+
+    def set_bytes(self, block_index, start, data_bytes):
+        self._write_at(int(block_index + self._prefix_size + start),
+                       data_bytes)
 
     def __getitem__(self, args):
         block_index, position = args
@@ -542,3 +932,118 @@ class BoolArray(Dataset):
 
     def __setitem__(self, args, value):
         return self.set_value(*args, value)
+
+
+class Bitmap(Dataset):
+    """
+    occupancy and tombstone bits of the rows of a table block. The two bit
+    planes are interleaved byte by byte, so that the statuses of any range
+    of rows come back in a single read
+    """
+
+    def __init__(self, identifier, db, name):
+        self.name = name
+        self._identifier = identifier
+        self._prefix = PREFIX_DTYPE(identifier).tobytes()
+        self._prefix_size = len(self._prefix)
+        self._len = 1
+
+        # db methods
+        self._db_allocate = db._allocate
+        self._write_at = db._write_at
+        self._read_at = db._read_at
+        self._read_many = db._read_many
+
+    @staticmethod
+    def _get_size(size):
+        return 2 * ((size + 7) // 8)
+
+    def get_block_size(self, size):
+        return self._get_size(size) + self._prefix_size
+
+    def new_block(self, size):
+        return self._db_allocate(self.get_block_size(size))
+
+    def _get_request(self, block_index, start, end):
+        # (start, size) of the bytes holding the bits of rows [start, end)
+        first = start // 8
+        last = (end + 7) // 8
+        return (int(block_index + self._prefix_size + 2 * first),
+                2 * (last - first))
+
+    def _get_planes(self, block_index, start, end):
+        data_bytes = self._read_at(
+            *self._get_request(block_index, start, end))
+        return self._parse_planes(data_bytes, start, end)
+
+    def _parse_planes(self, data_bytes, start, end):
+        planes = frombuffer(data_bytes, dtype=uint8).reshape(-1, 2)
+        live = unpackbits(planes[:, 0], bitorder="little")
+        dead = unpackbits(planes[:, 1], bitorder="little")
+        offset = start % 8
+        return (live[offset:offset + end - start],
+                dead[offset:offset + end - start])
+
+    def get_statuses(self, block_index, start, end):
+        """
+        statuses of rows [start, end): 1 live, -1 deleted, 0 empty
+        """
+        live, dead = self._get_planes(block_index, start, end)
+        return live.astype(int8) - dead.astype(int8)
+
+    def get_statuses_many(self, block_index, ranges):
+        """
+        statuses of many [start, end) ranges of rows, read at once
+        """
+        data = self._read_many([self._get_request(block_index, start, end)
+                                for start, end in ranges])
+        statuses = []
+        for data_bytes, (start, end) in zip(data, ranges):
+            live, dead = self._parse_planes(data_bytes, start, end)
+            statuses.append(live.astype(int8) - dead.astype(int8))
+        return statuses
+
+    def get_mask(self, block_index, start, end):
+        live, _ = self._get_planes(block_index, start, end)
+        return live.astype(bool)
+
+    def get_status(self, block_index, index):
+        return self.get_statuses(block_index, index, index + 1)[0]
+
+    def set_status(self, block_index, index, status):
+        position = int(block_index + self._prefix_size + 2 * (index // 8))
+        live, dead = self._read_at(position, 2)
+        bit = 1 << (index % 8)
+        live &= ~bit
+        dead &= ~bit
+        if status == 1:
+            live |= bit
+        elif status == -1:
+            dead |= bit
+        self._write_at(position, bytes((live, dead)))
+
+    def set_mask(self, block_index, mask):
+        """
+        marks the rows of a whole block live or empty from a boolean mask,
+        clearing all tombstones
+        """
+        planes = zeros((self._get_size(len(mask)) // 2, 2), dtype=uint8)
+        planes[:, 0] = packbits(array(mask, dtype=bool), bitorder="little")
+        self._write_at(int(block_index + self._prefix_size), planes.tobytes())
+
+    def count(self, block_index, size):
+        live, _ = self._get_planes(block_index, 0, size)
+        return int(live.sum())
+
+    def __getitem__(self, args):
+        block_index, position = args
+        if isinstance(position, int):
+            return self.get_status(block_index, position)
+        elif isinstance(position, slice):
+            start = position.start or 0
+            end = position.stop
+            assert end is not None
+            return self.get_statuses(block_index, start, end)
+
+    def __setitem__(self, args, value):
+        return self.set_status(*args, value)
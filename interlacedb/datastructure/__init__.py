@@ -1 +1,5 @@
+from .btree import BTree
 from .hashtable import Dict, FracTable, LayerTable, MultiLayerTable
+from .linearhash import LinearHashTable
+from .robinhood import RobinHoodTable
+from .vector import Vector
@@ -0,0 +1,134 @@
+from math import ceil, log
+
+import mmh3
+
+
+class BlockedBloomFilter:
+    """
+    bloom filters stored in a packed BoolArray and split in 64-byte blocks:
+    the k bits of a key all fall in the same block, so that a lookup costs
+    a single read and an insertion a single read and write
+    """
+    block_size = 64
+    block_bits = 8 * block_size
+
+    def __init__(self, array, fp_rate, seed=12, resident=False, hasher=None):
+        """
+        (BoolArray) array: packed array holding the filters
+        (float) fp_rate: target false positive rate, used to size filters
+        (int) seed: seed of the bloom hash
+        (bool) resident: keep every filter in memory once read, writes
+        still go through to the file
+        (KeyHasher) hasher: hashes keys from their binary form, the string
+        form of the keys is hashed with mmh3 when missing
+        """
+        if not 0 < fp_rate < 1:
+            raise ValueError("fp_rate must be between 0 and 1")
+        self._array = array
+        self.seed = seed
+        self.resident = resident
+        self._hasher = hasher
+        self.bits_per_key = -log(fp_rate) / log(2)**2
+        self.n_hashes = max(1, int(round(self.bits_per_key * log(2))))
+        self._filters = {}
+
+    def get_n_blocks(self, capacity):
+        return max(1, ceil(capacity * self.bits_per_key / self.block_bits))
+
+    def get_size(self, capacity):
+        # number of bits of the filter of a table of `capacity` slots
+        return self.get_n_blocks(capacity) * self.block_bits
+
+    def new_filter(self, capacity):
+        filter_id = self._array.new_block(self.get_size(capacity))
+        if self.resident:
+            self._filters[filter_id] = bytearray(self.get_size(capacity) // 8)
+        return filter_id
+
+    def build(self, capacity, key_hashes):
+        """
+        allocates a filter holding the given keys, written in a single call
+        """
+        data = bytearray(self.get_size(capacity) // 8)
+        for key_hash in key_hashes:
+            block, mask = self._get_block_and_mask(key_hash, capacity)
+            start = block * self.block_size
+            value = int.from_bytes(data[start:start + self.block_size],
+                                   "little") | mask
+            data[start:start + self.block_size] = value.to_bytes(
+                self.block_size, "little")
+        filter_id = self._array.new_block(self.get_size(capacity))
+        self._array.set_bytes(filter_id, 0, bytes(data))
+        if self.resident:
+            self._filters[filter_id] = data
+        return filter_id
+
+    def hash(self, key):
+        if self._hasher is not None:
+            return self._hasher.hash_128(key, self.seed)
+        if not isinstance(key, str):
+            key = str(key)
+        return mmh3.hash64(key, seed=self.seed, signed=False)
+
+    def _get_block_and_mask(self, key_hash, capacity):
+        # the first half of the hash picks the block, the second half
+        # generates the k bits inside the block by double hashing
+        block_hash, bits_hash = key_hash
+        block = block_hash % self.get_n_blocks(capacity)
+        a, b = bits_hash & 0xFFFFFFFF, (bits_hash >> 32) | 1
+        mask = 0
+        for i in range(self.n_hashes):
+            mask |= 1 << ((a + i * b) % self.block_bits)
+        return block, mask
+
+    def _get_filter(self, filter_id, capacity):
+        data = self._filters.get(filter_id)
+        if data is None:
+            size = self.get_n_blocks(capacity) * self.block_size
+            data = bytearray(self._array.get_bytes(filter_id, 0, size))
+            self._filters[filter_id] = data
+        return data
+
+    def _read_block(self, filter_id, capacity, block):
+        start = block * self.block_size
+        if self.resident:
+            data = self._get_filter(filter_id, capacity)
+            data = data[start:start + self.block_size]
+        else:
+            data = self._array.get_bytes(filter_id, start, self.block_size)
+        return int.from_bytes(data, "little")
+
+    def add(self, filter_id, capacity, key_hash):
+        block, mask = self._get_block_and_mask(key_hash, capacity)
+        value = self._read_block(filter_id, capacity, block)
+        if value & mask == mask:
+            return
+        data = (value | mask).to_bytes(self.block_size, "little")
+        start = block * self.block_size
+        if self.resident:
+            self._filters[filter_id][start:start + self.block_size] = data
+        self._array.set_bytes(filter_id, start, data)
+
+    def contains(self, filter_id, capacity, key_hash):
+        block, mask = self._get_block_and_mask(key_hash, capacity)
+        return self._read_block(filter_id, capacity, block) & mask == mask
+
+    def contains_many(self, filter_id, capacity, key_hashes):
+        blocks_and_masks = [self._get_block_and_mask(key_hash, capacity)
+                            for key_hash in key_hashes]
+        if self.resident:
+            data = self._get_filter(filter_id, capacity)
+            blocks = [data[block * self.block_size:
+                           (block + 1) * self.block_size]
+                      for block, _ in blocks_and_masks]
+        else:
+            start = int(filter_id) + self._array._prefix_size
+            blocks = self._array._read_many(
+                [(start + block * self.block_size, self.block_size)
+                 for block, _ in blocks_and_masks])
+        return [int.from_bytes(data, "little") & mask == mask
+                for data, (_, mask) in zip(blocks, blocks_and_masks)]
+
+    def discard(self, filter_id):
+        # forget the in-memory copy of a filter whose block was released
+        self._filters.pop(filter_id, None)
@@ -0,0 +1,407 @@
+import numpy as np
+
+from ..dataset import PREFIX_DTYPE
+from .cache import LRU
+
+
+class BTree:
+    def __init__(self, dataset, key, order=64, cache_len=10000):
+        """
+        (Dataset) dataset: dataset holding the records stored in the leaves
+        (str) key: field used to order the records
+        (int) order: maximum number of rows per node
+        (int) cache_len: number of internal nodes kept in memory
+        """
+        if order < 4:
+            raise ValueError("order must be at least 4")
+        key_dt = dataset._field[key][3]
+        if key_dt.names is not None and key not in dataset._utf8_fields:
+            raise TypeError(
+                "blob, category and varlen fields can't be BTree keys")
+
+        self.dataset = dataset
+        self.key = key
+        self.order = order
+        self.cache_len = cache_len
+
+        self.dstruct_name = f"{dataset.name}_BT"
+        self._root_key = f"{self.dstruct_name}_root"
+        self._height_key = f"{self.dstruct_name}_height"
+        self._count_key = f"{self.dstruct_name}_count"
+        self._leaf_name = f"{self.dstruct_name}_leaf"
+        self._node_name = f"{self.dstruct_name}_node"
+        self._entry_name = f"{self.dstruct_name}_entry"
+
+    def _get_header_fields(self):
+        return {
+            f"{self._root_key}": "uint64",
+            f"{self._height_key}": "uint32",
+            f"{self._count_key}": "uint64",
+        }
+
+    def _remove_database_reference(self):
+        if hasattr(self, "_db"):
+            del self._db
+
+    def _add_database_reference(self, db):
+        self._db = db
+
+    def _initialize(self):
+        db = self._db
+        key_dt = self.dataset._field[self.key][3]
+        # utf8 keys are compared on their encoded bytes
+        self._key_subfield = key_dt.names[0] if key_dt.names else None
+        if self._key_subfield is not None:
+            key_dt = key_dt[0]
+
+        # leaves are groups of records chained through `_next`, internal
+        # nodes are groups of (key, child) entries
+        self._entry = db.create_dataset(
+            self._entry_name, key=key_dt, child="uint64")
+        self._entry._add_database_reference(db)
+        self._leaf = db.create_group(
+            self._leaf_name, self.dataset, _n="uint32", _next="uint64")
+        self._leaf._add_database_reference(db)
+        self._node = db.create_group(
+            self._node_name, self._entry, _n="uint32")
+        self._node._add_database_reference(db)
+
+        self._leaf_header_dt = self._header_dtype(self._leaf)
+        self._node_header_dt = self._header_dtype(self._node)
+        self._leaf_row_dt = self._row_dtype(self.dataset)
+        self._node_row_dt = self._row_dtype(self._entry)
+        self._leaf_size = len(self._leaf) + self.order * len(self.dataset)
+        self._node_size = len(self._node) + self.order * len(self._entry)
+
+        if self.cache_len > 0:
+            self.cache = LRU(self.cache_len)
+
+        self._root = db.header[self._root_key]
+        self._height = int(db.header[self._height_key])
+        if self._root == 0:
+            self._root = self._leaf.new_block(self.order)
+            self._write_leaf(self._root, self._empty_rows(), 0)
+            db.header[self._root_key] = self._root
+            db.header[self._height_key] = 0
+
+    @staticmethod
+    def _header_dtype(group):
+        return np.dtype([("prefix", PREFIX_DTYPE)] + group._dtypes)
+
+    @staticmethod
+    def _row_dtype(dataset):
+        return np.dtype([("prefix", PREFIX_DTYPE)] + dataset._dtypes)
+
+    def _empty_rows(self):
+        return np.zeros(0, dtype=self._leaf_row_dt)
+
+    def _keys(self, rows):
+        if self._key_subfield is None:
+            return rows[self.key]
+        return rows[self.key][self._key_subfield]
+
+    def _encode_key(self, key):
+        if self._key_subfield is None:
+            return key
+        return self.dataset._encode_value(self.key, key)
+
+    # =========================================================================
+    # node IO
+    # =========================================================================
+
+    def _read_leaf(self, block_id):
+        data = self._db._read_at(block_id, self._leaf_size)
+        header = np.frombuffer(data, dtype=self._leaf_header_dt, count=1)[0]
+        n = int(header["_n"])
+        rows = np.frombuffer(data, dtype=self._leaf_row_dt,
+                             count=n, offset=len(self._leaf))
+        return rows, int(header["_next"])
+
+    def _write_leaf(self, block_id, rows, next_leaf):
+        header = np.array((self._leaf._identifier, len(rows), next_leaf),
+                          dtype=self._leaf_header_dt)
+        padding = (self.order - len(rows)) * len(self.dataset)
+        self._db._write_at(block_id, b"".join((
+            header.tobytes(), rows.tobytes(), bytes(padding))))
+
+    def _read_node(self, block_id):
+        if self.cache_len > 0:
+            node = self.cache.get(block_id)
+            if node is not None:
+                return node
+
+        data = self._db._read_at(block_id, self._node_size)
+        header = np.frombuffer(data, dtype=self._node_header_dt, count=1)[0]
+        rows = np.frombuffer(data, dtype=self._node_row_dt,
+                             count=int(header["_n"]), offset=len(self._node))
+        node = (rows["key"].copy(), rows["child"].copy())
+        if self.cache_len > 0:
+            self.cache[block_id] = node
+        return node
+
+    def _write_node(self, block_id, keys, children):
+        n = len(keys)
+        rows = np.zeros(n, dtype=self._node_row_dt)
+        rows["prefix"] = self._entry._identifier
+        rows["key"] = keys
+        rows["child"] = children
+        header = np.array((self._node._identifier, n),
+                          dtype=self._node_header_dt)
+        padding = (self.order - n) * len(self._entry)
+        self._db._write_at(block_id, b"".join((
+            header.tobytes(), rows.tobytes(), bytes(padding))))
+        if self.cache_len > 0:
+            self.cache[block_id] = (np.array(keys), np.array(children))
+
+    def _set_root(self, root, height):
+        self._root = root
+        self._height = height
+        self._db.header[self._root_key] = root
+        self._db.header[self._height_key] = height
+
+    def _add_to_count(self, value):
+        count = self._db.header[self._count_key]
+        self._db.header[self._count_key] = int(count) + value
+
+    # =========================================================================
+    # search
+    # =========================================================================
+
+    @staticmethod
+    def _child_index(keys, key):
+        # the first entry of an internal node is a lower bound only
+        return int(np.searchsorted(keys[1:], key, side="right"))
+
+    def _find_leaf(self, key):
+        path = []
+        block_id = self._root
+        for _ in range(self._height):
+            keys, children = self._read_node(block_id)
+            if key is None:
+                index = 0
+            else:
+                index = self._child_index(keys, key)
+            path.append((block_id, index))
+            block_id = int(children[index])
+        return block_id, path
+
+    def lookup(self, key, lazy=False):
+        key = self._encode_key(key)
+        leaf_id, _ = self._find_leaf(key)
+        rows, _ = self._read_leaf(leaf_id)
+        keys = self._keys(rows)
+        i = int(np.searchsorted(keys, key))
+        if i == len(rows) or keys[i] != key:
+            raise KeyError(key)
+        if lazy:
+            return self.dataset._parse_lazy(rows[i:i+1].tobytes()[1:])
+        return self.dataset._parse(rows[i:i+1].tobytes()[1:])
+
+    def contains(self, key):
+        try:
+            self.lookup(key)
+            return True
+        except KeyError:
+            return False
+
+    # =========================================================================
+    # modifications
+    # =========================================================================
+
+    def insert(self, data):
+        key = self._encode_key(data[self.key])
+        row = np.frombuffer(self.dataset._to_bytes(data),
+                            dtype=self._leaf_row_dt)
+
+        leaf_id, path = self._find_leaf(key)
+        rows, next_leaf = self._read_leaf(leaf_id)
+        keys = self._keys(rows)
+        i = int(np.searchsorted(keys, key))
+        if i < len(rows) and keys[i] == key:
+            rows = rows.copy()
+            rows[i] = row[0]
+            self._write_leaf(leaf_id, rows, next_leaf)
+            return
+        rows = np.concatenate((rows[:i], row, rows[i:]))
+        self._add_to_count(1)
+
+        if len(rows) <= self.order:
+            self._write_leaf(leaf_id, rows, next_leaf)
+            return
+
+        # split the leaf in two halves
+        half = len(rows) // 2
+        right_id = self._leaf.new_block(self.order)
+        self._write_leaf(right_id, rows[half:], next_leaf)
+        self._write_leaf(leaf_id, rows[:half], right_id)
+        self._insert_in_parent(path, self._keys(rows)[half], right_id)
+
+    def _insert_in_parent(self, path, key, child):
+        if len(path) == 0:
+            # the root was split: grow the tree by one level
+            left = self._root
+            root = self._node.new_block(self.order)
+            keys = np.array([key, key], dtype=self._node_row_dt["key"])
+            self._write_node(root, keys, np.array([left, child]))
+            self._set_root(root, self._height + 1)
+            return
+
+        block_id, index = path.pop()
+        keys, children = self._read_node(block_id)
+        keys = np.insert(keys, index + 1, key)
+        children = np.insert(children, index + 1, child)
+        if len(keys) <= self.order:
+            self._write_node(block_id, keys, children)
+            return
+
+        half = len(keys) // 2
+        right_id = self._node.new_block(self.order)
+        self._write_node(right_id, keys[half:], children[half:])
+        self._write_node(block_id, keys[:half], children[:half])
+        self._insert_in_parent(path, keys[half], right_id)
+
+    def delete(self, key):
+        # leaves are not merged: empty leaves stay in the chain and are
+        # filled again by later insertions falling in their key range
+        key = self._encode_key(key)
+        leaf_id, _ = self._find_leaf(key)
+        rows, next_leaf = self._read_leaf(leaf_id)
+        keys = self._keys(rows)
+        i = int(np.searchsorted(keys, key))
+        if i == len(rows) or keys[i] != key:
+            raise KeyError(key)
+        rows = np.concatenate((rows[:i], rows[i+1:]))
+        self._write_leaf(leaf_id, rows, next_leaf)
+        self._add_to_count(-1)
+
+    def bulk_load(self, records, fill_factor=.9):
+        """
+        (iterable) records: dicts sorted by strictly increasing key
+        (float) fill_factor: proportion of each node filled by the load
+        """
+        if self._db.header[self._count_key] != 0:
+            raise ValueError("bulk_load requires an empty BTree")
+        if self._height > 0:
+            # emptied by deletions, the tree still has its nodes
+            self._release_tree()
+        size = max(2, int(self.order * fill_factor))
+
+        level = []
+        count = 0
+        leaf_id = self._root
+        chunk = []
+        last_key = None
+        for data in records:
+            key = self._encode_key(data[self.key])
+            if last_key is not None and not key > last_key:
+                raise ValueError("records must be sorted by increasing key")
+            last_key = key
+            if len(chunk) == size:
+                next_id = self._leaf.new_block(self.order)
+                level.append(self._write_chunk(leaf_id, chunk, next_id))
+                count += len(chunk)
+                leaf_id = next_id
+                chunk = []
+            chunk.append(self.dataset._to_bytes(data))
+        level.append(self._write_chunk(leaf_id, chunk, 0))
+        count += len(chunk)
+
+        # build internal levels bottom-up
+        height = 0
+        while len(level) > 1:
+            upper = []
+            for start in range(0, len(level), size):
+                entries = level[start:start + size]
+                keys = np.array([k for k, _ in entries],
+                                dtype=self._node_row_dt["key"])
+                children = np.array([c for _, c in entries])
+                block_id = self._node.new_block(self.order)
+                self._write_node(block_id, keys, children)
+                upper.append((keys[0], block_id))
+            level = upper
+            height += 1
+
+        self._set_root(level[0][1], height)
+        self._db.header[self._count_key] = count
+
+    def _release_tree(self):
+        # releases every node and leaf, and starts over from an empty leaf
+        level = [int(self._root)]
+        for _ in range(self._height):
+            children = []
+            for block_id in level:
+                children.extend(int(c) for c in self._read_node(block_id)[1])
+                self._db._release(block_id, self._node_size)
+                if self.cache_len > 0 and block_id in self.cache:
+                    del self.cache[block_id]
+            level = children
+        for leaf_id in level:
+            self._db._release(leaf_id, self._leaf_size)
+        root = self._leaf.new_block(self.order)
+        self._write_leaf(root, self._empty_rows(), 0)
+        self._set_root(root, 0)
+
+    def _write_chunk(self, leaf_id, chunk, next_leaf):
+        rows = np.frombuffer(b"".join(chunk), dtype=self._leaf_row_dt)
+        self._write_leaf(leaf_id, rows, next_leaf)
+        keys = self._keys(rows)
+        if len(rows) == 0:
+            return keys.dtype.type(), leaf_id
+        return keys[0], leaf_id
+
+    # =========================================================================
+    # ordered iteration
+    # =========================================================================
+
+    def range(self, start=None, stop=None):
+        """
+        yields the records whose key lies in [start, stop), in key order
+        """
+        parse = self.dataset._parse
+        if start is not None:
+            start = self._encode_key(start)
+        if stop is not None:
+            stop = self._encode_key(stop)
+        leaf_id, _ = self._find_leaf(start)
+        while leaf_id != 0:
+            rows, leaf_id = self._read_leaf(leaf_id)
+            keys = self._keys(rows)
+            i = 0 if start is None else int(np.searchsorted(keys, start))
+            if stop is None:
+                j = len(rows)
+            else:
+                j = int(np.searchsorted(keys, stop))
+            for row in rows[i:j]:
+                yield parse(row.tobytes()[1:])
+            if j < len(rows):
+                return
+
+    def prefix(self, prefix):
+        """
+        yields the records whose string key starts with `prefix`
+        """
+        for data in self.range(prefix):
+            if not str(data[self.key]).startswith(prefix):
+                return
+            yield data
+
+    def __iter__(self):
+        return self.range()
+
+    def __len__(self):
+        return int(self._db.header[self._count_key])
+
+    def __contains__(self, key):
+        return self.contains(key)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.range(key.start, key.stop)
+        return self.lookup(key)
+
+    def __setitem__(self, key, data):
+        data[self.key] = key
+        self.insert(data)
+
+    def __delitem__(self, key):
+        self.delete(key)
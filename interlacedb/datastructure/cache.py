@@ -0,0 +1,314 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from lru import LRU
+except ImportError:
+    class LRU(OrderedDict):
+        """
+        pure Python stand-in for the `lru` C extension, holding at most
+        `size` items and evicting the least recently used one
+        """
+
+        def __init__(self, size):
+            super().__init__()
+            self._size = size
+
+        def __getitem__(self, key):
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+        def __setitem__(self, key, value):
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            if len(self) > self._size:
+                self.popitem(last=False)
+
+        def get(self, key, default=None):
+            try:
+                return self[key]
+            except KeyError:
+                return default
+
+
+def get_record_size(value):
+    """
+    approximate memory footprint of a decoded value, in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return size
+    return size + sum(get_record_size(item) for item in items)
+
+
+def get_record_cache(max_bytes, policy="lru"):
+    """
+    (int) max_bytes: total size of the records kept in memory
+    (str) policy: eviction policy, "lru", "clock" or "tinylfu"
+    """
+    if policy == "lru":
+        return LRUCache(max_bytes)
+    if policy == "clock":
+        return ClockCache(max_bytes)
+    if policy == "tinylfu":
+        return TinyLFUCache(max_bytes)
+    raise ValueError(f"unknown cache policy '{policy}'")
+
+
+class RecordCache:
+    """
+    cache of decoded records bounded by their total size in bytes.
+    Subclasses decide which records to evict
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> [value, size]
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._touch(key, item)
+        return item[0]
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = get_record_size(value)
+        self.discard(key)
+        if size > self.max_bytes:
+            return
+        self._add(key, value, size)
+
+    def discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.n_bytes -= item[1]
+            self._on_discard(key, item[1])
+
+    def clear(self):
+        self._items.clear()
+        self.n_bytes = 0
+
+    def _touch(self, key, item):
+        pass
+
+    def _add(self, key, value, size):
+        self._items[key] = [value, size]
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        _, (_, size) = self._items.popitem(last=False)
+        self.n_bytes -= size
+
+    def _on_discard(self, key, size):
+        pass
+
+
+class LRUCache(RecordCache):
+    """
+    evicts the least recently used record
+    """
+
+    def _touch(self, key, item):
+        self._items.move_to_end(key)
+
+
+class ClockCache(RecordCache):
+    """
+    second chance (CLOCK) eviction: records are kept in insertion order
+    and a hit only sets a reference bit, so that reads never reorder the
+    cache. The record under the hand is evicted unless its bit is set, in
+    which case the bit is cleared and the hand moves on
+    """
+
+    def _add(self, key, value, size):
+        self._items[key] = [value, size, False]
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes:
+            self._evict()
+
+    def _touch(self, key, item):
+        item[2] = True
+
+    def _evict(self):
+        while True:
+            key, item = self._items.popitem(last=False)
+            if not item[2]:
+                self.n_bytes -= item[1]
+                return
+            item[2] = False
+            self._items[key] = item
+
+
+class FrequencySketch:
+    """
+    count-min sketch of 4-bit counters estimating how often keys were
+    requested. Counters are halved every `sample_size` increments, so that
+    the estimates follow changes of popularity
+    """
+    depth = 4
+    max_count = 15
+
+    def __init__(self, width):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.sample_size = 10 * self.width
+        self._counts = bytearray(self.depth * self.width)
+        self._n_increments = 0
+
+    def _get_indices(self, key):
+        key_hash = hash(key)
+        mask = self.width - 1
+        return [row * self.width + (hash((row, key_hash)) & mask)
+                for row in range(self.depth)]
+
+    def increment(self, key):
+        counts = self._counts
+        for index in self._get_indices(key):
+            if counts[index] < self.max_count:
+                counts[index] += 1
+        self._n_increments += 1
+        if self._n_increments >= self.sample_size:
+            self._n_increments = 0
+            counts[:] = (np.frombuffer(counts, dtype=np.uint8) >> 1).tobytes()
+
+    def estimate(self, key):
+        counts = self._counts
+        return min(counts[index] for index in self._get_indices(key))
+
+
+class TinyLFUCache(RecordCache):
+    """
+    W-TinyLFU eviction: new records enter a small LRU window, and records
+    leaving the window are only admitted into the main cache if they were
+    requested more often than the records they would evict. The main cache
+    is a segmented LRU, where records hit while on probation get promoted
+    to the protected segment
+    """
+    window_ratio = .01
+    protected_ratio = .8
+
+    def __init__(self, max_bytes, expected_size=1024):
+        """
+        (int) expected_size: typical size of a record, in bytes, used to
+        size the frequency sketch
+        """
+        super().__init__(max_bytes)
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._window_bytes = 0
+        self._protected_bytes = 0
+        self._max_window = max(1, int(max_bytes * self.window_ratio))
+        main_bytes = max_bytes - self._max_window
+        self._max_protected = int(main_bytes * self.protected_ratio)
+        self._sketch = FrequencySketch(max(1, max_bytes // expected_size))
+
+    def get(self, key, default=None):
+        self._sketch.increment(key)
+        return super().get(key, default)
+
+    def clear(self):
+        super().clear()
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self._window_bytes = 0
+        self._protected_bytes = 0
+
+    def _touch(self, key, item):
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+        else:
+            # promotion, demoting the least recently used protected records
+            # to probation if the protected segment is full
+            del self._probation[key]
+            self._protected[key] = None
+            self._protected_bytes += item[1]
+            while self._protected_bytes > self._max_protected:
+                demoted, _ = self._protected.popitem(last=False)
+                self._protected_bytes -= self._items[demoted][1]
+                self._probation[demoted] = None
+
+    def _add(self, key, value, size):
+        self._items[key] = [value, size]
+        self._window[key] = None
+        self._window_bytes += size
+        self.n_bytes += size
+        while self._window_bytes > self._max_window and len(self._window) > 1:
+            candidate, _ = self._window.popitem(last=False)
+            self._window_bytes -= self._items[candidate][1]
+            self._admit(candidate)
+        # a record larger than the window is left alone in it, and the
+        # main cache makes room for it
+        while self.n_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # least recently used record on probation, then protected
+        segment = self._probation or self._protected or self._window
+        self.discard(next(iter(segment)))
+
+    def _get_main_bytes(self):
+        return self.n_bytes - self._window_bytes
+
+    def _admit(self, candidate):
+        # the candidate left the window: it enters probation if it beats
+        # the records evicted to make room for it
+        max_main = self.max_bytes - self._max_window
+        frequency = self._sketch.estimate(candidate)
+        while self._get_main_bytes() > max_main:
+            segment = self._probation or self._protected
+            if not segment:
+                self._remove(candidate)
+                return
+            victim = next(iter(segment))
+            # saturated counters cannot rank the two records: the most
+            # recent one wins, or a saturated victim would never leave
+            victim_frequency = self._sketch.estimate(victim)
+            if frequency < victim_frequency or (
+                    frequency == victim_frequency < self._sketch.max_count):
+                self._remove(candidate)
+                return
+            del segment[victim]
+            if segment is self._protected:
+                self._protected_bytes -= self._items[victim][1]
+            self._remove(victim)
+        self._probation[candidate] = None
+
+    def _remove(self, key):
+        _, size = self._items.pop(key)
+        self.n_bytes -= size
+
+    def _on_discard(self, key, size):
+        if key in self._window:
+            del self._window[key]
+            self._window_bytes -= size
+        elif key in self._protected:
+            del self._protected[key]
+            self._protected_bytes -= size
+        else:
+            self._probation.pop(key, None)
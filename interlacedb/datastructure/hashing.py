@@ -0,0 +1,122 @@
+import struct
+
+import mmh3
+import numpy as np
+
+# struct formats of the fixed-width key types hashed from their binary form
+_STRUCT_FORMATS = {
+    ("b", 1): "?",
+    ("i", 1): "b", ("i", 2): "h", ("i", 4): "i", ("i", 8): "q",
+    ("u", 1): "B", ("u", 2): "H", ("u", 4): "I", ("u", 8): "Q",
+    ("f", 2): "e", ("f", 4): "f", ("f", 8): "d",
+}
+
+
+def _get_hash_functions(name):
+    # returns the 32/64-bit and 128-bit hash functions of bytes
+    if name == "mmh3":
+        def hash_bytes(data, seed):
+            return mmh3.hash(data, seed=seed, signed=False)
+
+        def hash_bytes_128(data, seed):
+            return tuple(mmh3.hash64(data, seed=seed, signed=False))
+    elif name == "xxh3":
+        from xxhash import xxh3_64_intdigest, xxh3_128_intdigest
+
+        def hash_bytes(data, seed):
+            return xxh3_64_intdigest(data, seed=seed)
+
+        def hash_bytes_128(data, seed):
+            value = xxh3_128_intdigest(data, seed=seed)
+            return value & 0xFFFFFFFFFFFFFFFF, value >> 64
+    else:
+        raise ValueError(f"unknown hash function '{name}'")
+    return hash_bytes, hash_bytes_128
+
+
+def _murmur3_32(words, seed):
+    # murmur3 x86_32 of keys made of whole 4-byte words, one key per row
+    c1, c2 = np.uint32(0xcc9e2d51), np.uint32(0x1b873593)
+    h = np.full(len(words), seed, dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        for j in range(words.shape[1]):
+            k = words[:, j] * c1
+            k = (k << np.uint32(15)) | (k >> np.uint32(17))
+            h ^= k * c2
+            h = (h << np.uint32(13)) | (h >> np.uint32(19))
+            h = h * np.uint32(5) + np.uint32(0xe6546b64)
+        h ^= np.uint32(4 * words.shape[1])
+        h ^= h >> np.uint32(16)
+        h *= np.uint32(0x85ebca6b)
+        h ^= h >> np.uint32(13)
+        h *= np.uint32(0xc2b2ae35)
+        h ^= h >> np.uint32(16)
+    return h
+
+
+class KeyHasher:
+    """
+    hashes keys from their binary form: numbers are packed to the width of
+    the key field, strings are UTF-8 encoded and bytes are used as is
+    """
+
+    def __init__(self, dt, name="mmh3", field="key"):
+        """
+        (dtype) dt: on-disk dtype of the key field
+        (str) name: hash function, "mmh3" or "xxh3" (requires xxhash)
+        (str) field: name of the key field, for error messages
+        """
+        self.name = name
+        self.field = field
+        self._hash_bytes, self._hash_bytes_128 = _get_hash_functions(name)
+        self._dt = None
+        self._pack = None
+        if dt.names is None and (dt.kind, dt.itemsize) in _STRUCT_FORMATS:
+            self._dt = dt.newbyteorder("<")
+            self._pack = struct.Struct(
+                "<" + _STRUCT_FORMATS[dt.kind, dt.itemsize]).pack
+
+    def _get_key_error(self, key):
+        return ValueError(
+            f"key {key!r} does not fit the '{self.field}' field ({self._dt})")
+
+    def to_bytes(self, key):
+        if self._pack is not None:
+            try:
+                return self._pack(key)
+            except struct.error:
+                raise self._get_key_error(key) from None
+        if isinstance(key, str):
+            return key.encode("utf8")
+        if isinstance(key, bytes):
+            return key
+        return str(key).encode("utf8")
+
+    def hash(self, key, seed=0):
+        return self._hash_bytes(self.to_bytes(key), seed)
+
+    def hash_128(self, key, seed=0):
+        return self._hash_bytes_128(self.to_bytes(key), seed)
+
+    def hash_many(self, keys, seed=0):
+        """
+        hashes of a sequence or numpy array of keys, as a list of ints.
+        Fixed-width keys are hashed with numpy when the function allows it
+        """
+        if self._dt is None:
+            return [self.hash(key, seed) for key in keys]
+        if isinstance(keys, np.ndarray) and keys.dtype == self._dt:
+            keys = np.ascontiguousarray(keys)
+        else:
+            # packed one by one: numpy would wrap out of range keys around
+            if isinstance(keys, np.ndarray):
+                keys = keys.tolist()
+            keys = np.frombuffer(b"".join(
+                self.to_bytes(key) for key in keys), dtype=self._dt)
+        size = self._dt.itemsize
+        if self.name == "mmh3" and size % 4 == 0:
+            words = keys.view("<u4").reshape(len(keys), size // 4)
+            return _murmur3_32(words, seed).tolist()
+        data = keys.tobytes()
+        return [self._hash_bytes(data[i:i + size], seed)
+                for i in range(0, len(data), size)]
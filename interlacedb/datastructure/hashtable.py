@@ -1,10 +1,20 @@
 import mmh3
 import numpy as np
 from interlacedb.database import InterlaceDB
+from interlacedb.dataset import PREFIX_DTYPE, BlobId
 from numpy.core.numeric import errstate
 
+from .bloom import BlockedBloomFilter
+from .cache import LRU, get_record_cache
+from .hashing import KeyHasher
+
 
 class HashTable:
+    # tables pickled before hash functions could be chosen hash the string
+    # form of their keys with mmh3
+    hash_function = None
+    _hasher = None
+
     def _get_header_fields(self):
         return {}
 
@@ -15,11 +25,116 @@ class HashTable:
     def _add_database_reference(self, db):
         self._db = db
 
+    def _get_hasher(self):
+        if self.hash_function is None:
+            return None
+        return KeyHasher(self.dataset._field[self.key][3], self.hash_function,
+                         self.key)
+
     def _hash(self, key, seed=0):
+        if self._hasher is not None:
+            return self._hasher.hash(key, seed)
         if not isinstance(key, str):
             key = str(key)
         return mmh3.hash(key, seed=seed, signed=False)
 
+    def _hash_many(self, keys, seed=0):
+        if self._hasher is not None:
+            return self._hasher.hash_many(keys, seed)
+        return [self._hash(key, seed) for key in keys]
+
+    # =========================================================================
+    # probe windows
+    # =========================================================================
+
+    def _get_statuses(self, rows):
+        prefix = rows["prefix"]
+        identifier = self.dataset._identifier
+        return ((prefix == identifier).astype(np.int8) -
+                (prefix == -identifier))
+
+    def _match_keys(self, rows, key):
+        values = rows[self.key]
+        if self.key in self.dataset._utf8_fields:
+            return values[values.dtype.names[0]] == key.encode("utf8")
+        if values.dtype.names is None:
+            return values == key
+        # blob, category and varlen keys are compared once decoded
+        decode = self.dataset._decode_value
+        if self.key not in self.dataset._field_codecs:
+            def decode(_, value): return value
+        return np.array([decode(self.key, value) == key for value in values],
+                        dtype=bool)
+
+    def _scan_window(self, rows, key):
+        # offset of `key` in a probe window, None if it is not there
+        statuses = self._get_statuses(rows)
+        empty = np.flatnonzero(statuses == 0)
+        end = empty[0] if len(empty) > 0 else len(rows)
+        live = np.flatnonzero(statuses[:end] == 1)
+        if len(live) == 0:
+            return None
+        matches = live[self._match_keys(rows[live], key)]
+        if len(matches) == 0:
+            return None
+        return int(matches[0])
+
+    def _scan_insert_window(self, rows, key):
+        # offset of the first free or deleted slot of a probe window, or of
+        # `key` if it comes first, None if the window is full
+        statuses = self._get_statuses(rows)
+        free = np.flatnonzero(statuses <= 0)
+        end = free[0] if len(free) > 0 else len(rows)
+        live = np.arange(end)
+        matches = live[self._match_keys(rows[:end], key)]
+        if len(matches) > 0:
+            return int(matches[0])
+        if len(free) > 0:
+            return int(free[0])
+        return None
+
+    def _get_row_keys(self, rows):
+        values = rows[self.key]
+        if self.key in self.dataset._field_codecs:
+            return [self.dataset._decode_value(self.key, value)
+                    for value in values]
+        return values.tolist()
+
+    def _get_window_requests(self, start, bucket, length, capacity):
+        # (start, size) of the rows of a probe window, in two parts when
+        # it wraps around the end of the table
+        row_len = len(self.dataset)
+        end = min(bucket + length, capacity)
+        requests = [(start + bucket * row_len, (end - bucket) * row_len)]
+        if end - bucket < length:
+            requests.append((start, (length - end + bucket) * row_len))
+        return requests
+
+    def _place_in_empty_table(self, key_hashes, capacity, length,
+                              partial=False):
+        # slots of the keys in an empty table, None if a key finds no free
+        # slot in its probe window, or -1 for that key if `partial`
+        occupied = bytearray(capacity)
+        positions = np.zeros(len(key_hashes), dtype=np.int64)
+        for i, key_hash in enumerate(key_hashes):
+            bucket = key_hash % capacity
+            for offset in range(length):
+                position = (bucket + offset) % capacity
+                if not occupied[position]:
+                    occupied[position] = 1
+                    positions[i] = position
+                    break
+            else:
+                if not partial:
+                    return None
+                positions[i] = -1
+        return positions
+
+    def _read_window(self, start, bucket, length, capacity):
+        data = self._db._read_many(self._get_window_requests(
+            start, bucket, length, capacity))
+        return np.frombuffer(b"".join(data), dtype=self._row_dt)
+
     def __contains__(self, key):
         return self.contains(key)
 
@@ -35,10 +150,44 @@ class HashTable:
 
 
 class LayerTable(HashTable):
+    # defaults for tables pickled before these options existed
+    bitmap = False
+    bloom_fp_rate = None
+    bloom_resident = False
+    max_layers = None
+    value_cache_size = 0
+    value_cache_policy = "lru"
+    count_entries = False
+    packed_bloom = False
+    # number of rows read at once when iterating
+    _iter_chunk = 4096
+    # set on the bloom positions block id of the header once the filters
+    # of a table created before packing existed were packed
+    _bloom_packed_flag = 1 << 63
+
     def __init__(
         self, dataset, key, growth_factor=2, p_init=10, probe_factor=.5,
-        n_bloom_filters=10, bloom_seed=12, cache_len=0
+        n_bloom_filters=10, bloom_seed=12, cache_len=0, bitmap=False,
+        bloom_fp_rate=None, bloom_resident=False, hash_function="mmh3",
+        max_layers=None, value_cache_size=0, value_cache_policy="lru"
     ):
+        """
+        (bool) bitmap: keep an occupancy/tombstone bitmap next to each
+        table, used for iteration instead of the row prefixes
+        (float) bloom_fp_rate: use blocked multi-hash bloom filters sized
+        for this false positive rate, instead of single-hash filters of
+        `n_bloom_filters` bits per slot. `n_bloom_filters=0` still disables
+        bloom filters
+        (bool) bloom_resident: keep the blocked bloom filters in memory
+        (str) hash_function: "mmh3" or "xxh3", applied to the binary form
+        of the keys
+        (int) max_layers: compact the table as soon as an insertion leaves
+        it with more layers than this
+        (int) value_cache_size: keep up to this many bytes of decoded
+        records in memory, served by `lookup` without reading the file
+        (str) value_cache_policy: eviction policy of the records, "lru",
+        "clock" or "tinylfu"
+        """
         self.key = key
         self.p_init = p_init
         self.probe_factor = probe_factor
@@ -55,21 +204,56 @@ class LayerTable(HashTable):
         self._block_id_key = f"{self.dstruct_name}_block_id"
         self._bloom_id_key = f"{self.dstruct_name}_bloom_id"
         self._bloom_filter_key = f"{self.dstruct_name}_bloom_filter"
+        self.bitmap = bitmap
+        self.bloom_fp_rate = bloom_fp_rate
+        self.bloom_resident = bloom_resident
+        self.hash_function = hash_function
+        self.max_layers = max_layers
+        self.value_cache_size = value_cache_size
+        self.value_cache_policy = value_cache_policy
+        self._bitmap_id_key = f"{self.dstruct_name}_bitmap_id"
+        self._bitmap_key = f"{self.dstruct_name}_bitmap"
+        # live and deleted entries are counted in the header
+        self.count_entries = True
+        # bloom filters store one bit per slot
+        self.packed_bloom = True
+        self._count_key = f"{self.dstruct_name}_count"
+        self._tombstones_key = f"{self.dstruct_name}_tombstones"
 
     def _get_header_fields(self):
-        return {
+        fields = {
             f"{self._block_id_key}": "uint64",
             f"{self._bloom_id_key}": "uint64",
         }
+        if self.bitmap:
+            fields[self._bitmap_id_key] = "uint64"
+        if self.count_entries:
+            fields[self._count_key] = "uint64"
+            fields[self._tombstones_key] = "uint64"
+        return fields
 
     def _initialize(self):
+        self._hasher = self._get_hasher()
         self._block_id = self._db.header[self._block_id_key]
         self._positions = self._db.create_array(self.tables_id_key, "uint64")
-        self._bloom = self._db.create_array(self._bloom_filter_key, "bool")
+        packed = self.packed_bloom or bool(
+            int(self._db.header[self._bloom_id_key]) & self._bloom_packed_flag)
+        self._bloom = self._db.create_array(
+            self._bloom_filter_key, "bit" if packed else "bool")
+        self._blocked_bloom = None
+        if self.bloom_fp_rate is not None:
+            self._blocked_bloom = BlockedBloomFilter(
+                self._bloom, self.bloom_fp_rate, self.bloom_seed,
+                self.bloom_resident, self._hasher)
+        if self.bitmap:
+            self._bitmap = self._db.create_array(self._bitmap_key, "bitmap")
 
         if self.cache_len > 0:
-            from lru import LRU
             self.cache = LRU(self.cache_len)
+        self._value_cache = None
+        if self.value_cache_size > 0:
+            self._value_cache = get_record_cache(
+                self.value_cache_size, self.value_cache_policy)
 
         if self._block_id == 0:
             # create array of hashtables positions
@@ -86,24 +270,40 @@ class LayerTable(HashTable):
                 # create array of bloom filters positions
                 self._bloom_id = self._positions.new_block(32)
                 self._db.header[self._bloom_id_key] = self._bloom_id
-                filter_id = self._bloom.new_block(
-                    capacity * self.n_bloom_filters)
+                filter_id = self._new_bloom_filter(capacity)
                 self._positions.set_value(self._bloom_id, 0, filter_id)
                 self._load_bloom_filters()
                 self.find_lookup_position = self.find_lookup_position_filtered
+
+            if self.bitmap:
+                self._bitmap_id = self._positions.new_block(32)
+                self._db.header[self._bitmap_id_key] = self._bitmap_id
+                bitmap_id = self._bitmap.new_block(capacity)
+                self._positions.set_value(self._bitmap_id, 0, bitmap_id)
+                self._load_bitmaps()
         else:
             self._load_tables_id()
             self.p_last = np.max(np.nonzero(self.tables_id)) + self.p_init
 
             if self.n_bloom_filters > 0:
-                self._bloom_id = self._db.header[self._bloom_id_key]
+                self._bloom_id = int(self._db.header[
+                    self._bloom_id_key]) & (self._bloom_packed_flag - 1)
                 self._load_bloom_filters()
                 self.find_lookup_position = self.find_lookup_position_filtered
 
+            if self.bitmap:
+                self._bitmap_id = self._db.header[self._bitmap_id_key]
+                self._load_bitmaps()
+
         self.get = self.dataset.get
         self.exists = self.dataset.exists
         self.status = self.dataset.status
         self.get_value = self.dataset.get_value
+        self._row_dt = np.dtype(
+            [("prefix", PREFIX_DTYPE)] + self.dataset._dtypes)
+        if self.count_entries:
+            self._count = int(self._db.header[self._count_key])
+            self._tombstones = int(self._db.header[self._tombstones_key])
 
     def _save_tables_id(self, index, table_id):
         self._positions.set_value(self._block_id, index, table_id)
@@ -111,11 +311,86 @@ class LayerTable(HashTable):
     def _load_tables_id(self):
         self.tables_id = list(
             self._positions.get_values(self._block_id, 0, 32))
+        # p of the allocated tables, from the newest. Compaction removes
+        # the lower layers, so that some p may be missing
+        self._layers = [int(index) + self.p_init for index in
+                        np.flatnonzero(self.tables_id)[::-1]]
 
     def _load_bloom_filters(self):
         self.bloom_filters = list(
             self._positions.get_values(self._bloom_id, 0, 32))
 
+    def pack_bloom_filters(self):
+        """
+        converts the byte-per-bit bloom filters of a table created before
+        packing existed into bit-packed ones, eight times smaller. The
+        header records the conversion, so that the table keeps reading
+        them packed once reopened
+        """
+        if self.n_bloom_filters == 0 or self._bloom._packed:
+            return
+        self._bloom._packed = True
+        for p in self._layers:
+            index = p - self.p_init
+            filter_id = self._bloom.pack(
+                self.bloom_filters[index],
+                self._get_capacity(p) * self.n_bloom_filters)
+            self._positions.set_value(self._bloom_id, index, filter_id)
+            self.bloom_filters[index] = filter_id
+        self._db.header[self._bloom_id_key] = (
+            self._bloom_id | self._bloom_packed_flag)
+
+    def _new_bloom_filter(self, capacity):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.new_filter(capacity)
+        return self._bloom.new_block(capacity * self.n_bloom_filters)
+
+    def _bloom_hash(self, key):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.hash(key)
+        return self._hash(key, self.bloom_seed)
+
+    def _in_bloom(self, p, bloom_hash):
+        bloom_p = self.bloom_filters[p - self.p_init]
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.contains(
+                bloom_p, self._get_capacity(p), bloom_hash)
+        bloom_capacity = self._get_capacity(p) * self.n_bloom_filters
+        return self._bloom.get_value(bloom_p, bloom_hash % bloom_capacity)
+
+    def _load_bitmaps(self):
+        self.bitmaps = list(
+            self._positions.get_values(self._bitmap_id, 0, 32))
+
+    def _set_status(self, p, position, status):
+        bitmap_id = self.bitmaps[p - self.p_init]
+        self._bitmap.set_status(bitmap_id, position, status)
+
+    def _read_window_statuses(self, p, buckets):
+        # statuses of the probe windows of `buckets`, from the bitmap, in
+        # a single read of a few bytes per window
+        capacity = self._get_capacity(p)
+        length = self._get_window_length(p)
+        ranges = []
+        for bucket in buckets:
+            end = min(bucket + length, capacity)
+            parts = [(bucket, end)]
+            if end - bucket < length:
+                parts.append((0, length - end + bucket))
+            ranges.append(parts)
+        statuses = iter(self._bitmap.get_statuses_many(
+            self.bitmaps[p - self.p_init],
+            [part for parts in ranges for part in parts]))
+        return [np.concatenate([next(statuses) for _ in parts])
+                for parts in ranges]
+
+    @staticmethod
+    def _has_live_before_empty(statuses):
+        # whether a probe window may hold a key
+        empty = np.flatnonzero(statuses == 0)
+        end = empty[0] if len(empty) > 0 else len(statuses)
+        return bool((statuses[:end] == 1).any())
+
     def _get_range(self, p,):
         return range(int(round(p * self.probe_factor * self.growth_factor)))
 
@@ -129,13 +404,18 @@ class LayerTable(HashTable):
         index = self.p_last - self.p_init
         self.tables_id[index] = table_id
         self._save_tables_id(index, table_id)
+        self._layers.insert(0, self.p_last)
 
         if self.n_bloom_filters > 0:
-            filter_id = self._bloom.new_block(
-                capacity * self.n_bloom_filters)
+            filter_id = self._new_bloom_filter(capacity)
             self._positions.set_value(self._bloom_id, index, filter_id)
             self.bloom_filters[index] = filter_id
 
+        if self.bitmap:
+            bitmap_id = self._bitmap.new_block(capacity)
+            self._positions.set_value(self._bitmap_id, index, bitmap_id)
+            self.bitmaps[index] = bitmap_id
+
     def find_insert_or_lookup_position(self, key, key_hash):
         try:
             p, position = self.find_lookup_position(key, key_hash)
@@ -158,19 +438,33 @@ class LayerTable(HashTable):
         key = data[self.key]
         key_hash = self._hash(key)
 
-        p, position, _ = self.find_insert_or_lookup_position(
-            key, key_hash)
-        table_id = self.tables_id[p - self.p_init]
+        try:
+            p, position = self.find_lookup_position(key, key_hash)
+            status = 1
+        except KeyError:
+            p, position, status = self._find_insert_slot(key, key_hash)
+        self._set_record(p, position, key, data, status)
+        self._compact_if_needed()
 
+    def _set_record(self, p, position, key, data, status=1):
+        # `status` is the status of the slot before the write
+        table_id = self.tables_id[p - self.p_init]
         self.dataset.set(table_id, position, data)
+        self._update_counts(status, 1)
+        if self.bitmap:
+            self._set_status(p, position, 1)
         if self.n_bloom_filters > 0:
             self._insert_in_bloom(p, key)
         if self.cache_len > 0:
             self.cache[key] = p, position
+        self._discard_record(key)
 
     def _insert_in_bloom(self, p, key):
-        key_hash = self._hash(key, self.bloom_seed)
+        key_hash = self._bloom_hash(key)
         bloom_p = self.bloom_filters[p - self.p_init]
+        if self._blocked_bloom is not None:
+            self._blocked_bloom.add(bloom_p, self._get_capacity(p), key_hash)
+            return
         bloom_capacity = self._get_capacity(p) * self.n_bloom_filters
         bucket = key_hash % bloom_capacity
         self._bloom.set_value(bloom_p, bucket, 1)
@@ -185,43 +479,66 @@ class LayerTable(HashTable):
             return False
 
     def find_insert_position(self, key, key_hash):
-        for p in range(self.p_last, self.p_init - 1, -1):
+        p, position, _ = self._find_insert_slot(key, key_hash)
+        return p, position
+
+    def _find_insert_slot(self, key, key_hash):
+        # (p, position, status) of the slot where `key` goes
+        for p in self._layers:
             try:
-                p, position = self.find_insert_position_in_table(
-                    key, key_hash, p)
-                return p, position
+                return self._find_insert_slot_in_table(key, key_hash, p)
             except KeyError:
                 continue
 
         self._create_new_hashtable()
-        p, position = self.find_insert_position_in_table(
-            key, key_hash, self.p_last)
-        return p, position
+        return self._find_insert_slot_in_table(key, key_hash, self.p_last)
+
+    def _read_table_window(self, p, bucket):
+        start = int(self.tables_id[p - self.p_init])
+        return self._read_window(start, bucket, self._get_window_length(p),
+                                 self._get_capacity(p))
 
     def find_insert_position_in_table(self, key, key_hash, p):
-        key_name = self.key
+        p, position, _ = self._find_insert_slot_in_table(key, key_hash, p)
+        return p, position
 
+    def _find_insert_slot_in_table(self, key, key_hash, p):
         capacity = self._get_capacity(p)
         bucket = key_hash % capacity
-        table_id = self.tables_id[p - self.p_init]
-        for i in self._get_range(p):
-            position = (bucket + i) % capacity
-            status = self.status(table_id, position)
-            if status == 1:
-                key_current = self.get_value(
-                    table_id, position, key_name)
-                if key_current != key:
-                    continue
-                return p, position
-            else:
-                return p, position
-        raise KeyError
-
-    def lookup(self, key):
+        if self.bitmap:
+            # the key is known to be missing: the first free slot of the
+            # window is found without reading any row
+            statuses = self._read_window_statuses(p, [bucket])[0]
+            free = np.flatnonzero(statuses <= 0)
+            if len(free) == 0:
+                raise KeyError
+            offset = int(free[0])
+            return p, (bucket + offset) % capacity, int(statuses[offset])
+        rows = self._read_table_window(p, bucket)
+        offset = self._scan_insert_window(rows, key)
+        if offset is None:
+            raise KeyError
+        status = int(self._get_statuses(rows[offset:offset + 1])[0])
+        return p, (bucket + offset) % capacity, status
+
+    def lookup(self, key, lazy=False):
+        if self._value_cache is not None and not lazy:
+            record = self._value_cache.get(key)
+            if record is not None:
+                return dict(record)
         key_hash = self._hash(key)
         p, position = self.find_lookup_position(key, key_hash)
         table_id = self.tables_id[p - self.p_init]
-        return self.get(table_id, position)
+        record = self.get(table_id, position, lazy=lazy)
+        if self._value_cache is not None and not lazy:
+            self._value_cache.set(key, record)
+            return dict(record)
+        return record
+
+    def _discard_record(self, key):
+        # forget the decoded record of a key whose row was written
+        if self._value_cache is not None:
+            self._value_cache.discard(key)
 
     def find_lookup_position_filtered(self, key, key_hash):
         if self.cache_len > 0:
@@ -229,12 +546,9 @@ class LayerTable(HashTable):
             if p is not None:
                 return p, position
 
-        bloom_hash = self._hash(key, self.bloom_seed)
-        for p in range(self.p_last, self.p_init - 1, -1):
-            bloom_p = self.bloom_filters[p - self.p_init]
-            bloom_capacity = self._get_capacity(p) * self.n_bloom_filters
-            bucket = bloom_hash % bloom_capacity
-            if self._bloom.get_value(bloom_p, bucket) == 0:
+        bloom_hash = self._bloom_hash(key)
+        for p in self._layers:
+            if not self._in_bloom(p, bloom_hash):
                 continue
             try:
                 p, position = self.find_lookup_position_in_table(
@@ -250,7 +564,7 @@ class LayerTable(HashTable):
             if p is not None:
                 return p, position
 
-        for p in range(self.p_last, self.p_init - 1, -1):
+        for p in self._layers:
             try:
                 p, position = self.find_lookup_position_in_table(
                     key, key_hash, p)
@@ -260,46 +574,627 @@ class LayerTable(HashTable):
         raise KeyError
 
     def find_lookup_position_in_table(self, key, key_hash, p):
-        key_name = self.key
-
         capacity = self._get_capacity(p)
         bucket = key_hash % capacity
-        table_id = self.tables_id[p - self.p_init]
-        for i in self._get_range(p):
-            position = (bucket + i) % capacity
-            status = self.status(table_id, position)
-            if status == 1:
-                key_current = self.get_value(table_id, position, key_name)
-                if key_current != key:
-                    continue
-                return p, position
-            elif status == -1:
-                continue
-            else:
-                raise KeyError
-        raise KeyError
+        if self.bitmap and not self._has_live_before_empty(
+                self._read_window_statuses(p, [bucket])[0]):
+            raise KeyError
+        offset = self._scan_window(self._read_table_window(p, bucket), key)
+        if offset is None:
+            raise KeyError
+        return p, (bucket + offset) % capacity
 
     def delete(self, key):
         key_hash = self._hash(key)
         p, position = self.find_lookup_position(key, key_hash)
         table_id = self.tables_id[p - self.p_init]
         self.dataset.delete(table_id, position)
+        self._update_counts(1, -1)
+        if self.bitmap:
+            self._set_status(p, position, -1)
         # remove from cache
         if self.cache_len > 0:
             if key in self.cache:
                 del self.cache[key]
+        self._discard_record(key)
+
+    # =========================================================================
+    # batched operations
+    # =========================================================================
+
+    def _get_window_length(self, p):
+        return min(len(self._get_range(p)), self._get_capacity(p))
+
+    def _read_windows(self, p, buckets):
+        capacity = self._get_capacity(p)
+        length = self._get_window_length(p)
+        start = int(self.tables_id[p - self.p_init])
+        requests = [
+            self._get_window_requests(start, bucket, length, capacity)
+            for bucket in buckets]
+        data = iter(self._db._read_many(
+            [request for parts in requests for request in parts]))
+        return [b"".join(next(data) for _ in parts) for parts in requests]
+
+    def _in_bloom_many(self, p, bloom_hashes):
+        bloom_p = self.bloom_filters[p - self.p_init]
+        capacity = self._get_capacity(p)
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.contains_many(
+                bloom_p, capacity, bloom_hashes)
+        bloom_capacity = capacity * self.n_bloom_filters
+        buckets = [bloom_hash % bloom_capacity for bloom_hash in bloom_hashes]
+        start = int(bloom_p) + self._bloom._prefix_size
+        if self._bloom._packed:
+            data = self._db._read_many(
+                [(start + bucket // 8, 1) for bucket in buckets])
+            return [bool(d[0] >> (bucket % 8) & 1)
+                    for d, bucket in zip(data, buckets)]
+        data = self._db._read_many([(start + bucket, 1) for bucket in buckets])
+        return [d != b"\x00" for d in data]
+
+    def _find_lookup_positions(self, keys, key_hashes):
+        """
+        (p, position) of every key, None for missing keys, and the bytes
+        of the rows read while probing, None for keys served by the cache
+        """
+        positions = [None] * len(keys)
+        rows = [None] * len(keys)
+        pending = []
+        for i, key in enumerate(keys):
+            if self.cache_len > 0:
+                positions[i] = self.cache.get(key)
+            if positions[i] is None:
+                pending.append(i)
+
+        if self.n_bloom_filters > 0:
+            bloom_hashes = {i: self._bloom_hash(keys[i]) for i in pending}
+        row_len = len(self.dataset)
+        for p in self._layers:
+            if not pending:
+                break
+            candidates = pending
+            if self.n_bloom_filters > 0:
+                in_bloom = self._in_bloom_many(
+                    p, [bloom_hashes[i] for i in pending])
+                candidates = [i for i, v in zip(pending, in_bloom) if v]
+
+            capacity = self._get_capacity(p)
+            buckets = [key_hashes[i] % capacity for i in candidates]
+            if self.bitmap and candidates:
+                # windows without live entries are not read
+                live = [self._has_live_before_empty(statuses) for statuses
+                        in self._read_window_statuses(p, buckets)]
+                candidates = [i for i, v in zip(candidates, live) if v]
+                buckets = [b for b, v in zip(buckets, live) if v]
+            windows = self._read_windows(p, buckets)
+            found = set()
+            for i, bucket, window in zip(candidates, buckets, windows):
+                offset = self._scan_window(
+                    np.frombuffer(window, dtype=self._row_dt), keys[i])
+                if offset is None:
+                    continue
+                positions[i] = p, (bucket + offset) % capacity
+                rows[i] = window[offset * row_len:(offset + 1) * row_len]
+                found.add(i)
+            if found:
+                pending = [i for i in pending if i not in found]
+        return positions, rows
+
+    def lookup_many(self, keys, lazy=False):
+        """
+        records of many keys, in the order of the keys. Missing keys get
+        None
+        """
+        keys = list(keys)
+        if self._value_cache is None or lazy:
+            return self._lookup_many(keys, lazy)
+
+        records = [self._value_cache.get(key) for key in keys]
+        missing = [i for i, record in enumerate(records) if record is None]
+        found = self._lookup_many([keys[i] for i in missing])
+        for i, record in zip(missing, found):
+            if record is not None:
+                self._value_cache.set(keys[i], record)
+            records[i] = record
+        return [None if record is None else dict(record)
+                for record in records]
+
+    def _lookup_many(self, keys, lazy=False):
+        key_hashes = self._hash_many(keys)
+        positions, rows = self._find_lookup_positions(keys, key_hashes)
+        # rows of keys found in the cache were not read while probing
+        rows = self._read_rows_of(positions, rows)
+
+        parse = self.dataset._parse_lazy if lazy else self.dataset._parse
+        prefix_size = self.dataset._prefix_size
+        return [None if row is None else parse(row[prefix_size:])
+                for row in rows]
+
+    def contains_many(self, keys):
+        keys = list(keys)
+        key_hashes = self._hash_many(keys)
+        positions, _ = self._find_lookup_positions(keys, key_hashes)
+        return np.array([position is not None for position in positions],
+                        dtype=bool)
+
+    def insert_many(self, records):
+        """
+        inserts many records; when a key appears several times, the last
+        record wins
+        """
+        last = {}
+        for data in records:
+            last[data[self.key]] = data
+        keys = list(last)
+        records = list(last.values())
+        key_hashes = self._hash_many(keys)
+        positions, _ = self._find_lookup_positions(keys, key_hashes)
+
+        new = []
+        for i, position in enumerate(positions):
+            if position is None:
+                new.append(i)
+            else:
+                self._set_record(*position, keys[i], records[i])
+        self._insert_missing([keys[i] for i in new],
+                             [key_hashes[i] for i in new],
+                             [records[i] for i in new])
+
+    def _insert_missing(self, keys, key_hashes, records):
+        # place keys known to be missing from the last table down, as
+        # find_insert_position does, keeping track of the slots claimed by
+        # the batch
+        new = list(range(len(keys)))
+        for p in list(self._layers):
+            if not new:
+                break
+            capacity = self._get_capacity(p)
+            buckets = [key_hashes[i] % capacity for i in new]
+            if self.bitmap:
+                windows = self._read_window_statuses(p, buckets)
+            else:
+                windows = [self._get_statuses(np.frombuffer(
+                    window, dtype=self._row_dt))
+                    for window in self._read_windows(p, buckets)]
+            claimed = set()
+            placed = set()
+            for i, bucket, statuses in zip(new, buckets, windows):
+                for offset in np.flatnonzero(statuses <= 0):
+                    position = (bucket + int(offset)) % capacity
+                    if position not in claimed:
+                        claimed.add(position)
+                        placed.add(i)
+                        self._set_record(p, position, keys[i], records[i],
+                                         int(statuses[offset]))
+                        break
+            new = [i for i in new if i not in placed]
+
+        # the remaining keys need a new table
+        for i in new:
+            self.insert(records[i])
+        self._compact_if_needed()
+
+    # =========================================================================
+    # in-place updates
+    # =========================================================================
+
+    def _read_row(self, p, position):
+        row_len = len(self.dataset)
+        return self._db._read_at(
+            int(self.tables_id[p - self.p_init]) + position * row_len, row_len)
+
+    def _find_upsert_position(self, key, key_hash):
+        """
+        (p, position, row, status) of `key`, reading each probe window
+        once. For a missing key, row is None and (p, position, status) is
+        the slot `insert` would use, p being None when every window is full
+        """
+        if self.cache_len > 0:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return (*cached, self._read_row(*cached), 1)
+
+        bloom_hash = None
+        if self.n_bloom_filters > 0:
+            bloom_hash = self._bloom_hash(key)
+        free = None, None, 0
+        for p in self._layers:
+            maybe = bloom_hash is None or self._in_bloom(p, bloom_hash)
+            if not maybe and free[0] is not None:
+                continue
+            capacity = self._get_capacity(p)
+            bucket = key_hash % capacity
+            rows = self._read_table_window(p, bucket)
+            if maybe:
+                offset = self._scan_window(rows, key)
+                if offset is not None:
+                    return (p, (bucket + offset) % capacity,
+                            rows[offset:offset + 1].tobytes(), 1)
+            if free[0] is None:
+                statuses = self._get_statuses(rows)
+                offsets = np.flatnonzero(statuses <= 0)
+                if len(offsets) > 0:
+                    offset = int(offsets[0])
+                    free = (p, (bucket + offset) % capacity,
+                            int(statuses[offset]))
+        p, position, status = free
+        return p, position, None, status
+
+    def _insert_new(self, p, position, status, key, key_hash, data):
+        if p is None:
+            self._create_new_hashtable()
+            p, position, status = self._find_insert_slot_in_table(
+                key, key_hash, self.p_last)
+        self._set_record(p, position, key, data, status)
+        self._compact_if_needed()
+
+    def _encode_fields(self, row, updates):
+        # row bytes with the given fields replaced
+        dataset = self.dataset
+        if self.key in updates and updates[self.key] != np.frombuffer(
+                row, dtype=self._row_dt)[0][self.key]:
+            raise ValueError("the key of a record cannot be updated")
+        row = bytearray(row)
+        for field, value in updates.items():
+            _, dt_size, align, dt = dataset._field[field]
+            if field in dataset._blob_fields:
+                if not isinstance(value, BlobId):
+                    value = dataset._db_append_blob(value)
+            elif dataset._has_codec:
+                value = dataset._encode_value(field, value)
+            row[align:align + dt_size] = np.array(value, dtype=dt).tobytes()
+        return bytes(row)
+
+    def _write_row_update(self, p, position, key, row, new_row):
+        # writes the bytes between the first and the last changed ones
+        changed = np.flatnonzero(np.frombuffer(row, dtype=np.uint8) !=
+                                 np.frombuffer(new_row, dtype=np.uint8))
+        if len(changed) > 0:
+            start, end = int(changed[0]), int(changed[-1]) + 1
+            row_len = len(self.dataset)
+            self._db._write_at(
+                int(self.tables_id[p - self.p_init]) +
+                position * row_len + start, new_row[start:end])
+        if self.cache_len > 0:
+            self.cache[key] = p, position
+        self._discard_record(key)
+
+    def upsert(self, key, defaults=None, update_fn=None):
+        """
+        inserts `defaults` under `key` if the key is missing, else updates
+        the record with the fields returned by `update_fn(record)`. Only
+        the bytes of the updated fields are written. Returns the record
+        """
+        key_hash = self._hash(key)
+        p, position, row, status = self._find_upsert_position(key, key_hash)
+        if row is None:
+            record = dict(defaults or {})
+            record[self.key] = key
+            self._insert_new(p, position, status, key, key_hash, dict(record))
+            return record
+
+        record = self.dataset._parse(row[self.dataset._prefix_size:])
+        if update_fn is None:
+            return record
+        updates = update_fn(record)
+        record.update(updates)
+        self._write_row_update(p, position, key, row,
+                               self._encode_fields(row, updates))
+        return record
+
+    def increment(self, key, field, delta=1):
+        """
+        adds `delta` to a numeric field of a record, inserting the record
+        with the field set to `delta` if the key is missing. Returns the
+        new value
+        """
+        key_hash = self._hash(key)
+        p, position, row, status = self._find_upsert_position(key, key_hash)
+        if row is None:
+            self._insert_new(p, position, status, key, key_hash,
+                             {self.key: key, field: delta})
+            return delta
+        value = np.frombuffer(row, dtype=self._row_dt)[0][field] + delta
+        self._write_row_update(p, position, key, row,
+                               self._encode_fields(row, {field: value}))
+        return value
+
+    def _read_rows_of(self, positions, rows):
+        # fills in the rows of keys whose position came from the cache
+        row_len = len(self.dataset)
+        cached = [i for i, (position, row) in enumerate(zip(positions, rows))
+                  if position is not None and row is None]
+        data = self._db._read_many(
+            [(int(self.tables_id[positions[i][0] - self.p_init]) +
+              positions[i][1] * row_len, row_len) for i in cached])
+        for i, row in zip(cached, data):
+            rows[i] = row
+        return rows
+
+    def upsert_many(self, keys, defaults=None, update_fn=None):
+        """
+        upserts many keys with batched probes. A key appearing several
+        times is inserted at most once, then updated for each further
+        occurrence
+        """
+        counts = {}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        keys = list(counts)
+        key_hashes = self._hash_many(keys)
+        positions, rows = self._find_lookup_positions(keys, key_hashes)
+        rows = self._read_rows_of(positions, rows)
+
+        new = []
+        new_records = []
+        for i, key in enumerate(keys):
+            n_updates = counts[key]
+            if positions[i] is None:
+                record = dict(defaults or {})
+                record[self.key] = key
+                n_updates -= 1
+            else:
+                record = self.dataset._parse(
+                    rows[i][self.dataset._prefix_size:])
+            updates = {}
+            if update_fn is not None:
+                for _ in range(n_updates):
+                    update = update_fn(dict(record))
+                    record.update(update)
+                    updates.update(update)
+
+            if positions[i] is None:
+                new.append(i)
+                new_records.append(record)
+            elif updates:
+                self._write_row_update(*positions[i], key, rows[i],
+                                       self._encode_fields(rows[i], updates))
+        self._insert_missing([keys[i] for i in new],
+                             [key_hashes[i] for i in new], new_records)
+
+    def increment_many(self, keys, field, deltas=1):
+        """
+        increments a numeric field for many keys with batched probes. The
+        deltas of a key appearing several times add up
+        """
+        if np.isscalar(deltas):
+            deltas = [deltas] * len(keys)
+        totals = {}
+        for key, delta in zip(keys, deltas):
+            totals[key] = totals.get(key, 0) + delta
+        keys = list(totals)
+        key_hashes = self._hash_many(keys)
+        positions, rows = self._find_lookup_positions(keys, key_hashes)
+        rows = self._read_rows_of(positions, rows)
+
+        new = []
+        for i, key in enumerate(keys):
+            if positions[i] is None:
+                new.append(i)
+                continue
+            value = np.frombuffer(
+                rows[i], dtype=self._row_dt)[0][field] + totals[key]
+            self._write_row_update(*positions[i], key, rows[i],
+                                   self._encode_fields(
+                                       rows[i], {field: value}))
+        self._insert_missing(
+            [keys[i] for i in new], [key_hashes[i] for i in new],
+            [{self.key: keys[i], field: totals[keys[i]]} for i in new])
+
+    # =========================================================================
+    # compaction
+    # =========================================================================
+
+    def _compact_if_needed(self):
+        if self.max_layers is not None and len(
+                self._layers) > self.max_layers:
+            self.compact()
+
+    def _iter_live_rows(self):
+        # live rows of every table, as arrays of up to _iter_chunk rows
+        row_len = len(self.dataset)
+        chunk = self._iter_chunk
+        for p in self._layers:
+            table_id = int(self.tables_id[p - self.p_init])
+            capacity = self._get_capacity(p)
+            for start in range(0, capacity, chunk):
+                end = min(start + chunk, capacity)
+                data = np.frombuffer(self._db._read_at(
+                    table_id + start * row_len, (end - start) * row_len),
+                    dtype=self._row_dt)
+                yield data[self._get_statuses(data) == 1]
+
+    def _read_live_rows(self):
+        return np.concatenate(
+            [np.zeros(0, dtype=self._row_dt)] + list(self._iter_live_rows()))
+
+    def _place_keys(self, p, key_hashes):
+        return self._place_in_empty_table(
+            key_hashes, self._get_capacity(p), self._get_window_length(p))
+
+    def _build_bloom_filter(self, p, keys):
+        capacity = self._get_capacity(p)
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.build(
+                capacity, [self._bloom_hash(key) for key in keys])
+        bloom_capacity = capacity * self.n_bloom_filters
+        bits = np.zeros(bloom_capacity, dtype=bool)
+        bloom_hashes = np.array(
+            self._hash_many(keys, self.bloom_seed), dtype=np.uint64)
+        bits[bloom_hashes % np.uint64(bloom_capacity)] = True
+        filter_id = self._bloom.new_block(bloom_capacity)
+        self._bloom.set_values(filter_id, 0, bits)
+        return filter_id
+
+    def _release_layer(self, p):
+        index = p - self.p_init
+        capacity = self._get_capacity(p)
+        self._db._release(self.tables_id[index],
+                          len(self.dataset) * capacity)
+        if self.n_bloom_filters > 0:
+            filter_id = self.bloom_filters[index]
+            if self._blocked_bloom is not None:
+                self._blocked_bloom.discard(filter_id)
+                size = self._blocked_bloom.get_size(capacity)
+            else:
+                size = capacity * self.n_bloom_filters
+            self._db._release(filter_id, self._bloom.get_block_size(size))
+        if self.bitmap:
+            self._db._release(self.bitmaps[index],
+                              self._bitmap.get_block_size(capacity))
+
+    def compact(self, load_factor=.5):
+        """
+        moves the live entries of every layer into a single new table,
+        sized so that it is at most `load_factor` full, drops tombstones
+        and releases the blocks of the old layers
+        """
+        rows = self._read_live_rows()
+        keys = self._get_row_keys(rows)
+        key_hashes = self._hash_many(keys)
+
+        p = self.p_init
+        while self._get_capacity(p) * load_factor < len(rows):
+            p += 1
+        while True:
+            if p - self.p_init >= len(self.tables_id):
+                raise ValueError("too many entries to compact the table")
+            positions = self._place_keys(p, key_hashes)
+            if positions is not None:
+                break
+            p += 1
+
+        # write the new layer
+        capacity = self._get_capacity(p)
+        table = np.zeros(capacity, dtype=self._row_dt)
+        table[positions] = rows
+        table_id = self.dataset.new_block(capacity)
+        self._db._write_at(table_id, table.tobytes())
+        if self.n_bloom_filters > 0:
+            filter_id = self._build_bloom_filter(p, keys)
+        if self.bitmap:
+            mask = np.zeros(capacity, dtype=bool)
+            mask[positions] = True
+            bitmap_id = self._bitmap.new_block(capacity)
+            self._bitmap.set_mask(bitmap_id, mask)
+
+        # switch to the new layer, the tables positions being written last
+        # in a single call
+        index = p - self.p_init
+        old_layers = self._layers
+        self._db.begin_transaction()
+        if self.n_bloom_filters > 0:
+            bloom_filters = [0] * len(self.bloom_filters)
+            bloom_filters[index] = filter_id
+            self._positions.set_values(self._bloom_id, 0, bloom_filters)
+        if self.bitmap:
+            bitmaps = [0] * len(self.bitmaps)
+            bitmaps[index] = bitmap_id
+            self._positions.set_values(self._bitmap_id, 0, bitmaps)
+        tables_id = [0] * len(self.tables_id)
+        tables_id[index] = table_id
+        self._positions.set_values(self._block_id, 0, tables_id)
+        self._db.end_transaction()
+
+        for old_p in old_layers:
+            self._release_layer(old_p)
+        self._load_tables_id()
+        if self.n_bloom_filters > 0:
+            self._load_bloom_filters()
+        if self.bitmap:
+            self._load_bitmaps()
+        self.p_last = p
+        if self.cache_len > 0:
+            self.cache.clear()
+        if self.count_entries:
+            self._count = len(rows)
+            self._tombstones = 0
+            self._db.header[self._count_key] = self._count
+            self._db.header[self._tombstones_key] = 0
+
+    # =========================================================================
+    # sizes
+    # =========================================================================
+
+    def _update_counts(self, old_status, new_status):
+        # a slot went from `old_status` to `new_status`
+        if not self.count_entries or old_status == new_status:
+            return
+        header = self._db.header
+        if old_status == 1 or new_status == 1:
+            self._count += 1 if new_status == 1 else -1
+            header[self._count_key] = self._count
+        if old_status == -1 or new_status == -1:
+            self._tombstones += 1 if new_status == -1 else -1
+            header[self._tombstones_key] = self._tombstones
+
+    def __len__(self):
+        if self.count_entries:
+            return self._count
+        # tables created before entries were counted
+        return sum(1 for _ in self)
+
+    @property
+    def n_tombstones(self):
+        if not self.count_entries:
+            return None
+        return self._tombstones
+
+    @property
+    def load_factor(self):
+        """
+        share of the slots of every layer that hold a live entry
+        """
+        capacity = sum(self._get_capacity(p) for p in self._layers)
+        return len(self) / capacity
 
     def __iter__(self):
-        for p in range(self.p_last - self.p_init + 1):
-            table_id = self.tables_id[p]
-            capacity = self._get_capacity(p + self.p_init)
-            for i in range(capacity):
-                if self.exists(table_id, i):
-                    yield self.get(table_id, i)
+        parse = self.dataset._parse
+        row_len = len(self.dataset)
+        prefix_size = self.dataset._prefix_size
+        row_dt = self._row_dt
+        chunk = self._iter_chunk
+        for p in reversed(self._layers):
+            index = p - self.p_init
+            table_id = self.tables_id[index]
+            capacity = self._get_capacity(p)
+            for start in range(0, capacity, chunk):
+                end = min(start + chunk, capacity)
+                if self.bitmap:
+                    mask = self._bitmap.get_mask(
+                        self.bitmaps[index], start, end)
+                    if not mask.any():
+                        continue
+                data = self._db._read_at(
+                    int(table_id + start * row_len), (end - start) * row_len)
+                if not self.bitmap:
+                    rows = np.frombuffer(data, dtype=row_dt)
+                    mask = rows["prefix"] == self.dataset._identifier
+                for i in np.flatnonzero(mask):
+                    yield parse(
+                        data[i * row_len + prefix_size:(i + 1) * row_len])
 
 
 class Dict:
-    def __init__(self, filename, size=1024, **kwargs):
+    # number of keydir updates kept in a dict before they are merged into
+    # the sorted arrays, as a share of the keydir size
+    _keydir_merge_ratio = .125
+    _keydir_chunk = 4096
+
+    def __init__(
+        self, filename, size=1024, cache_size=0, cache_policy="lru",
+        keydir=False, **kwargs
+    ):
+        """
+        (int) cache_size: keep up to this many bytes of values in memory
+        (str) cache_policy: eviction policy of the values, "lru", "clock"
+        or "tinylfu"
+        (bool) keydir: keep the blob index of every key in memory (16 bytes
+        per key), so that a lookup is a single blob read. The keydir is
+        rebuilt from the snapshot written by `save_keydir` when the Dict
+        was not written to since, and from a scan of the table otherwise
+        """
         from numpy import log2
         p_init = int(round(log2(size)))
 
@@ -312,12 +1207,24 @@ class Dict:
                     LayerTable(
                         dset, "key",
                         n_bloom_filters=20,
+                        bloom_fp_rate=.01,
                         p_init=p_init,
                         probe_factor=.3))
+                # generation counts the sessions that wrote to the Dict
+                db.create_header(keydir_id="uint64", keydir_len="uint64",
+                                 keydir_generation="uint64",
+                                 generation="uint64")
         else:
             db = InterlaceDB(filename, **kwargs)
             dstruct = db.datastructures["dstruct"]
         self.dstruct = dstruct
+        self._cache = None
+        if cache_size > 0:
+            self._cache = get_record_cache(cache_size, cache_policy)
+        self.keydir = keydir
+        self._written = False
+        if keydir:
+            self._load_keydir()
 
     def _hash(self, key):
         from cityhash import CityHash64
@@ -326,16 +1233,255 @@ class Dict:
             return res
         return 1
 
+    def _start_write(self):
+        # the first write after opening or saving the keydir moves to a new
+        # generation, so that its snapshot is known to be stale
+        if self._written or not self._has_keydir_header():
+            return
+        header = self.dstruct._db.header
+        header["generation"] = int(header["generation"]) + 1
+        self._written = True
+
     def insert(self, key, value):
+        self._start_write()
         key_hash = self._hash(key)
-        self.dstruct[key_hash] = {"value": (key, value)}
+        blob_id = self.dstruct._db.append_blob((key, value))
+        self.dstruct[key_hash] = {"value": BlobId(blob_id)}
+        if self.keydir:
+            self._set_keydir(key_hash, blob_id)
+        if self._cache is not None:
+            self._cache.discard(key)
 
     def get(self, key, res=None):
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached[0]
         key_hash = self._hash(key)
+        if self.keydir:
+            blob_id = self._get_keydir(key_hash)
+            if blob_id is None:
+                return res
+            value = self.dstruct._db.get_blob(blob_id)[1]
+        else:
+            try:
+                value = self.dstruct[key_hash]["value"][1]
+            except KeyError:
+                return res
+        if self._cache is not None:
+            self._cache.set(key, (value,))
+        return value
+
+    # =========================================================================
+    # batched operations
+    # =========================================================================
+
+    def update(self, items=(), **kwargs):
+        """
+        inserts many (key, value) pairs, given as a mapping or an iterable
+        of pairs, within a single transaction
+        """
+        if hasattr(items, "items"):
+            items = items.items()
+        pairs = list(items) + list(kwargs.items())
+        self._start_write()
+        db = self.dstruct._db
+        records = {}
+        db.begin_transaction()
         try:
-            return self.dstruct[key_hash]["value"][1]
-        except KeyError:
-            return res
+            for key, value in pairs:
+                key_hash = self._hash(key)
+                records[key_hash] = {
+                    "key": key_hash,
+                    "value": BlobId(db.append_blob((key, value)))}
+            self.dstruct.insert_many(records.values())
+        finally:
+            db.end_transaction()
+        if self.keydir:
+            for key_hash, record in records.items():
+                self._set_keydir(key_hash, record["value"])
+        if self._cache is not None:
+            for key, _ in pairs:
+                self._cache.discard(key)
+
+    def get_many(self, keys, res=None):
+        """
+        values of many keys, in the order of the keys, `res` for missing
+        keys. Table rows, then blobs, are read in file order
+        """
+        keys = list(keys)
+        values = [res] * len(keys)
+        pending = []
+        for i, key in enumerate(keys):
+            cached = None
+            if self._cache is not None:
+                cached = self._cache.get(key)
+            if cached is None:
+                pending.append(i)
+            else:
+                values[i] = cached[0]
+        if not pending:
+            return values
+
+        dstruct = self.dstruct
+        key_hashes = [self._hash(keys[i]) for i in pending]
+        if self.keydir:
+            blob_ids = [self._get_keydir(key_hash) for key_hash in key_hashes]
+            found = [(i, blob_id) for i, blob_id in zip(pending, blob_ids)
+                     if blob_id is not None]
+            blob_ids = [blob_id for _, blob_id in found]
+        else:
+            positions, rows = dstruct._find_lookup_positions(
+                key_hashes, dstruct._hash_many(key_hashes))
+            rows = dstruct._read_rows_of(positions, rows)
+            found = [(i, row) for i, row in zip(pending, rows)
+                     if row is not None]
+            if found:
+                blob_ids = np.frombuffer(
+                    b"".join(row for _, row in found),
+                    dtype=dstruct._row_dt)["value"]["blob"]
+        if not found:
+            return values
+
+        blobs = dstruct._db.get_blobs(blob_ids)
+        for (i, _), (_, value) in zip(found, blobs):
+            values[i] = value
+            if self._cache is not None:
+                self._cache.set(keys[i], (value,))
+        return values
+
+    def _iter_pairs(self):
+        db = self.dstruct._db
+        if self.keydir:
+            # blobs in file order
+            self._merge_keydir()
+            blob_ids = np.sort(self._keydir_blobs)
+            for start in range(0, len(blob_ids), self._keydir_chunk):
+                yield from db.get_blobs(
+                    blob_ids[start:start + self._keydir_chunk])
+            return
+        for rows in self.dstruct._iter_live_rows():
+            blob_ids = rows["value"]["blob"]
+            yield from db.get_blobs(blob_ids[blob_ids != 0])
+
+    def items(self):
+        """
+        streams the (key, value) pairs, one chunk of table rows at a time,
+        the blobs of a chunk being read in file order
+        """
+        for key, value in self._iter_pairs():
+            yield key, value
+
+    def keys(self):
+        for key, _ in self._iter_pairs():
+            yield key
+
+    def values(self):
+        for _, value in self._iter_pairs():
+            yield value
+
+    # =========================================================================
+    # keydir
+    # =========================================================================
+
+    def _has_keydir_header(self):
+        # files created before the keydir generations cannot hold its
+        # snapshot
+        return "keydir_generation" in self.dstruct._db.header._field
+
+    def _load_keydir(self):
+        db = self.dstruct._db
+        self._keydir_updates = {}
+        if self._has_keydir_header():
+            keydir_id = int(db.header["keydir_id"])
+            # the snapshot is stale if the Dict was written to since
+            if keydir_id != 0 and int(db.header["keydir_generation"]) == int(
+                    db.header["generation"]):
+                n = int(db.header["keydir_len"])
+                data = np.frombuffer(
+                    db._read_at(keydir_id, 16 * n), dtype=np.uint64)
+                self._keydir_hashes = data[:n].copy()
+                self._keydir_blobs = data[n:].copy()
+                return
+        self._build_keydir()
+
+    def _build_keydir(self):
+        hashes = [np.zeros(0, dtype=np.uint64)]
+        blobs = [np.zeros(0, dtype=np.uint64)]
+        for rows in self.dstruct._iter_live_rows():
+            hashes.append(rows["key"].astype(np.uint64))
+            blobs.append(rows["value"]["blob"].astype(np.uint64))
+        hashes = np.concatenate(hashes)
+        order = np.argsort(hashes)
+        self._keydir_hashes = hashes[order]
+        self._keydir_blobs = np.concatenate(blobs)[order]
+
+    def _get_keydir(self, key_hash):
+        blob_id = self._keydir_updates.get(key_hash)
+        if blob_id is not None:
+            return blob_id
+        hashes = self._keydir_hashes
+        key_hash = np.uint64(key_hash)
+        i = np.searchsorted(hashes, key_hash)
+        if i < len(hashes) and hashes[i] == key_hash:
+            return int(self._keydir_blobs[i])
+        return None
+
+    def _set_keydir(self, key_hash, blob_id):
+        self._keydir_updates[key_hash] = int(blob_id)
+        if len(self._keydir_updates) > max(
+                self._keydir_chunk,
+                len(self._keydir_hashes) * self._keydir_merge_ratio):
+            self._merge_keydir()
+
+    def _merge_keydir(self):
+        updates = self._keydir_updates
+        if not updates:
+            return
+        hashes = np.concatenate((
+            self._keydir_hashes,
+            np.fromiter(updates.keys(), dtype=np.uint64, count=len(updates))))
+        blobs = np.concatenate((
+            self._keydir_blobs,
+            np.fromiter(updates.values(), dtype=np.uint64,
+                        count=len(updates))))
+        # the stable sort puts updates after the entries they replace
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        last = np.append(hashes[1:] != hashes[:-1], True)
+        self._keydir_hashes = hashes[last]
+        self._keydir_blobs = blobs[order][last]
+        self._keydir_updates = {}
+
+    def save_keydir(self):
+        """
+        writes the keydir to the file, to be reloaded on the next opening
+        """
+        if not self.keydir or not self._has_keydir_header():
+            return
+        self._merge_keydir()
+        db = self.dstruct._db
+        header = db.header
+        old_id = int(header["keydir_id"])
+        old_len = int(header["keydir_len"])
+        n = len(self._keydir_hashes)
+        keydir_id = db._allocate(max(16 * n, 1))
+        db._write_at(keydir_id, self._keydir_hashes.tobytes() +
+                     self._keydir_blobs.tobytes())
+        header["keydir_id"] = keydir_id
+        header["keydir_len"] = n
+        if old_id != 0:
+            db._release(old_id, max(16 * old_len, 1))
+        header["keydir_generation"] = header["generation"]
+        self._written = False
+
+    def close(self):
+        self.save_keydir()
+        self.dstruct._db.close()
+
+    # =========================================================================
+    # overloading functions
+    # =========================================================================
 
     def __setitem__(self, key, value):
         self.insert(key, value)
@@ -348,21 +1494,39 @@ class Dict:
 
     def __contains__(self, key):
         key_hash = self._hash(key)
+        if self.keydir:
+            return self._get_keydir(key_hash) is not None
         return key_hash in self.dstruct
 
     def __iter__(self):
-        for data in self.dstruct:
-            yield data["value"]
+        yield from self._iter_pairs()
 
 
 class FracTable(HashTable):
+    """
+    tree of capsules: a capsule is an array of (hash, record id, next
+    capsule) slots, and a key whose slot holds another hash goes down to
+    the smaller capsule the slot points to. Records are appended to the
+    dataset
+    """
+    # default for tables pickled before capsules were cached
+    cache_depth = 2
+    # number of records read at once when iterating
+    _iter_chunk = 4096
+
     def __init__(
         self, dataset, key,
-        p_min=2, p_init=9
+        p_min=2, p_init=9, hash_function="mmh3", cache_depth=2
     ):
+        """
+        (int) cache_depth: capsules less deep than that are kept in memory
+        once read, writes still go through to the file
+        """
         self.key = key
+        self.hash_function = hash_function
         self.p_init = p_init
         self.p_min = p_min
+        self.cache_depth = cache_depth
 
         self.dataset = dataset
         self.dstruct_name = f"{dataset.name}_FT"
@@ -375,6 +1539,7 @@ class FracTable(HashTable):
         }
 
     def _initialize(self):
+        self._hasher = self._get_hasher()
         self._capsule_start = self._db.header[self._capsule_start_key]
         self._capsule = self._db.create_array(self._capsule_key, "uint64")
 
@@ -382,76 +1547,268 @@ class FracTable(HashTable):
             size_init = self._get_capacity(0)
             self._capsule_start = self._capsule.new_block(3 * size_init)
             self._db.header[self._capsule_start_key] = self._capsule_start
-        else:
-            pass
+        self._capsule_start = int(self._capsule_start)
+        # capsules of depth < cache_depth read so far
+        self._capsules = {}
 
         self.get = self.dataset.get
         self.exists = self.dataset.exists
         self.status = self.dataset.status
         self.get_value = self.dataset.get_value
 
-    def insert(self, data):
-        key = data[self.key]
-        key_hash = self._hash(key)
-        caps_pos, position, empty = self._find_position(key_hash, key)
-        self._insert_new(caps_pos, position, key_hash, data)
-
-    def lookup(self, key):
-        key_hash = self._hash(key)
-        caps_pos, position, empty = self._find_position(key_hash, key)
-        if empty:
-            raise KeyError
-        return self._lookup(caps_pos, position)
-
-    def _insert_new(self, caps_pos, position, key_hash, data):
-        data_id = self.dataset.append(**data)
-        self._capsule[caps_pos, position] = key_hash
-        self._capsule[caps_pos, position + 1] = data_id
-
-    def _lookup(self, caps_pos, position):
-        data_id = self._capsule[caps_pos, position + 1]
-        return self.dataset[data_id, 0]
-
-    def contains(self, key):
-        key_hash = self._hash(key)
-        _, _, empty = self._find_position(key_hash, key)
-        return not empty
-
     def _get_capacity(self, depth):
-        # if depth == 0:
-        #     capacity = self.size_init
-        # else:
-        #     capacity = self.growth_factor
         capacity = max(2**self.p_min,
                        2**(self.p_init - depth))
         return capacity - 1
 
-    def _find_position(self, key_hash, key):
+    def _hash(self, key, seed=0):
+        # a hash of 0 marks an empty slot
+        return super()._hash(key, seed) or 1
+
+    def _hash_many(self, keys, seed=0):
+        return [key_hash or 1 for key_hash in super()._hash_many(keys, seed)]
+
+    # =========================================================================
+    # capsules
+    # =========================================================================
+
+    def _get_slot_offset(self, caps_pos, position):
+        # file offset of the `position`-th value of a capsule
+        return int(caps_pos) + self._capsule._prefix_size + 8 * int(position)
+
+    def _get_capsule(self, caps_pos, depth):
+        # values of a capsule kept in memory, None for deep capsules
+        if depth >= self.cache_depth:
+            return None
+        capsule = self._capsules.get(caps_pos)
+        if capsule is None:
+            capsule = self._capsule.get_values(
+                caps_pos, 0, 3 * self._get_capacity(depth)).copy()
+            self._capsules[caps_pos] = capsule
+        return capsule
+
+    def _read_slots(self, depth, slots):
+        """
+        (hash, record id, next capsule) of many (caps_pos, position) slots
+        of capsules of the same depth, in a single read unless cached
+        """
+        if depth < self.cache_depth:
+            values = [self._get_capsule(caps_pos, depth)[
+                position:position + 3] for caps_pos, position in slots]
+        else:
+            values = [np.frombuffer(data, dtype=np.uint64)
+                      for data in self._db._read_many(
+                          [(self._get_slot_offset(caps_pos, position), 24)
+                           for caps_pos, position in slots])]
+        return [(int(v[0]), int(v[1]), int(v[2])) for v in values]
+
+    def _write_slot(self, caps_pos, position, values):
+        # writes consecutive values of a slot, from its hash on
+        values = np.array(values, dtype=np.uint64)
+        self._capsule.set_values(caps_pos, position, values)
+        capsule = self._capsules.get(caps_pos)
+        if capsule is not None:
+            capsule[position:position + len(values)] = values
+
+    def _new_capsule(self, caps_pos, depth, position):
+        # allocates the child capsule of a slot
+        next_pos = self._capsule.new_block(3 * self._get_capacity(depth + 1))
+        self._capsule.set_value(caps_pos, position + 2, next_pos)
+        capsule = self._capsules.get(caps_pos)
+        if capsule is not None:
+            capsule[position + 2] = next_pos
+        return int(next_pos)
+
+    def _find_positions(self, key_hashes):
+        """
+        record id of every hash, None when missing, and its slot as a
+        (caps_pos, depth, position) tuple: the slot of the hash, or else
+        the first free slot on its path, None if there is none. Each depth
+        of the tree costs a single read
+        """
+        data_ids = [None] * len(key_hashes)
+        slots = [None] * len(key_hashes)
+        pending = [(i, self._capsule_start) for i in range(len(key_hashes))]
         depth = 0
-        caps_pos = self._capsule_start
-        while True:
+        while pending:
             capacity = self._get_capacity(depth)
+            positions = [3 * (key_hashes[i] % capacity) for i, _ in pending]
+            values = self._read_slots(
+                depth, [(caps_pos, position) for (_, caps_pos), position
+                        in zip(pending, positions)])
+            next_pending = []
+            for (i, caps_pos), position, (current_hash, data_id, next_pos) \
+                    in zip(pending, positions, values):
+                if current_hash == key_hashes[i]:
+                    data_ids[i] = data_id
+                    slots[i] = caps_pos, depth, position
+                    continue
+                # deleted slots are free but keep their next capsule
+                if current_hash == 0 and slots[i] is None:
+                    slots[i] = caps_pos, depth, position
+                if next_pos != 0:
+                    next_pending.append((i, next_pos))
+            pending = next_pending
+            depth += 1
+        return data_ids, slots
+
+    # =========================================================================
+    # lookup
+    # =========================================================================
+
+    def lookup(self, key, lazy=False):
+        data_ids, _ = self._find_positions([self._hash(key)])
+        if data_ids[0] is None:
+            raise KeyError
+        return self.dataset.get(data_ids[0], 0, lazy)
 
-            # 3 because: hash, item_position, next_capsule
-            position = 3 * (key_hash % capacity)
+    def contains(self, key):
+        data_ids, _ = self._find_positions([self._hash(key)])
+        return data_ids[0] is not None
+
+    def _read_records(self, data_ids, lazy=False):
+        parse = self.dataset._parse_lazy if lazy else self.dataset._parse
+        prefix_size = self.dataset._prefix_size
+        rows = self._db._read_many(
+            [(data_id, len(self.dataset)) for data_id in data_ids])
+        return [parse(row[prefix_size:]) for row in rows]
+
+    def lookup_many(self, keys, lazy=False):
+        """
+        records of many keys, in the order of the keys. Missing keys get
+        None
+        """
+        keys = list(keys)
+        data_ids, _ = self._find_positions(self._hash_many(keys))
+        found = [i for i, data_id in enumerate(data_ids)
+                 if data_id is not None]
+        records = [None] * len(keys)
+        for i, record in zip(found, self._read_records(
+                [data_ids[i] for i in found], lazy)):
+            records[i] = record
+        return records
+
+    # =========================================================================
+    # insertion and deletion
+    # =========================================================================
 
-            current_hash = self._capsule[caps_pos, position]
-            if current_hash == 0:  # capsule free
-                return caps_pos, position, True
-            elif current_hash == key_hash:
-                return caps_pos, position, False
+    def insert(self, data):
+        key_hash = self._hash(data[self.key])
+        data_ids, slots = self._find_positions([key_hash])
+        self._insert_at(key_hash, data_ids[0], slots[0], data)
+
+    def _insert_at(self, key_hash, data_id, slot, data):
+        if data_id is not None:
+            # records have a fixed size and are overwritten in place
+            self.dataset.set(data_id, 0, data)
+            return
+        if slot is None:
+            # the path of the key is full: grow it by a capsule
+            caps_pos, depth, position = self._get_last_slot(key_hash)
+            next_pos = self._new_capsule(caps_pos, depth, position)
+            slot = (next_pos, depth + 1,
+                    3 * (key_hash % self._get_capacity(depth + 1)))
+        caps_pos, _, position = slot
+        self._write_slot(caps_pos, position,
+                         [key_hash, self.dataset.append(**data)])
+
+    def _get_last_slot(self, key_hash):
+        # slot of the path of `key_hash` that has no next capsule
+        depth = 0
+        caps_pos = self._capsule_start
+        while True:
+            position = 3 * (key_hash % self._get_capacity(depth))
+            _, _, next_pos = self._read_slots(
+                depth, [(caps_pos, position)])[0]
+            if next_pos == 0:
+                return caps_pos, depth, position
+            caps_pos = next_pos
+            depth += 1
+
+    def insert_many(self, records):
+        """
+        inserts many records; when a key appears several times, the last
+        record wins. New records are appended in a single write
+        """
+        last = {}
+        for data in records:
+            last[data[self.key]] = data
+        records = list(last.values())
+        key_hashes = self._hash_many(list(last))
+        data_ids, slots = self._find_positions(key_hashes)
+
+        new = []
+        claimed = set()
+        later = []
+        for i, (data_id, slot) in enumerate(zip(data_ids, slots)):
+            if data_id is not None:
+                self.dataset.set(data_id, 0, records[i])
+            elif slot is None or slot in claimed:
+                later.append(i)
             else:
-                next_capsule_pos = self._capsule[caps_pos, position + 2]
-                if next_capsule_pos == 0:
-                    next_capacity = self._get_capacity(depth + 1)
-                    next_capsule_pos = self._capsule.new_block(
-                        3 * next_capacity)
-                    self._capsule[caps_pos, position + 2] = next_capsule_pos
-                caps_pos = next_capsule_pos
-                depth += 1
+                claimed.add(slot)
+                new.append(i)
+
+        if new:
+            row_len = len(self.dataset)
+            start = self._db._append(b"".join(
+                self.dataset._to_bytes(records[i]) for i in new))
+            for k, i in enumerate(new):
+                caps_pos, _, position = slots[i]
+                self._write_slot(caps_pos, position,
+                                 [key_hashes[i], start + k * row_len])
+        # keys without a free slot of their own go through insert
+        for i in later:
+            self.insert(records[i])
+
+    def delete(self, key):
+        data_ids, slots = self._find_positions([self._hash(key)])
+        if data_ids[0] is None:
+            raise KeyError
+        self.dataset.delete(data_ids[0], 0)
+        # the next capsule of the slot is kept, deeper keys stay reachable
+        caps_pos, _, position = slots[0]
+        self._write_slot(caps_pos, position, [0, 0])
+
+    # =========================================================================
+    # iteration
+    # =========================================================================
+
+    def __iter__(self):
+        # the tree is read one depth at a time, with a single read for the
+        # capsules of a depth that are not cached
+        level = [self._capsule_start]
+        depth = 0
+        while level:
+            size = 3 * self._get_capacity(depth)
+            capsules = [self._get_capsule(caps_pos, depth)
+                        for caps_pos in level]
+            missing = [i for i, capsule in enumerate(capsules)
+                       if capsule is None]
+            data = self._db._read_many(
+                [(self._get_slot_offset(level[i], 0), 8 * size)
+                 for i in missing])
+            for i, capsule in zip(missing, data):
+                capsules[i] = np.frombuffer(capsule, dtype=np.uint64)
+
+            slots = np.concatenate(capsules).reshape(-1, 3)
+            data_ids = slots[slots[:, 0] != 0, 1].tolist()
+            for start in range(0, len(data_ids), self._iter_chunk):
+                yield from self._read_records(
+                    data_ids[start:start + self._iter_chunk])
+            level = slots[slots[:, 2] != 0, 2].tolist()
+            depth += 1
 
 
 class MultiLayerTable(HashTable):
+    # defaults for tables pickled before these options existed
+    packed_bloom = False
+    bloom_fp_rate = None
+    bloom_resident = False
+    value_cache_size = 0
+    value_cache_policy = "lru"
+    count_entries = False
+
     def __init__(
         self,
         dataset,
@@ -461,8 +1818,31 @@ class MultiLayerTable(HashTable):
         p_init=0,
         n_bloom_filters=10,
         bloom_seed=12,
-        cache_len=100000
+        cache_len=100000,
+        packed_bloom=True,
+        bloom_fp_rate=None,
+        bloom_resident=False,
+        hash_function="mmh3",
+        value_cache_size=0,
+        value_cache_policy="lru"
     ):
+        """
+        (bool) packed_bloom: store bloom filters with one bit per slot
+        (float) bloom_fp_rate: use blocked multi-hash bloom filters sized
+        for this false positive rate. Every table gets at least one 64-byte
+        block, so this mostly pays off for large tables
+        (bool) bloom_resident: keep the blocked bloom filters in memory
+        (str) hash_function: "mmh3" or "xxh3", applied to the binary form
+        of the keys
+        (int) value_cache_size: keep up to this many bytes of decoded
+        records in memory, by table id and key. Writes invalidate the
+        records seen from the table id they are made through and from
+        the tables it chains to
+        (str) value_cache_policy: eviction policy of the records, "lru",
+        "clock" or "tinylfu"
+        """
+        if bloom_fp_rate is not None and not packed_bloom:
+            raise ValueError("blocked bloom filters must be packed")
         self.dataset = dataset
         self.key = key
         self.probe_factor = probe_factor
@@ -471,21 +1851,46 @@ class MultiLayerTable(HashTable):
         self.n_bloom_filters = n_bloom_filters
         self.bloom_seed = bloom_seed
         self.cache_len = cache_len
+        self.packed_bloom = packed_bloom
+        self.bloom_fp_rate = bloom_fp_rate
+        self.bloom_resident = bloom_resident
+        self.hash_function = hash_function
+        self.value_cache_size = value_cache_size
+        self.value_cache_policy = value_cache_policy
+        # each table header counts the live and deleted entries of the
+        # chain it starts
+        self.count_entries = True
 
         self._group_name = f"{dataset.name}_FLT_table"
         self._bloom_filter_name = f"{dataset.name}_FLT_filter"
 
     def _initialize(self):
-        self.table = self._db.create_group(
-            self._group_name, self.dataset,
+        self._hasher = self._get_hasher()
+        fields = dict(
             _prev_table="uint64", _p="uint8", _bloom_filter="uint64")
+        if self.count_entries:
+            fields.update(_count="uint64", _tombstones="uint64")
+        self.table = self._db.create_group(
+            self._group_name, self.dataset, **fields)
         self.table._add_database_reference(self._db)
+        self._row_dt = np.dtype(
+            [("prefix", PREFIX_DTYPE)] + self.dataset._dtypes)
         # create bloom filters
-        self._bloom = self._db.create_array(self._bloom_filter_name, "bool")
+        self._bloom = self._db.create_array(
+            self._bloom_filter_name, "bit" if self.packed_bloom else "bool")
+        self._blocked_bloom = None
+        if self.bloom_fp_rate is not None:
+            self._blocked_bloom = BlockedBloomFilter(
+                self._bloom, self.bloom_fp_rate, self.bloom_seed,
+                self.bloom_resident, self._hasher)
 
         if self.cache_len > 0:
-            from lru import LRU
             self.cache = LRU(self.cache_len)
+            self._counts = LRU(self.cache_len)
+        self._value_cache = None
+        if self.value_cache_size > 0:
+            self._value_cache = get_record_cache(
+                self.value_cache_size, self.value_cache_policy)
 
     def _get_capacity(self, p):
         capacity = (self.growth_factor**p) - 1
@@ -503,14 +1908,19 @@ class MultiLayerTable(HashTable):
 
         # allocate new table and new bloom filter
         table_id = self.table.new_block(capacity)
-        bloom_id = self._bloom.new_block(
-            capacity * self.n_bloom_filters)
+        if self._blocked_bloom is not None:
+            bloom_id = self._blocked_bloom.new_filter(capacity)
+        else:
+            bloom_id = self._bloom.new_block(
+                capacity * self.n_bloom_filters)
 
         # fill data
         self.table[table_id, "_p"] = p
         self.table[table_id, "_bloom_filter"] = bloom_id
         if _prev is not None:
             self.table[table_id, "_prev_table"] = _prev
+            if self.count_entries:
+                self._set_counts(table_id, *self._get_counts(_prev))
         else:
             _prev = 0
         if self.cache_len > 0:
@@ -518,39 +1928,105 @@ class MultiLayerTable(HashTable):
         return table_id
 
     def insert(self, table_id, data):
+        """
+        inserts `data` in the chain starting at `table_id` and returns the
+        newest table id of the chain. It differs from `table_id` when a
+        table was chained on top of it, and may then be lower: released
+        blocks are reused, so table ids do not grow with the chain
+        """
         key = data[self.key]
         _hash = self._hash(key)
         metadata = self._get_metadata(table_id)
+        head_id = int(table_id)
 
         # get bloom hash
-        _bloom_hash = self._hash(key, seed=self.bloom_seed)
+        _bloom_hash = self._bloom_hash(key)
 
         try:
-            t_id, position, capacity, bloom_id, new = self._find_lookup_position(
+            t_id, position, capacity, bloom_id, status = self._find_lookup_position(
                 table_id, _hash, _bloom_hash, key, metadata)
         except KeyError:
-            t_id, position, capacity, bloom_id, new = self._find_insert_position(
-                table_id, _hash, key, metadata)
+            try:
+                t_id, position, capacity, bloom_id, status = self._find_insert_position(
+                    table_id, _hash, key, metadata)
+            except KeyError:
+                # every window of the chain is full: chain a larger table
+                head_id = self.new_table(p=metadata[1] + 1, _prev=table_id)
+                t_id, position, capacity, bloom_id, status = self._find_insert_position(
+                    head_id, _hash, key, self._get_metadata(head_id))
 
         self.table[t_id, position] = data
         if True:
             self._insert_in_bloom(bloom_id, capacity, _bloom_hash)
-        return t_id
+        if self._value_cache is not None:
+            self._discard_records(head_id, t_id, key)
+        if self.count_entries and status != 1:
+            # the counts of a chain live in its newest table
+            count, tombstones = self._get_counts(head_id)
+            self._set_counts(head_id, count + 1, tombstones + status)
+        return head_id
+
+    def delete(self, table_id, key):
+        """
+        deletes `key` from the chain of tables starting at `table_id`
+        """
+        _hash = self._hash(key)
+        _bloom_hash = self._bloom_hash(key)
+        metadata = self._get_metadata(table_id)
+        t_id, position, _, _, _ = self._find_lookup_position(
+            table_id, _hash, _bloom_hash, key, metadata)
+        index = int(t_id) + self.table._len + position * len(self.dataset)
+        self._db._write_at(index, PREFIX_DTYPE(
+            -self.dataset._identifier).tobytes())
+        if self._value_cache is not None:
+            self._discard_records(table_id, t_id, key)
+        if self.count_entries:
+            count, tombstones = self._get_counts(table_id)
+            self._set_counts(table_id, count - 1, tombstones + 1)
+
+    def _discard_records(self, table_id, t_id, key):
+        # the record of `key` written in table `t_id` is seen from every
+        # table between the head `table_id` and `t_id` in the chain
+        table_id, t_id = int(table_id), int(t_id)
+        while True:
+            self._value_cache.discard((table_id, key))
+            if table_id == t_id or table_id == 0:
+                break
+            table_id = int(self._get_metadata(table_id)[0])
 
-    def lookup(self, table_id, key):
+    def lookup(self, table_id, key, lazy=False):
+        if self._value_cache is not None and not lazy:
+            record = self._value_cache.get((int(table_id), key))
+            if record is not None:
+                return dict(record)
         _hash = self._hash(key)
-        _bloom_hash = self._hash(key, seed=self.bloom_seed)
+        _bloom_hash = self._bloom_hash(key)
         metadata = self._get_metadata(table_id)
         t_id, position, _, _, _ = self._find_lookup_position(
             table_id, _hash, _bloom_hash, key, metadata, verbose=True)
-        return self.table[t_id, position]
+        record = self.table.get_data(t_id, position, lazy=lazy)
+        if self._value_cache is not None and not lazy:
+            self._value_cache.set((int(table_id), key), record)
+            return dict(record)
+        return record
+
+    def _bloom_hash(self, key):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.hash(key)
+        return self._hash(key, seed=self.bloom_seed)
 
     def _insert_in_bloom(self, bloom_id, capacity, _bloom_hash):
+        if self._blocked_bloom is not None:
+            self._blocked_bloom.add(bloom_id, capacity, _bloom_hash)
+            return
         bloom_capacity = capacity * self.n_bloom_filters
         bucket = _bloom_hash % bloom_capacity
         self._bloom.set_value(bloom_id, bucket, 1)
 
     def _lookup_in_bloom(self, bloom_id, capacity, _bloom_hash):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.contains(
+                bloom_id, capacity, _bloom_hash)
         bloom_capacity = capacity * self.n_bloom_filters
         bucket = _bloom_hash % bloom_capacity
         return self._bloom.get_value(bloom_id, bucket)
@@ -560,101 +2036,428 @@ class MultiLayerTable(HashTable):
             metadata = self.cache.get(table_id)
             if metadata is None:
                 m = self.table[table_id]
-                _prev, p, bloom_id = m["_prev_table"], m["_p"], m["_bloom_filter"]
+                _prev, p, bloom_id = (int(m["_prev_table"]), int(m["_p"]),
+                                      int(m["_bloom_filter"]))
                 self.cache[table_id] = (_prev, p, bloom_id)
                 return (_prev, p, bloom_id)
             else:
                 return metadata
 
         m = self.table[table_id]
-        metadata = m["_prev_table"], m["_p"], m["_bloom_filter"]
+        metadata = (int(m["_prev_table"]), int(m["_p"]),
+                    int(m["_bloom_filter"]))
         return metadata
 
-    def _find_lookup_position(self, table_id, _hash, _bloom_hash, key, metadata, verbose=False):
-        _get_status = self.table.status
-        _get_value = self.table.get_data_value
+    def _read_table_window(self, table_id, p, bucket):
+        capacity = self._get_capacity(p)
+        return self._read_window(int(table_id) + self.table._len, bucket,
+                                 len(self._get_range(p, capacity)), capacity)
 
-        _prev, p_max, bloom_id = metadata
-        for p in range(p_max, self.p_init-1, -1):
+    def _find_lookup_position(self, table_id, _hash, _bloom_hash, key, metadata, verbose=False):
+        _prev, p, bloom_id = metadata
+        while True:
             capacity = self._get_capacity(p)
             # check if value is in bloom filter
             bloom_value = self._lookup_in_bloom(
                 bloom_id, capacity, _bloom_hash)
             if bloom_value != 0:
                 bucket = _hash % capacity
-                for i in self._get_range(p, capacity):
-                    position = (bucket + i) % capacity
-                    status = _get_status(table_id, position)
-                    if status == 0:
-                        break
-                    elif status == 1:
-                        current_key = _get_value(table_id, position, self.key)
-                        if current_key == key:
-                            return (table_id,
-                                    position,
-                                    capacity,
-                                    bloom_id,
-                                    False)
+                offset = self._scan_window(
+                    self._read_table_window(table_id, p, bucket), key)
+                if offset is not None:
+                    return (table_id,
+                            (bucket + offset) % capacity,
+                            capacity,
+                            bloom_id,
+                            1)
+            if _prev == 0:
+                break
+            # batched insertions may chain tables of any size
             table_id = _prev
-            _prev, _, bloom_id = self._get_metadata(table_id)
+            _prev, p, bloom_id = self._get_metadata(table_id)
 
         raise KeyError
 
     def _find_insert_position(self, table_id, _hash, key, metadata):
-        _get_status = self.table.status
-
-        _prev, p_max, bloom_id = metadata
-        table_id_max = int(table_id)
-        for p in range(p_max, self.p_init-1, -1):
+        _prev, p, bloom_id = metadata
+        while True:
             capacity = self._get_capacity(p)
             bucket = _hash % capacity
-            for i in self._get_range(p, capacity):
-                position = (bucket + i) % capacity
-                status = _get_status(table_id, position)
-                if status <= 0:  # slot is free or deleted
-                    return (table_id,
-                            position,
-                            capacity,
-                            bloom_id,
-                            True)
-                else:
-                    # no need to check for equality:
-                    # it was already been done in lookup phase
-                    continue
+            # no need to check for equality:
+            # it was already been done in lookup phase
+            statuses = self._get_statuses(
+                self._read_table_window(table_id, p, bucket))
+            free = np.flatnonzero(statuses <= 0)  # slot is free or deleted
+            if len(free) > 0:
+                return (table_id,
+                        (bucket + int(free[0])) % capacity,
+                        capacity,
+                        bloom_id,
+                        int(statuses[free[0]]))
 
             if _prev == 0:
                 break
             table_id = _prev
-            _prev, _, bloom_id = self._get_metadata(table_id)
+            _prev, p, bloom_id = self._get_metadata(table_id)
 
-        # create a new table and fill data
-        new_table_id = self.new_table(p=p_max+1, _prev=table_id_max)
-        metadata = self._get_metadata(new_table_id)
-        return self._find_insert_position(new_table_id, _hash, key, metadata)
+        raise KeyError
 
-    def iterate(self, table_id, field=None):
-        metadata = self._get_metadata(table_id)
-        if metadata is None:
-            metadata = self.table[table_id]
-            p = metadata["_p"]
-            _prev = metadata["_prev_table"]
-            bloom_id = metadata["_bloom_filter"]
-            self.cache[table_id] = (_prev, p, bloom_id)
+    # =========================================================================
+    # batched operations
+    # =========================================================================
+
+    # load of the tables allocated for a batch
+    _batch_load_factor = .5
+
+    def _read_windows(self, table_id, p, buckets):
+        capacity = self._get_capacity(p)
+        length = len(self._get_range(p, capacity))
+        start = int(table_id) + self.table._len
+        requests = [
+            self._get_window_requests(start, bucket, length, capacity)
+            for bucket in buckets]
+        data = iter(self._db._read_many(
+            [request for parts in requests for request in parts]))
+        return [np.frombuffer(b"".join(next(data) for _ in parts),
+                              dtype=self._row_dt) for parts in requests]
+
+    def _lookup_in_bloom_many(self, bloom_id, capacity, bloom_hashes):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.contains_many(
+                bloom_id, capacity, bloom_hashes)
+        bloom_capacity = capacity * self.n_bloom_filters
+        buckets = [bloom_hash % bloom_capacity for bloom_hash in bloom_hashes]
+        start = int(bloom_id) + self._bloom._prefix_size
+        if self._bloom._packed:
+            data = self._db._read_many(
+                [(start + bucket // 8, 1) for bucket in buckets])
+            return [bool(d[0] >> (bucket % 8) & 1)
+                    for d, bucket in zip(data, buckets)]
+        data = self._db._read_many([(start + bucket, 1) for bucket in buckets])
+        return [d != b"\x00" for d in data]
+
+    def _get_chain(self, table_id):
+        # (table_id, p, bloom_id) of the tables of a chain, newest first
+        chain = []
+        while table_id != 0:
+            _prev, p, bloom_id = self._get_metadata(table_id)
+            chain.append((int(table_id), int(p), int(bloom_id)))
+            table_id = _prev
+        return chain
+
+    def _find_lookup_positions(self, chain, keys, key_hashes, bloom_hashes):
+        # (table_id, position) of every key in the chain, None if missing
+        positions = [None] * len(keys)
+        pending = list(range(len(keys)))
+        for table_id, p, bloom_id in chain:
+            if not pending:
+                break
+            capacity = self._get_capacity(p)
+            in_bloom = self._lookup_in_bloom_many(
+                bloom_id, capacity, [bloom_hashes[i] for i in pending])
+            candidates = [i for i, v in zip(pending, in_bloom) if v]
+            buckets = [key_hashes[i] % capacity for i in candidates]
+            windows = self._read_windows(table_id, p, buckets)
+            found = set()
+            for i, bucket, window in zip(candidates, buckets, windows):
+                offset = self._scan_window(window, keys[i])
+                if offset is not None:
+                    positions[i] = table_id, (bucket + offset) % capacity
+                    found.add(i)
+            if found:
+                pending = [i for i in pending if i not in found]
+        return positions
+
+    def _place_in_chain(self, chain, keys, key_hashes, bloom_hashes, items):
+        # writes missing keys in the free slots of the chain, newest table
+        # first. Returns the indices of the keys left out and the number of
+        # deleted slots reused
+        new = list(range(len(keys)))
+        n_reused = 0
+        for table_id, p, bloom_id in chain:
+            if not new:
+                break
+            capacity = self._get_capacity(p)
+            buckets = [key_hashes[i] % capacity for i in new]
+            windows = self._read_windows(table_id, p, buckets)
+            claimed = set()
+            placed = set()
+            for i, bucket, window in zip(new, buckets, windows):
+                statuses = self._get_statuses(window)
+                for offset in np.flatnonzero(statuses <= 0):
+                    position = (bucket + int(offset)) % capacity
+                    if position not in claimed:
+                        claimed.add(position)
+                        placed.add(i)
+                        n_reused += int(statuses[offset] == -1)
+                        self.table[table_id, position] = items[i]
+                        self._insert_in_bloom(
+                            bloom_id, capacity, bloom_hashes[i])
+                        break
+            new = [i for i in new if i not in placed]
+        return new, n_reused
+
+    def _build_bloom_filter(self, capacity, bloom_hashes):
+        if self._blocked_bloom is not None:
+            return self._blocked_bloom.build(capacity, bloom_hashes)
+        bloom_capacity = capacity * self.n_bloom_filters
+        bits = np.zeros(bloom_capacity, dtype=bool)
+        bits[np.array(bloom_hashes, dtype=np.uint64) %
+             np.uint64(bloom_capacity)] = True
+        bloom_id = self._bloom.new_block(bloom_capacity)
+        self._bloom.set_values(bloom_id, 0, bits)
+        return bloom_id
+
+    def _new_filled_table(self, table_id, p_min, key_hashes, bloom_hashes,
+                          rows, load_factor=None, n_sizes=1):
+        """
+        chains a table of p >= p_min on top of `table_id` (0 for none),
+        sized for the given rows, and writes it in a single call. Up to
+        `n_sizes` sizes are tried for all rows to fit. Returns its id
+        """
+        if load_factor is None:
+            load_factor = self._batch_load_factor
+        p = p_min
+        while self._get_capacity(p) * load_factor < len(rows):
+            p += 1
+        for i in range(n_sizes):
+            p += i > 0
+            capacity = self._get_capacity(p)
+            positions = self._place_in_empty_table(
+                key_hashes, capacity, len(self._get_range(p, capacity)), True)
+            if positions.min(initial=0) >= 0:
+                break
+        placed = np.flatnonzero(positions >= 0)
+        left = np.flatnonzero(positions < 0)
+        if len(left) > 0:
+            # the few items whose probe window is full go to a smaller
+            # table chained below this one
+            table_id = self._new_filled_table(
+                table_id, self.p_init, [key_hashes[i] for i in left],
+                [bloom_hashes[i] for i in left], rows[left], load_factor)
+
+        table = np.zeros(capacity, dtype=self._row_dt)
+        table[positions[placed]] = rows[placed]
+        bloom_id = self._build_bloom_filter(
+            capacity, [bloom_hashes[i] for i in placed])
+
+        header = {"_prev_table": table_id, "_p": p, "_bloom_filter": bloom_id}
+        if self.count_entries:
+            count, tombstones = 0, 0
+            if table_id != 0:
+                count, tombstones = self._get_counts(table_id)
+            header.update(_count=count + len(placed), _tombstones=tombstones)
+        header = np.array(
+            (self.table._identifier,) + tuple(
+                header[field] for field, _ in self.table._dtypes),
+            dtype=[("prefix", PREFIX_DTYPE)] + self.table._dtypes)
+        new_table_id = self.table.new_block(capacity)
+        self._db._write_at(new_table_id, header.tobytes() + table.tobytes())
+        if self.cache_len > 0:
+            self.cache[new_table_id] = (table_id, p, bloom_id)
+            if self.count_entries:
+                self._counts[new_table_id] = (
+                    int(header["_count"]), int(header["_tombstones"]))
+        return new_table_id
+
+    def insert_many(self, table_id, items):
+        """
+        inserts many items in the chain starting at `table_id`, the last
+        item winning for repeated keys. Existing keys are updated in place,
+        new keys fill the free slots of the chain, and the rest goes to a
+        single new table sized for them. Returns the newest table id
+        """
+        last = {}
+        for data in items:
+            last[data[self.key]] = data
+        keys = list(last)
+        items = list(last.values())
+        key_hashes = self._hash_many(keys)
+        if self._blocked_bloom is not None:
+            bloom_hashes = [self._bloom_hash(key) for key in keys]
+        else:
+            bloom_hashes = self._hash_many(keys, self.bloom_seed)
+        table_id = int(table_id)
+        chain = self._get_chain(table_id)
+
+        positions = self._find_lookup_positions(
+            chain, keys, key_hashes, bloom_hashes)
+        new = []
+        for i, position in enumerate(positions):
+            if position is None:
+                new.append(i)
+                continue
+            self.table[position[0], position[1]] = items[i]
+            if self._value_cache is not None:
+                self._discard_records(table_id, position[0], keys[i])
+        if not new:
+            return table_id
+
+        if self.count_entries:
+            count, tombstones = self._get_counts(table_id)
+        # small batches fill the free slots of the chain, large ones go
+        # straight to a new table
+        if len(new) < self._get_capacity(chain[0][1] + 1):
+            left, n_reused = self._place_in_chain(
+                chain, [keys[i] for i in new], [key_hashes[i] for i in new],
+                [bloom_hashes[i] for i in new], [items[i] for i in new])
+            placed = len(new) - len(left)
+            new = [new[i] for i in left]
+            if self.count_entries and placed > 0:
+                self._set_counts(
+                    table_id, count + placed, tombstones - n_reused)
+        if not new:
+            return table_id
+        rows = np.frombuffer(b"".join(
+            self.dataset._to_bytes(items[i]) for i in new), dtype=self._row_dt)
+        return self._new_filled_table(
+            table_id, chain[0][1] + 1, [key_hashes[i] for i in new],
+            [bloom_hashes[i] for i in new], rows)
+
+    # =========================================================================
+    # compaction
+    # =========================================================================
+
+    def _release_table(self, table_id, p, bloom_id):
+        capacity = self._get_capacity(p)
+        self._db._release(table_id, self.table._len +
+                          len(self.dataset) * capacity)
+        if self._blocked_bloom is not None:
+            self._blocked_bloom.discard(bloom_id)
+            size = self._blocked_bloom.get_size(capacity)
+        else:
+            size = capacity * self.n_bloom_filters
+        self._db._release(bloom_id, self._bloom.get_block_size(size))
+        if self.cache_len > 0:
+            self.cache.pop(table_id, None)
+            self._counts.pop(table_id, None)
+
+    def compact(self, table_id, load_factor=.5):
+        """
+        rebuilds the chain starting at `table_id` into a single table at
+        most `load_factor` full, drops deleted entries and releases the old
+        tables. Entries that fit neither in that table nor in the next size
+        up go to a small table chained below it.
+        Returns the id of the new table, which replaces `table_id`
+        """
+        chain = self._get_chain(table_id)
+        row_len = len(self.dataset)
+        rows = [np.zeros(0, dtype=self._row_dt)]
+        for t_id, p, _ in chain:
+            data = np.frombuffer(self._db._read_at(
+                t_id + self.table._len, self._get_capacity(p) * row_len),
+                dtype=self._row_dt)
+            rows.append(data[self._get_statuses(data) == 1])
+        rows = np.concatenate(rows)
+
+        keys = self._get_row_keys(rows)
+        if self._blocked_bloom is not None:
+            bloom_hashes = [self._bloom_hash(key) for key in keys]
         else:
-            _prev, p, _ = metadata
+            bloom_hashes = self._hash_many(keys, self.bloom_seed)
+        new_table_id = self._new_filled_table(
+            0, self.p_init, self._hash_many(keys), bloom_hashes, rows,
+            load_factor, n_sizes=2)
+
+        for t_id, p, bloom_id in chain:
+            self._release_table(t_id, p, bloom_id)
+        # released blocks may be handed out again under the same ids
+        if self._value_cache is not None:
+            self._value_cache.clear()
+        return new_table_id
+
+    def compact_many(self, table_ids, min_tables=2, load_factor=.5):
+        """
+        compacts the chains of at least `min_tables` tables among
+        `table_ids`, which must start distinct chains, and returns a dict
+        mapping each compacted table id to the id of its replacement
+        """
+        new_ids = {}
+        for table_id in table_ids:
+            table_id = int(table_id)
+            if table_id in new_ids or table_id == 0:
+                continue
+            if len(self._get_chain(table_id)) >= min_tables:
+                new_ids[table_id] = self.compact(table_id, load_factor)
+        return new_ids
 
-        while True:
+    # =========================================================================
+    # sizes
+    # =========================================================================
+
+    def _get_counts(self, table_id):
+        table_id = int(table_id)
+        if self.cache_len > 0:
+            counts = self._counts.get(table_id)
+            if counts is not None:
+                return counts
+        m = self.table[table_id]
+        counts = int(m["_count"]), int(m["_tombstones"])
+        if self.cache_len > 0:
+            self._counts[table_id] = counts
+        return counts
+
+    def _set_counts(self, table_id, count, tombstones):
+        table_id = int(table_id)
+        # both counters are contiguous and written at once
+        align = self.table._field["_count"][2]
+        self._db._write_at(table_id + align, np.array(
+            [count, tombstones], dtype=np.uint64).tobytes())
+        if self.cache_len > 0:
+            self._counts[table_id] = count, tombstones
+
+    def len(self, table_id):
+        """
+        number of live entries in the chain of tables starting at
+        `table_id`, which should be the newest table returned by `insert`
+        """
+        if not self.count_entries:
+            # tables created before entries were counted
+            return sum(1 for _ in self.iterate(table_id, self.key))
+        return self._get_counts(table_id)[0]
+
+    def n_tombstones(self, table_id):
+        if not self.count_entries:
+            return None
+        return self._get_counts(table_id)[1]
+
+    def load_factor(self, table_id):
+        """
+        share of the slots of the chain holding a live entry
+        """
+        n_entries = self.len(table_id)
+        capacity = 0
+        while table_id != 0:
+            table_id, p, _ = self._get_metadata(table_id)
+            capacity += self._get_capacity(p)
+        return n_entries / capacity
+
+    def iterate(self, table_id, field=None):
+        for t_id, p, _ in self._get_chain(table_id):
             capacity = self._get_capacity(p)
             if field is None:
-                items = self.table[table_id, :capacity]
+                items = self.table[t_id, :capacity]
             else:
-                items = self.table[table_id, :capacity, field]
+                items = self.table[t_id, :capacity, field]
             for it in items:
                 if it is not None:
                     yield it
-            table_id = _prev
-            if table_id == 0:
-                break
-            meta = self.table[table_id]
-            _prev = meta["_prev_table"]
-            p = meta["_p"]
+
+    def iterate_array(self, table_id, field):
+        """
+        values of `field` of the live entries of a chain, as one array.
+        Every table of the chain is read whole, in a single coalesced read
+        """
+        chain = self._get_chain(table_id)
+        row_len = len(self.dataset)
+        data = self._db._read_many(
+            [(t_id + self.table._len, self._get_capacity(p) * row_len)
+             for t_id, p, _ in chain])
+        rows = np.frombuffer(b"".join(data), dtype=self._row_dt)
+        values = rows[field][self._get_statuses(rows) == 1]
+        if field in self.dataset._field_codecs:
+            decoded = np.empty(len(values), dtype=object)
+            decoded[:] = [self.dataset._decode_value(field, value)
+                          for value in values]
+            return decoded
+        return values
@@ -0,0 +1,292 @@
+import numpy as np
+from interlacedb.dataset import PREFIX_DTYPE
+
+from .hashtable import HashTable
+
+
+class LinearHashTable(HashTable):
+    """
+    linear hashing: the table grows by splitting one bucket at a time, in
+    round robin order given by the split pointer. Buckets are chains of
+    pages (groups of `bucket_size` rows), and a two-level directory maps
+    bucket numbers to their first page
+    """
+    # number of bucket entries per directory segment
+    _segment_size = 4096
+    # number of directory segments, which bounds the number of buckets
+    _n_segments = 4096
+
+    def __init__(
+        self, dataset, key, n_buckets=16, bucket_size=16,
+        max_load_factor=.8, hash_function="mmh3"
+    ):
+        """
+        (int) n_buckets: initial number of buckets
+        (int) bucket_size: number of rows per page
+        (float) max_load_factor: a bucket is split whenever an insertion
+        leaves the table fuller than that
+        (str) hash_function: "mmh3" or "xxh3", applied to the binary form
+        of the keys
+        """
+        self.dataset = dataset
+        self.key = key
+        self.n_buckets = n_buckets
+        self.bucket_size = bucket_size
+        self.max_load_factor = max_load_factor
+        self.hash_function = hash_function
+
+        self.dstruct_name = f"{dataset.name}_LH"
+        self._page_name = f"{self.dstruct_name}_page"
+        self._directory_name = f"{self.dstruct_name}_directory"
+        self._index_key = f"{self.dstruct_name}_index"
+        self._level_key = f"{self.dstruct_name}_level"
+        self._split_key = f"{self.dstruct_name}_split"
+        self._count_key = f"{self.dstruct_name}_count"
+
+    def _get_header_fields(self):
+        return {
+            self._index_key: "uint64",
+            self._level_key: "uint8",
+            self._split_key: "uint64",
+            self._count_key: "uint64",
+        }
+
+    def _initialize(self):
+        db = self._db
+        self._hasher = self._get_hasher()
+        self._page = db.create_group(
+            self._page_name, self.dataset, _n="uint32", _next="uint64")
+        self._page._add_database_reference(db)
+        self._directory = db.create_array(self._directory_name, "uint64")
+
+        self._header_dt = np.dtype(
+            [("prefix", PREFIX_DTYPE)] + self._page._dtypes)
+        self._row_dt = np.dtype(
+            [("prefix", PREFIX_DTYPE)] + self.dataset._dtypes)
+        self._page_size = len(self._page) + \
+            self.bucket_size * len(self.dataset)
+        # directory segments read so far
+        self._segments = {}
+
+        self._index_id = int(db.header[self._index_key])
+        if self._index_id == 0:
+            self._index_id = self._directory.new_block(self._n_segments)
+            db.header[self._index_key] = self._index_id
+            self._index = np.zeros(self._n_segments, dtype=np.uint64)
+            for bucket in range(self.n_buckets):
+                self._set_bucket_page(bucket, self._new_page())
+        else:
+            self._index = self._directory.get_values(
+                self._index_id, 0, self._n_segments).copy()
+        self._level = int(db.header[self._level_key])
+        self._split = int(db.header[self._split_key])
+        self._count = int(db.header[self._count_key])
+
+    # =========================================================================
+    # directory
+    # =========================================================================
+
+    def _get_segment(self, segment):
+        values = self._segments.get(segment)
+        if values is None:
+            values = self._directory.get_values(
+                self._index[segment], 0, self._segment_size).copy()
+            self._segments[segment] = values
+        return values
+
+    def _get_bucket_page(self, bucket):
+        segment, offset = divmod(bucket, self._segment_size)
+        return int(self._get_segment(segment)[offset])
+
+    def _set_bucket_page(self, bucket, page_id):
+        segment, offset = divmod(bucket, self._segment_size)
+        if segment >= self._n_segments:
+            raise ValueError("the directory of the table is full")
+        if self._index[segment] == 0:
+            segment_id = self._directory.new_block(self._segment_size)
+            self._directory.set_value(self._index_id, segment, segment_id)
+            self._index[segment] = segment_id
+            self._segments[segment] = np.zeros(
+                self._segment_size, dtype=np.uint64)
+        self._directory.set_value(self._index[segment], offset, page_id)
+        self._get_segment(segment)[offset] = page_id
+
+    def _get_n_buckets(self):
+        return (self.n_buckets << self._level) + self._split
+
+    def _get_bucket(self, key_hash):
+        n = self.n_buckets << self._level
+        bucket = key_hash % n
+        if bucket < self._split:
+            bucket = key_hash % (2 * n)
+        return bucket
+
+    # =========================================================================
+    # page IO
+    # =========================================================================
+
+    def _new_page(self):
+        return self._page.new_block(self.bucket_size)
+
+    def _read_page(self, page_id):
+        data = self._db._read_at(page_id, self._page_size)
+        header = np.frombuffer(data, dtype=self._header_dt, count=1)[0]
+        rows = np.frombuffer(data, dtype=self._row_dt,
+                             count=int(header["_n"]), offset=len(self._page))
+        return rows, int(header["_next"])
+
+    def _write_page(self, page_id, rows, next_page):
+        header = np.array((self._page._identifier, len(rows), next_page),
+                          dtype=self._header_dt)
+        padding = (self.bucket_size - len(rows)) * len(self.dataset)
+        self._db._write_at(page_id, b"".join((
+            header.tobytes(), rows.tobytes(), bytes(padding))))
+
+    def _read_chain(self, page_id):
+        pages = []
+        rows = [np.zeros(0, dtype=self._row_dt)]
+        while page_id != 0:
+            page_rows, next_page = self._read_page(page_id)
+            pages.append(page_id)
+            rows.append(page_rows)
+            page_id = next_page
+        return pages, np.concatenate(rows)
+
+    def _write_chain(self, pages, rows):
+        # writes rows over the given pages, allocating or releasing pages
+        # as needed, and returns the first page of the chain
+        size = self.bucket_size
+        n_pages = max(1, -(-len(rows) // size))
+        pages = list(pages)
+        while len(pages) < n_pages:
+            pages.append(self._new_page())
+        for i in range(n_pages):
+            next_page = pages[i + 1] if i + 1 < n_pages else 0
+            self._write_page(pages[i], rows[i * size:(i + 1) * size],
+                             next_page)
+        for page_id in pages[n_pages:]:
+            self._db._release(page_id, self._page_size)
+        return pages[0]
+
+    # =========================================================================
+    # lookup
+    # =========================================================================
+
+    def _find(self, key, key_hash):
+        """
+        pages of the bucket of `key` read so far, as (page_id, rows, next)
+        tuples, and the row of `key` in the last of them, None if missing
+        """
+        page_id = self._get_bucket_page(self._get_bucket(key_hash))
+        chain = []
+        while page_id != 0:
+            rows, next_page = self._read_page(page_id)
+            chain.append((page_id, rows, next_page))
+            if len(rows) > 0:
+                matches = np.flatnonzero(self._match_keys(rows, key))
+                if len(matches) > 0:
+                    return chain, int(matches[0])
+            page_id = next_page
+        return chain, None
+
+    def lookup(self, key, lazy=False):
+        chain, index = self._find(key, self._hash(key))
+        if index is None:
+            raise KeyError
+        row = chain[-1][1][index:index + 1].tobytes()
+        row = row[self.dataset._prefix_size:]
+        if lazy:
+            return self.dataset._parse_lazy(row)
+        return self.dataset._parse(row)
+
+    def contains(self, key):
+        _, index = self._find(key, self._hash(key))
+        return index is not None
+
+    # =========================================================================
+    # insertion and deletion
+    # =========================================================================
+
+    def _set_count(self, count):
+        self._count = count
+        self._db.header[self._count_key] = count
+
+    def insert(self, data):
+        key = data[self.key]
+        chain, index = self._find(key, self._hash(key))
+        if index is not None:
+            self._page.set_data(chain[-1][0], index, data)
+            return
+
+        for page_id, rows, _ in chain:
+            if len(rows) < self.bucket_size:
+                self._page.set_data(page_id, len(rows), data)
+                self._page.set_value(page_id, "_n", len(rows) + 1)
+                break
+        else:
+            # every page of the bucket is full: chain an overflow page
+            page_id = self._new_page()
+            row = np.frombuffer(
+                self.dataset._to_bytes(data), dtype=self._row_dt)
+            self._write_page(page_id, row, 0)
+            self._page.set_value(chain[-1][0], "_next", page_id)
+
+        self._set_count(self._count + 1)
+        capacity = self._get_n_buckets() * self.bucket_size
+        if self._count > capacity * self.max_load_factor:
+            self._split_bucket()
+
+    def _split_bucket(self):
+        # moves the entries of the bucket under the split pointer that
+        # belong to its image at the next level
+        n = self.n_buckets << self._level
+        bucket = self._split
+        pages, rows = self._read_chain(self._get_bucket_page(bucket))
+        key_hashes = self._hash_many(self._get_row_keys(rows))
+        moved = np.array([key_hash % (2 * n) != bucket
+                          for key_hash in key_hashes], dtype=bool)
+
+        self._set_bucket_page(bucket + n, self._write_chain([], rows[moved]))
+        self._write_chain(pages, rows[~moved])
+
+        self._split += 1
+        if self._split == n:
+            self._level += 1
+            self._split = 0
+        self._db.header[self._level_key] = self._level
+        self._db.header[self._split_key] = self._split
+
+    def delete(self, key):
+        chain, index = self._find(key, self._hash(key))
+        if index is None:
+            raise KeyError
+        page_id, rows, next_page = chain[-1]
+        # the last row of the page fills the hole
+        rows = rows.copy()
+        rows[index] = rows[-1]
+        if len(rows) == 1 and len(chain) > 1:
+            # unlink the emptied overflow page
+            self._page.set_value(chain[-2][0], "_next", next_page)
+            self._db._release(page_id, self._page_size)
+        else:
+            self._write_page(page_id, rows[:-1], next_page)
+        self._set_count(self._count - 1)
+
+    # =========================================================================
+    # iteration
+    # =========================================================================
+
+    def __iter__(self):
+        parse = self.dataset._parse
+        prefix_size = self.dataset._prefix_size
+        for bucket in range(self._get_n_buckets()):
+            _, rows = self._read_chain(self._get_bucket_page(bucket))
+            for row in rows:
+                yield parse(row.tobytes()[prefix_size:])
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def load_factor(self):
+        return self._count / (self._get_n_buckets() * self.bucket_size)
@@ -0,0 +1,354 @@
+import numpy as np
+from interlacedb.dataset import PREFIX_DTYPE
+
+from .hashtable import HashTable
+
+
+class RobinHoodTable(HashTable):
+    """
+    open addressing table with Robin Hood insertion: an entry takes the
+    slot of any entry closer to its home bucket. The probe distance of each
+    slot is stored in a uint8 array next to the table (0 for empty slots,
+    distance + 1 otherwise), so that misses stop at the first entry richer
+    than the key and deletions shift the following entries back instead of
+    leaving tombstones
+    """
+    # largest storable probe distance, a table is rehashed beyond it
+    _max_distance = 254
+    # number of distances read at once when scanning a run of entries
+    _run_chunk = 64
+    # number of rows read at once when iterating or rehashing
+    _iter_chunk = 4096
+
+    def __init__(
+        self, dataset, key, p_init=10, max_load_factor=.9,
+        hash_function="mmh3"
+    ):
+        """
+        (int) p_init: the table starts with 2**p_init slots
+        (float) max_load_factor: the table doubles once it is that full,
+        strictly between 0 and 1 so that runs always end at an empty slot
+        (str) hash_function: "mmh3" or "xxh3", applied to the binary form
+        of the keys
+        """
+        if not 0 < max_load_factor < 1:
+            raise ValueError("max_load_factor must lie between 0 and 1")
+        self.dataset = dataset
+        self.key = key
+        self.p_init = p_init
+        self.max_load_factor = max_load_factor
+        self.hash_function = hash_function
+
+        self.dstruct_name = f"{dataset.name}_RH"
+        self._distances_name = f"{self.dstruct_name}_distances"
+        self._table_id_key = f"{self.dstruct_name}_table_id"
+        self._distances_id_key = f"{self.dstruct_name}_distances_id"
+        self._p_key = f"{self.dstruct_name}_p"
+        self._count_key = f"{self.dstruct_name}_count"
+        self._max_dist_key = f"{self.dstruct_name}_max_dist"
+
+    def _get_header_fields(self):
+        return {
+            self._table_id_key: "uint64",
+            self._distances_id_key: "uint64",
+            self._p_key: "uint8",
+            self._count_key: "uint64",
+            self._max_dist_key: "uint8",
+        }
+
+    def _initialize(self):
+        self._hasher = self._get_hasher()
+        self._distances = self._db.create_array(self._distances_name, "uint8")
+        self._row_dt = np.dtype(
+            [("prefix", PREFIX_DTYPE)] + self.dataset._dtypes)
+        self._row_len = len(self.dataset)
+
+        header = self._db.header
+        if header[self._table_id_key] == 0:
+            capacity = 2**self.p_init
+            header[self._table_id_key] = self.dataset.new_block(capacity)
+            header[self._distances_id_key] = self._distances.new_block(
+                capacity)
+            header[self._p_key] = self.p_init
+        self._load_header()
+
+    def _load_header(self):
+        header = self._db.header
+        self._table_id = int(header[self._table_id_key])
+        self._distances_start = int(
+            header[self._distances_id_key]) + self._distances._prefix_size
+        self._p = int(header[self._p_key])
+        self._capacity = 2**self._p
+        self._count = int(header[self._count_key])
+        self._max_dist = int(header[self._max_dist_key])
+
+    # =========================================================================
+    # slot ranges
+    # =========================================================================
+
+    def _get_range_requests(self, start, item_size, first, length):
+        # (start, size) of slots [first, first + length), in two parts when
+        # the range wraps around the end of the table
+        end = min(first + length, self._capacity)
+        requests = [(start + first * item_size, (end - first) * item_size)]
+        if end - first < length:
+            requests.append((start, (length - end + first) * item_size))
+        return requests
+
+    def _read_range(self, start, item_size, first, length):
+        return b"".join(self._db._read_many(
+            self._get_range_requests(start, item_size, first, length)))
+
+    def _write_range(self, start, item_size, first, data):
+        length = len(data) // item_size
+        offset = 0
+        for position, size in self._get_range_requests(
+                start, item_size, first, length):
+            self._db._write_at(position, data[offset:offset + size])
+            offset += size
+
+    def _read_distances(self, first, length):
+        return np.frombuffer(self._read_range(
+            self._distances_start, 1, first, length), dtype=np.uint8)
+
+    def _read_run(self, first):
+        # distances and rows of the slots from `first` to the next empty
+        # slot included
+        capacity = self._capacity
+        chunks = []
+        length = 0
+        while True:
+            distances = self._read_distances(
+                (first + length) % capacity, min(self._run_chunk, capacity))
+            empty = np.flatnonzero(distances == 0)
+            if len(empty) > 0:
+                chunks.append(distances[:empty[0] + 1])
+                length += int(empty[0]) + 1
+                break
+            chunks.append(distances)
+            length += len(distances)
+        rows = np.frombuffer(self._read_range(
+            self._table_id, self._row_len, first, length), dtype=self._row_dt)
+        return np.concatenate(chunks), rows.copy()
+
+    def _write_run(self, first, distances, rows):
+        self._write_range(self._distances_start, 1, first,
+                          distances.astype(np.uint8).tobytes())
+        self._write_range(self._table_id, self._row_len, first,
+                          rows.tobytes())
+
+    # =========================================================================
+    # lookup
+    # =========================================================================
+
+    def _find(self, key, key_hash):
+        """
+        slot and row bytes of `key`, (None, None) when it is missing
+        """
+        capacity = self._capacity
+        bucket = key_hash % capacity
+        length = min(self._max_dist + 1, capacity)
+        distances = self._read_distances(bucket, length).astype(np.int64) - 1
+        offsets = np.arange(length)
+        # the key cannot lie past an empty slot or an entry closer to its
+        # home than the key would be
+        stop = np.flatnonzero(distances < offsets)
+        end = stop[0] if len(stop) > 0 else length
+        candidates = np.flatnonzero(distances[:end] == offsets[:end])
+        if len(candidates) == 0:
+            return None, None
+
+        positions = [(bucket + int(offset)) % capacity
+                     for offset in candidates]
+        rows = self._db._read_many(
+            [(self._table_id + position * self._row_len, self._row_len)
+             for position in positions])
+        for position, row in zip(positions, rows):
+            if self._match_keys(np.frombuffer(row, dtype=self._row_dt),
+                                key)[0]:
+                return position, row
+        return None, None
+
+    def lookup(self, key, lazy=False):
+        _, row = self._find(key, self._hash(key))
+        if row is None:
+            raise KeyError
+        row = row[self.dataset._prefix_size:]
+        if lazy:
+            return self.dataset._parse_lazy(row)
+        return self.dataset._parse(row)
+
+    def contains(self, key):
+        position, _ = self._find(key, self._hash(key))
+        return position is not None
+
+    # =========================================================================
+    # insertion and deletion
+    # =========================================================================
+
+    def insert(self, data):
+        key = data[self.key]
+        key_hash = self._hash(key)
+        position, _ = self._find(key, key_hash)
+        if position is not None:
+            self.dataset.set(self._table_id, position, data)
+            return
+
+        if self._count + 1 > self._capacity * self.max_load_factor:
+            self.rehash(self._p + 1)
+        row = np.frombuffer(self.dataset._to_bytes(data), dtype=self._row_dt)
+        while not self._insert_row(row, key_hash):
+            self.rehash(self._p + 1)
+        self._count += 1
+        self._db.header[self._count_key] = self._count
+
+    def _insert_row(self, row, key_hash):
+        # Robin Hood insertion of a row known to be missing. Returns False,
+        # writing nothing, when a probe distance would overflow
+        bucket = key_hash % self._capacity
+        distances, rows = self._read_run(bucket)
+        distances = distances.astype(np.int64)
+        carried_row = row[0].copy()
+        carried = 1
+        max_dist = self._max_dist
+        for i in range(len(distances)):
+            if carried > self._max_distance + 1:
+                return False
+            if distances[i] == 0:
+                rows[i] = carried_row
+                distances[i] = carried
+                max_dist = max(max_dist, carried - 1)
+                break
+            if distances[i] < carried:
+                rows[i], carried_row = carried_row, rows[i].copy()
+                distances[i], carried = carried, distances[i]
+                max_dist = max(max_dist, int(distances[i]) - 1)
+            carried += 1
+
+        self._write_run(bucket, distances[:i + 1], rows[:i + 1])
+        if max_dist != self._max_dist:
+            self._max_dist = max_dist
+            self._db.header[self._max_dist_key] = max_dist
+        return True
+
+    def delete(self, key):
+        position, _ = self._find(key, self._hash(key))
+        if position is None:
+            raise KeyError
+        # backward shift: the following entries that are not at their home
+        # bucket move one slot back
+        distances, rows = self._read_run(position)
+        end = 1
+        while distances[end] > 1:
+            end += 1
+        distances = distances[:end].astype(np.int64)
+        rows = rows[:end]
+        distances[:-1] = distances[1:] - 1
+        rows[:-1] = rows[1:]
+        distances[-1] = 0
+        rows[-1] = np.zeros(1, dtype=self._row_dt)[0]
+        self._write_run(position, distances, rows)
+        self._count -= 1
+        self._db.header[self._count_key] = self._count
+
+    # =========================================================================
+    # rehashing
+    # =========================================================================
+
+    def _read_rows(self):
+        # live rows of the table
+        chunk = self._iter_chunk
+        rows = [np.zeros(0, dtype=self._row_dt)]
+        for start in range(0, self._capacity, chunk):
+            length = min(chunk, self._capacity - start)
+            distances = self._read_distances(start, length)
+            if not distances.any():
+                continue
+            data = np.frombuffer(self._db._read_at(
+                self._table_id + start * self._row_len,
+                length * self._row_len), dtype=self._row_dt)
+            rows.append(data[distances != 0])
+        return np.concatenate(rows)
+
+    def _place(self, key_hashes, capacity):
+        # Robin Hood placement of all rows in an empty table: returns the
+        # row index of each slot (-1 if empty) and the distances, or None
+        # when a probe distance overflows
+        slots = np.full(capacity, -1, dtype=np.int64)
+        distances = np.zeros(capacity, dtype=np.int64)
+        for i, key_hash in enumerate(key_hashes):
+            position = key_hash % capacity
+            carried_index, carried = i, 1
+            while distances[position] != 0:
+                if distances[position] < carried:
+                    slots[position], carried_index = (
+                        carried_index, slots[position])
+                    distances[position], carried = (
+                        carried, distances[position])
+                carried += 1
+                if carried > self._max_distance + 1:
+                    return None
+                position = (position + 1) % capacity
+            slots[position] = carried_index
+            distances[position] = carried
+        return slots, distances
+
+    def rehash(self, p=None):
+        """
+        moves every entry into a new table of 2**p slots, large enough for
+        the maximum load factor, and releases the old table
+        """
+        if p is None:
+            p = self._p
+        rows = self._read_rows()
+        while 2**p * self.max_load_factor < len(rows):
+            p += 1
+        key_hashes = self._hash_many(self._get_row_keys(rows))
+        placement = self._place(key_hashes, 2**p)
+        while placement is None:
+            p += 1
+            placement = self._place(key_hashes, 2**p)
+        slots, distances = placement
+
+        capacity = 2**p
+        table = np.zeros(capacity, dtype=self._row_dt)
+        live = slots >= 0
+        table[live] = rows[slots[live]]
+        table_id = self.dataset.new_block(capacity)
+        self._db._write_at(table_id, table.tobytes())
+        distances_id = self._distances.new_block(capacity)
+        self._db._write_at(distances_id + self._distances._prefix_size,
+                           distances.astype(np.uint8).tobytes())
+
+        old_table_id = self._table_id
+        old_distances_id = self._distances_start - \
+            self._distances._prefix_size
+        old_capacity = self._capacity
+
+        header = self._db.header
+        header[self._distances_id_key] = distances_id
+        header[self._table_id_key] = table_id
+        header[self._p_key] = p
+        header[self._max_dist_key] = int(distances.max(initial=1)) - 1
+        self._load_header()
+
+        self._db._release(old_table_id, self._row_len * old_capacity)
+        self._db._release(old_distances_id,
+                          self._distances._prefix_size + old_capacity)
+
+    # =========================================================================
+    # iteration
+    # =========================================================================
+
+    def __iter__(self):
+        parse = self.dataset._parse
+        prefix_size = self.dataset._prefix_size
+        for row in self._read_rows():
+            yield parse(row.tobytes()[prefix_size:])
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def load_factor(self):
+        return self._count / self._capacity
@@ -0,0 +1,155 @@
+import numpy as np
+
+from .cache import LRU
+
+
+class Vector:
+    def __init__(
+        self, name, dt, init_capacity=8, growth_factor=2, cache_len=100000
+    ):
+        """
+        (str) name: name of the datastructure
+        (str) dt: dtype of the vector items
+        (int) init_capacity: number of items allocated for a new vector
+        (int) growth_factor: capacity multiplier applied when a vector is full
+        (int) cache_len: number of vector headers kept in memory
+        """
+        self.name = name
+        self.dt = np.dtype(dt)
+        self.init_capacity = init_capacity
+        self.growth_factor = growth_factor
+        self.cache_len = cache_len
+
+        self._header_name = f"{name}_vector_header"
+        self._data_name = f"{name}_vector_data"
+
+    def _get_header_fields(self):
+        return {}
+
+    def _remove_database_reference(self):
+        if hasattr(self, "_db"):
+            del self._db
+
+    def _add_database_reference(self, db):
+        self._db = db
+
+    def _initialize(self):
+        # a vector is a fixed header block (length, capacity, data block)
+        # pointing to a data block that moves when the vector grows, so
+        # that vector ids stay valid
+        self._header = self._db.create_array(self._header_name, "uint64")
+        self._data = self._db.create_array(self._data_name, self.dt)
+
+        if self.cache_len > 0:
+            self.cache = LRU(self.cache_len)
+
+    def _get_metadata(self, vector_id):
+        if self.cache_len > 0:
+            metadata = self.cache.get(vector_id)
+            if metadata is not None:
+                return metadata
+
+        length, capacity, data_id = self._header.get_values(vector_id, 0, 3)
+        metadata = int(length), int(capacity), int(data_id)
+        if self.cache_len > 0:
+            self.cache[vector_id] = metadata
+        return metadata
+
+    def _set_metadata(self, vector_id, length, capacity, data_id):
+        self._header.set_values(vector_id, 0, [length, capacity, data_id])
+        if self.cache_len > 0:
+            self.cache[vector_id] = (length, capacity, data_id)
+
+    def _get_bytes_size(self, capacity):
+        return self._data._prefix_size + self._data._dt_size * capacity
+
+    def new_vector(self, capacity=None):
+        if capacity is None:
+            capacity = self.init_capacity
+        vector_id = self._header.new_block(3)
+        data_id = self._data.new_block(capacity)
+        self._set_metadata(vector_id, 0, capacity, data_id)
+        return vector_id
+
+    def _reserve(self, length, capacity, data_id, size):
+        # grow the data block so that it holds at least `size` items
+        if size <= capacity:
+            return capacity, data_id
+        new_capacity = max(capacity, 1)
+        while new_capacity < size:
+            new_capacity *= self.growth_factor
+
+        bytes_size = self._get_bytes_size(capacity)
+        new_bytes_size = self._get_bytes_size(new_capacity)
+        if not self._db._extend_in_place(data_id, bytes_size, new_bytes_size):
+            new_data_id = self._data.new_block(new_capacity)
+            if length > 0:
+                self._data.set_values(
+                    new_data_id, 0, self._data.get_values(data_id, 0, length))
+            self._db._release(data_id, bytes_size)
+            data_id = new_data_id
+        return new_capacity, data_id
+
+    def reserve(self, vector_id, size):
+        length, capacity, data_id = self._get_metadata(vector_id)
+        capacity, data_id = self._reserve(
+            length, capacity, data_id, size)
+        self._set_metadata(vector_id, length, capacity, data_id)
+
+    def append(self, vector_id, value):
+        self.extend(vector_id, [value])
+
+    def extend(self, vector_id, values):
+        values = np.asarray(values, dtype=self.dt)
+        length, capacity, data_id = self._get_metadata(vector_id)
+        new_length = length + len(values)
+        capacity, data_id = self._reserve(
+            length, capacity, data_id, new_length)
+
+        self._data.set_values(data_id, length, values)
+        self._set_metadata(vector_id, new_length, capacity, data_id)
+
+    def length(self, vector_id):
+        return self._get_metadata(vector_id)[0]
+
+    def get_values(self, vector_id, start=0, end=None):
+        length, _, data_id = self._get_metadata(vector_id)
+        if end is None or end > length:
+            end = length
+        if start >= end:
+            return np.zeros(0, dtype=self.dt)
+        return self._data.get_values(data_id, start, end)
+
+    def get_value(self, vector_id, index):
+        length, _, data_id = self._get_metadata(vector_id)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("vector index out of range")
+        return self._data.get_value(data_id, index)
+
+    def set_value(self, vector_id, index, value):
+        length, _, data_id = self._get_metadata(vector_id)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("vector index out of range")
+        self._data.set_value(data_id, index, value)
+
+    def iterate(self, vector_id):
+        return iter(self.get_values(vector_id))
+
+    def __getitem__(self, args):
+        if not isinstance(args, tuple):
+            return self.get_values(args)
+        vector_id, position = args
+        if isinstance(position, slice):
+            if position.step not in (None, 1):
+                return self.get_values(vector_id)[position]
+            start, end, _ = position.indices(self.length(vector_id))
+            return self.get_values(vector_id, start, end)
+        return self.get_value(vector_id, position)
+
+    def __setitem__(self, args, value):
+        vector_id, index = args
+        self.set_value(vector_id, index, value)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from interlacedb import InterlaceDB
+
+
+def test_packed_bool_array():
+    with InterlaceDB("test.db", flag="n") as db:
+        bits = db.create_array("bits", "bit")
+        flags = db.create_array("flags", "bool")
+
+    block_id = bits.new_block(1000)
+    bits[block_id, 3] = True
+    bits.set_values(block_id, 10, np.ones(20, dtype=bool))
+    bits[block_id, 15] = False
+    values = bits[block_id, 0:40]
+    assert type(values) is list
+    assert list(np.flatnonzero(values)) == [3] + [
+        i for i in range(10, 30) if i != 15]
+    assert bits.count(block_id, 0, 1000) == 20
+
+    # migration of a byte-per-bool block
+    legacy_id = flags.new_block(100)
+    flags.set_values(legacy_id, 0, np.arange(100) % 3 == 0)
+    assert flags[legacy_id, 0:4] == [1, 0, 0, 1]
+    packed_id = bits.pack(legacy_id, 100)
+    assert bits[packed_id, 0:100] == (np.arange(100) % 3 == 0).tolist()
+
+
+def test_reopen():
+    with InterlaceDB("test.db", flag="n") as db:
+        bits = db.create_array("bits", "bit")
+        flags = db.create_array("flags", "bool")
+    bits_id = bits.new_block(100)
+    flags_id = flags.new_block(100)
+    bits[bits_id, 42] = True
+    flags[flags_id, 7] = True
+    db.close()
+
+    db = InterlaceDB("test.db")
+    bits = db.datasets["bits"]
+    flags = db.datasets["flags"]
+    assert bits[bits_id, 42] and not bits[bits_id, 41]
+    assert flags[flags_id, 7] and not flags[flags_id, 8]
+    assert bits.count(bits_id, 0, 100) == 1
@@ -0,0 +1,74 @@
+from random import shuffle
+
+from tqdm import tqdm
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import BTree
+
+
+def test_btree():
+    N = 20000
+    with InterlaceDB("test.db", flag="n") as db:
+        event = db.create_dataset("event", key="uint64", value="blob")
+        events = db.create_datastructure(
+            "events", BTree(event, "key", order=32))
+
+    keys = list(range(N))
+    shuffle(keys)
+    for i in tqdm(keys):
+        events[i] = {"value": [i]}
+    assert len(events) == N
+
+    for i in tqdm(range(N)):
+        assert events[i]["value"] == [i]
+
+    assert [d["key"] for d in events[100:110]] == list(range(100, 110))
+    assert [d["key"] for d in events] == list(range(N))
+
+    del events[105]
+    assert 105 not in events
+    assert len(list(events[100:110])) == 9
+
+
+def test_btree_bulk_load():
+    N = 10000
+    with InterlaceDB("test.db", flag="n") as db:
+        word = db.create_dataset("word", key="U15", value="uint64")
+        db.create_datastructure("words", BTree(word, "key", order=16))
+
+    db = InterlaceDB("test.db")
+    words = db.datastructures["words"]
+    keys = sorted(f"word_{i}" for i in range(N))
+    words.bulk_load({"key": k, "value": i} for i, k in enumerate(keys))
+    assert len(words) == N
+    assert words["word_42"]["key"] == "word_42"
+
+    prefixed = [d["key"] for d in words.prefix("word_99")]
+    assert prefixed == sorted(k for k in keys if k.startswith("word_99"))
+
+    words["word_99a"] = {"value": 0}
+    assert "word_99a" in [d["key"] for d in words.prefix("word_99")]
+
+
+def test_btree_bulk_load_after_delete():
+    N = 2000
+    with InterlaceDB("test.db", flag="n") as db:
+        word = db.create_dataset("word", key="U15", value="uint64")
+        db.create_datastructure("words", BTree(word, "key", order=8))
+
+    db = InterlaceDB("test.db")
+    words = db.datastructures["words"]
+    for i in range(N):
+        words[f"word_{i}"] = {"value": i}
+    for i in range(N):
+        del words[f"word_{i}"]
+    assert len(words) == 0 and words._height > 0
+
+    # the emptied tree is released and loaded from a single leaf
+    index = db.index
+    keys = sorted(f"new_{i}" for i in range(N))
+    words.bulk_load({"key": k, "value": i} for i, k in enumerate(keys))
+    assert db.index <= index
+    assert len(words) == N
+    assert [d["key"] for d in words] == keys
+    assert all(words[k]["value"] == i for i, k in enumerate(keys))
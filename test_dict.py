@@ -0,0 +1,71 @@
+import os
+
+from interlacedb.datastructure import Dict
+
+
+def create_dict(**kwargs):
+    if os.path.exists("dict.db"):
+        os.remove("dict.db")
+    return Dict("dict.db", size=256, **kwargs)
+
+
+def test_batches():
+    N = 5000
+    db = create_dict(cache_size=10000)
+    db["k0"] = "old"
+    db.update({f"k{i}": {"i": i} for i in range(N)})
+    db.update([("extra", 1)], other=2)
+    assert db["k0"] == {"i": 0}
+    assert db.get("other") == 2
+
+    keys = [f"k{i}" for i in range(0, N, 7)] + ["missing", "k1"]
+    values = db.get_many(keys, res=-1)
+    assert values[:-2] == [{"i": i} for i in range(0, N, 7)]
+    assert values[-2:] == [-1, {"i": 1}]
+    # values now come from the cache
+    assert db.get_many(["k7", "missing"]) == [{"i": 7}, None]
+
+    db = Dict("dict.db")
+    items = dict(db.items())
+    assert len(items) == N + 2
+    assert items["k42"] == {"i": 42} and items["extra"] == 1
+    assert sorted(db.keys()) == sorted(items)
+    assert len(list(db.values())) == N + 2
+    assert len(list(db)) == N + 2
+
+
+def test_keydir():
+    N = 20000
+    db = create_dict(keydir=True)
+    db.update((f"k{i}", i) for i in range(N))
+    db["k3"] = "new"
+    assert db["k3"] == "new" and db["k5"] == 5
+    assert "missing" not in db and db.get("missing", -1) == -1
+    assert db.get_many(["k1", "missing", "k3"]) == [1, None, "new"]
+    db.close()
+
+    # reloaded from the snapshot
+    db = Dict("dict.db", keydir=True)
+    assert len(db._keydir_hashes) == N
+    assert all(db[f"k{i}"] == i for i in range(4, N))
+    db["k4"] = "newer"
+    assert dict(db.items())["k4"] == "newer"
+
+    # the snapshot is stale, the keydir is rebuilt from the table
+    db = Dict("dict.db", keydir=True)
+    assert db["k4"] == "newer" and db["k3"] == "new"
+    assert sorted(db.keys()) == sorted(f"k{i}" for i in range(N))
+    # files can be read without the keydir as well
+    db = Dict("dict.db")
+    assert db["k4"] == "newer"
+
+    # writes made without the keydir make the snapshot stale too
+    db = Dict("dict.db", keydir=True)
+    db.close()
+    db = Dict("dict.db")
+    db["k6"] = "changed"
+    db = Dict("dict.db", keydir=True)
+    assert db["k6"] == "changed"
+    db.close()
+    header = Dict("dict.db").dstruct._db.header
+    assert header["keydir_generation"] == header["generation"]
@@ -0,0 +1,69 @@
+import pytest
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import LayerTable
+
+
+def test_compact_strings():
+    N = 1000
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset(
+            "node", key="utf8:15", country="category",
+            label="utf8:4:truncate")
+        nodes = LayerTable(node, key="key", p_init=10)
+        db.create_datastructure("nodes", nodes)
+    assert len(node) == 1 + 15 + 4 + 4
+
+    for i in range(N):
+        nodes[f"tést_{i}"] = {"country": f"country_{i % 100}",
+                              "label": "héllo"}
+    with pytest.raises(ValueError):
+        nodes["a" * 16] = {}
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert nodes["tést_42"] == {
+        "key": "tést_42", "country": "country_42", "label": "hél"}
+    assert db.header["_n_categories"] == 100
+
+
+def test_varlen():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="uint64", value="varlen:32")
+    block_id = node.new_block(3)
+    node[block_id, 0] = {"key": 0, "value": "short"}
+    node[block_id, 1] = {"key": 1, "value": list(range(100))}
+    node[block_id, 2] = {"key": 2}
+
+    assert node[block_id, 0]["value"] == "short"
+    assert node[block_id, 1]["value"] == list(range(100))
+    assert "value" not in node[block_id, 2]
+    assert node[block_id, :3, "value"] == ["short", list(range(100)), None]
+
+    node[block_id, 2, "value"] = {"a": 1}
+    assert node[block_id, 2, "value"] == {"a": 1}
+
+
+def test_lazy_record():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset(
+            "node", key="U15", value="uint64", extra="blob", label="utf8:8")
+        nodes = LayerTable(node, key="key", p_init=8)
+        db.create_datastructure("nodes", nodes)
+
+    nodes["a"] = {"value": 1, "extra": [1, 2], "label": "é"}
+    nodes["b"] = {"value": 2}
+    record = nodes.lookup("a", lazy=True)
+    assert type(record["value"]) is int
+    assert record["extra"] == [1, 2]
+    assert dict(record) == nodes["a"]
+
+    record = nodes.lookup("b", lazy=True)
+    assert "extra" not in record
+    assert record.get("label") == ""
+
+    # listing the fields does not fetch blobs
+    record = nodes.lookup("a", lazy=True)
+    assert sorted(record) == ["extra", "key", "label", "value"]
+    assert len(record) == 4 and "extra" in record
+    assert "extra" not in record._values
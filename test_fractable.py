@@ -0,0 +1,69 @@
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import FracTable
+
+
+def create_table(**kwargs):
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+        nodes = FracTable(node, "key", **kwargs)
+        db.create_datastructure("nodes", nodes)
+    return nodes
+
+
+def test_fractable():
+    N = 5000
+    nodes = create_table(p_init=6, cache_depth=1)
+    for i in range(N // 2):
+        nodes.insert({"key": f"test_{i}", "value": i})
+    nodes.insert_many({"key": f"test_{i}", "value": i}
+                      for i in range(N // 2, N))
+    nodes.insert_many([{"key": "test_3", "value": 0},
+                       {"key": "test_3", "value": 42}])
+    assert not nodes.contains("missing")
+    # lookups of missing keys do not allocate capsules
+    index = nodes._db.index
+    nodes.lookup_many(f"missing_{i}" for i in range(100))
+    assert nodes._db.index == index
+
+    for i in range(0, N, 2):
+        nodes.delete(f"test_{i}")
+    try:
+        nodes.delete("test_0")
+        assert False
+    except KeyError:
+        pass
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert nodes.lookup("test_3")["value"] == 42
+    assert all(nodes.lookup(f"test_{i}")["value"] == i
+               for i in range(5, N, 2))
+    records = nodes.lookup_many(["test_1", "test_2", "test_7"])
+    assert records[0]["value"] == 1 and records[1] is None
+    assert sorted(r["value"] for r in nodes) == sorted(
+        [42] + [i for i in range(1, N, 2) if i != 3])
+
+    # deleted slots are reused, deeper keys staying reachable
+    nodes.insert({"key": "test_0", "value": 7})
+    assert nodes.lookup("test_0")["value"] == 7
+    assert all(nodes.contains(f"test_{i}") for i in range(1, N, 2))
+    assert len(list(nodes)) == N // 2 + 1
+
+
+def test_zero_hash():
+    class ZeroHasher:
+        # hashes every key to 0
+        def hash(self, key, seed=0):
+            return 0
+
+        def hash_many(self, keys, seed=0):
+            return [0 for _ in keys]
+
+    nodes = create_table()
+    nodes._hasher = ZeroHasher()
+    schema = nodes._db._read_at(0, 64)
+    assert not nodes.contains("zero")
+    nodes.insert({"key": "zero", "value": 1})
+    nodes.insert_many([{"key": "zero", "value": 2}])
+    assert nodes.lookup("zero")["value"] == 2
+    assert nodes._db._read_at(0, 64) == schema
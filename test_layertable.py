@@ -0,0 +1,275 @@
+import numpy as np
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import LayerTable
+from interlacedb.datastructure.cache import get_record_cache
+
+
+def create_table(**kwargs):
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+        nodes = LayerTable(node, key="key", **kwargs)
+        db.create_datastructure("nodes", nodes)
+    return nodes
+
+
+def test_bitmap():
+    N = 5000
+    nodes = create_table(p_init=8, bitmap=True)
+    for i in range(N):
+        nodes[f"test_{i}"] = {"value": i}
+    for i in range(0, N, 2):
+        del nodes[f"test_{i}"]
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert sorted(d["value"] for d in nodes) == list(range(1, N, 2))
+    assert "test_2" not in nodes
+    assert nodes["test_3"]["value"] == 3
+
+    table_id = nodes.tables_id[0]
+    mask = nodes._bitmap.get_mask(nodes.bitmaps[0], 0, 256)
+    values = nodes.dataset.get_slice(table_id, slice(0, 256), mask)
+    assert [v is not None for v in values] == list(mask)
+
+    # probing goes through the bitmap: deleted slots are reused and keys
+    # past them stay reachable, without reading rows of empty windows
+    nodes = create_table(p_init=8, bitmap=True, n_bloom_filters=0)
+    for i in range(N):
+        nodes[f"test_{i}"] = {"value": i}
+    for i in range(0, N, 2):
+        del nodes[f"test_{i}"]
+    nodes.insert_many({"key": f"test_{i}", "value": 2 * i}
+                      for i in range(0, N, 4))
+    assert all(nodes[f"test_{i}"]["value"] == 2 * i for i in range(0, N, 4))
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(1, N, 2))
+    assert nodes.lookup_many(["test_2", "test_5"])[0] is None
+    assert len(list(nodes)) == len(nodes) == N // 2 + N // 4
+
+    empty = create_table(p_init=8, bitmap=True, n_bloom_filters=0)
+
+    def read_no_rows(p, buckets):
+        assert len(buckets) == 0
+        return []
+    empty._read_windows = read_no_rows
+    empty._read_table_window = None
+    assert empty.lookup_many(["a", "b"]) == [None, None]
+    assert "a" not in empty
+
+
+def test_blocked_bloom():
+    N = 5000
+    for resident in (False, True):
+        nodes = create_table(
+            p_init=8, bloom_fp_rate=.01, bloom_resident=resident)
+        for i in range(N):
+            nodes[f"test_{i}"] = {"value": i}
+
+        db = InterlaceDB("test.db")
+        nodes = db.datastructures["nodes"]
+        assert nodes._blocked_bloom.n_hashes == 7
+        assert all(f"test_{i}" in nodes for i in range(N))
+        assert nodes["test_42"]["value"] == 42
+
+        # negative lookups rarely get past the filter of any layer
+        false_positives = sum(
+            nodes._in_bloom(p, nodes._bloom_hash(f"missing_{i}"))
+            for i in range(N)
+            for p in range(nodes.p_init, nodes.p_last + 1))
+        n_layers = nodes.p_last - nodes.p_init + 1
+        assert false_positives < .03 * N * n_layers
+
+
+def test_pack_bloom_filters():
+    N = 2000
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+        nodes = LayerTable(node, key="key", p_init=8)
+        # as pickled before bloom filters were packed
+        nodes.packed_bloom = False
+        db.create_datastructure("nodes", nodes)
+    for i in range(N):
+        nodes[f"test_{i}"] = {"value": i}
+    assert not nodes._bloom._packed
+
+    nodes.pack_bloom_filters()
+    assert nodes._bloom._packed
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(N))
+    assert "missing" not in nodes
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert nodes._bloom._packed
+    assert all(f"test_{i}" in nodes for i in range(N))
+    nodes["more"] = {"value": 1}
+    assert nodes["more"]["value"] == 1
+
+
+def test_batch():
+    N = 3000
+    for kwargs in ({}, {"bloom_fp_rate": .01}, {"bitmap": True}):
+        nodes = create_table(p_init=6, cache_len=100, **kwargs)
+        nodes.insert_many({"key": f"test_{i}", "value": i} for i in range(N))
+        nodes.insert_many([{"key": "test_1", "value": 0},
+                           {"key": "test_1", "value": 42}])
+        del nodes["test_2"]
+
+        keys = ["test_1", "missing", "test_2", "test_2999"]
+        records = nodes.lookup_many(keys)
+        assert records[0]["value"] == 42
+        assert records[1] is None and records[2] is None
+        assert records[3] == {"key": "test_2999", "value": 2999}
+        assert list(nodes.contains_many(keys)) == [True, False, False, True]
+
+        db = InterlaceDB("test.db")
+        nodes = db.datastructures["nodes"]
+        assert len(list(nodes)) == N - 1
+        assert all(nodes[f"test_{i}"]["value"] == i for i in range(3, N))
+        keys = [f"test_{i}" for i in range(3, N)]
+        assert [r["value"] for r in nodes.lookup_many(keys)] == list(
+            range(3, N))
+
+
+def test_hash_function():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="uint64", value="uint64")
+        nodes = LayerTable(node, key="key", p_init=6)
+        db.create_datastructure("nodes", nodes)
+    keys = np.arange(0, 3000, 3, dtype=np.uint64)
+    assert nodes._hash_many(keys) == [nodes._hash(k) for k in keys.tolist()]
+
+    nodes.insert_many({"key": k, "value": 2 * k} for k in keys.tolist())
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert nodes.hash_function == "mmh3"
+    assert nodes[np.uint64(300)]["value"] == 600
+    assert list(nodes.contains_many(keys[:3])) == [True] * 3
+    assert 301 not in nodes
+
+    # keys out of the range of the key field are rejected
+    for check in (lambda: -1 in nodes, lambda: nodes.contains_many([1, -1])):
+        try:
+            check()
+            assert False
+        except ValueError as e:
+            assert "'key' field" in str(e)
+
+
+def test_compact():
+    N = 4000
+    for kwargs in ({}, {"bloom_fp_rate": .01}, {"bitmap": True}):
+        nodes = create_table(p_init=4, cache_len=10, **kwargs)
+        for i in range(N):
+            nodes[f"test_{i}"] = {"value": i}
+        for i in range(0, N, 2):
+            del nodes[f"test_{i}"]
+        assert len(nodes._layers) > 1
+
+        nodes.compact()
+        assert len(nodes._layers) == 1
+        nodes["new"] = {"value": 1}
+        assert len(nodes._layers) == 1
+
+        db = InterlaceDB("test.db")
+        nodes = db.datastructures["nodes"]
+        assert len(nodes._layers) == 1
+        assert sorted(d["value"] for d in nodes) == [1] + list(range(1, N, 2))
+        assert all(nodes[f"test_{i}"]["value"] == i for i in range(1, N, 2))
+        assert "test_2" not in nodes
+        nodes.insert_many({"key": f"more_{i}", "value": i} for i in range(N))
+        assert nodes["more_7"]["value"] == 7 and nodes["test_7"]["value"] == 7
+
+
+def test_max_layers():
+    nodes = create_table(p_init=4, max_layers=2)
+    for i in range(2000):
+        nodes[f"test_{i}"] = {"value": i}
+        assert len(nodes._layers) <= 2
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(2000))
+
+
+def test_value_cache():
+    N = 2000
+    for policy in ("lru", "clock", "tinylfu"):
+        nodes = create_table(p_init=8, value_cache_size=20000,
+                             value_cache_policy=policy)
+        for i in range(N):
+            nodes[f"test_{i}"] = {"value": i}
+        assert all(nodes[f"test_{i}"]["value"] == i for i in range(N))
+        for _ in range(5):
+            assert all(nodes[f"test_{i}"]["value"] == i for i in range(20))
+        cache = nodes._value_cache
+        assert 0 < cache.n_bytes <= 20000
+        assert cache.hits > 0
+
+        # writes invalidate the cached records
+        nodes["test_1"] = {"value": 42}
+        assert nodes["test_1"]["value"] == 42
+        del nodes["test_2"]
+        assert "test_2" not in nodes
+        assert nodes.lookup_many(["test_1", "test_2", "test_3"]) == [
+            {"key": "test_1", "value": 42}, None,
+            {"key": "test_3", "value": 3}]
+
+        # records handed out are copies
+        nodes["test_3"]["value"] = 0
+        assert nodes["test_3"]["value"] == 3
+
+
+def test_value_cache_budget():
+    # every record is larger than the admission window of tinylfu
+    for policy in ("lru", "clock", "tinylfu"):
+        cache = get_record_cache(1000, policy)
+        for i in range(100):
+            cache.set(i, "x" * 250)
+            assert cache.n_bytes <= 1000
+            assert cache.n_bytes == sum(
+                item[1] for item in cache._items.values())
+        assert cache.get(99) is not None
+
+
+def test_upsert():
+    N = 2000
+    nodes = create_table(p_init=6, cache_len=100)
+    for i in range(N):
+        nodes.increment(f"test_{i % 500}", "value")
+    assert all(nodes[f"test_{i}"]["value"] == 4 for i in range(500))
+    assert nodes.increment("test_0", "value", 10) == 14
+
+    def double(record):
+        return {"value": 2 * record["value"]}
+    assert nodes.upsert("test_1", {"value": 1}, double)["value"] == 8
+    assert nodes.upsert("new", {"value": 1}, double)["value"] == 1
+    assert nodes["new"]["value"] == 1
+
+    nodes.increment_many([f"test_{i}" for i in range(1000)], "value", 2)
+    nodes.increment_many(["a", "b", "a"], "value", [1, 2, 3])
+    assert nodes["test_2"]["value"] == 6
+    assert nodes["test_999"]["value"] == 2
+    assert nodes["a"]["value"] == 4 and nodes["b"]["value"] == 2
+
+    nodes.upsert_many(["new", "c", "c", "c"], {"value": 1}, double)
+    assert nodes["new"]["value"] == 2
+    assert nodes["c"]["value"] == 4
+    assert len(list(nodes)) == 1004
+
+
+def test_sizes():
+    N = 3000
+    nodes = create_table(p_init=6)
+    for i in range(N):
+        nodes[f"test_{i}"] = {"value": i}
+    nodes["test_0"] = {"value": 1}
+    for i in range(0, N, 3):
+        del nodes[f"test_{i}"]
+    nodes.insert_many([{"key": f"test_{i}", "value": i} for i in range(6)])
+    nodes.increment("new", "value")
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert len(nodes) == len(list(nodes)) == N - N // 3 + 3
+    assert N // 3 - 2 <= nodes.n_tombstones <= N // 3
+    assert 0 < nodes.load_factor < 1
+    nodes.compact()
+    assert len(nodes) == len(list(nodes))
+    assert nodes.n_tombstones == 0
@@ -0,0 +1,38 @@
+import random
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import LinearHashTable
+
+
+def test_linearhash():
+    N = 5000
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+        nodes = LinearHashTable(node, key="key", n_buckets=4, bucket_size=8)
+        db.create_datastructure("nodes", nodes)
+
+    keys = list(range(N))
+    random.shuffle(keys)
+    for i in keys:
+        nodes[f"test_{i}"] = {"value": i}
+    nodes["test_3"] = {"value": 42}
+    assert len(nodes) == N
+    assert nodes.load_factor <= .8
+
+    for i in range(0, N, 2):
+        del nodes[f"test_{i}"]
+    assert len(nodes) == N // 2
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert len(nodes) == N // 2
+    assert nodes["test_3"]["value"] == 42
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(5, N, 2))
+    assert not any(f"test_{i}" in nodes for i in range(0, N, 2))
+    assert sorted(d["value"] for d in nodes) == sorted(
+        [42] + [i for i in range(1, N, 2) if i != 3])
+
+    for i in range(N, 2 * N):
+        nodes[f"test_{i}"] = {"value": i}
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(N, 2 * N))
+    assert len(nodes) == N // 2 + N
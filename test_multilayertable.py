@@ -0,0 +1,178 @@
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import MultiLayerTable
+
+
+def create_table(**kwargs):
+    with InterlaceDB("test.db", flag="n") as db:
+        edge = db.create_dataset("edge", node="U15", weight="uint64")
+        edges = MultiLayerTable(edge, key="node", **kwargs)
+        db.create_datastructure("edges", edges)
+    return edges
+
+
+def test_lookup():
+    N = 2000
+    edges = create_table(probe_factor=.2, growth_factor=4)
+    table_id = edges.new_table()
+    for i in range(N):
+        table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+    table_id = edges.insert(table_id, {"node": "n7", "weight": 42})
+
+    db = InterlaceDB("test.db")
+    edges = db.datastructures["edges"]
+    assert edges.lookup(table_id, "n7")["weight"] == 42
+    assert all(edges.lookup(table_id, f"n{i}")["weight"] == i
+               for i in range(8, N))
+    assert len(list(edges.iterate(table_id))) == N
+    try:
+        edges.lookup(table_id, "missing")
+        assert False
+    except KeyError:
+        pass
+
+
+def test_value_cache():
+    N = 500
+    edges = create_table(growth_factor=2, value_cache_size=100000,
+                         value_cache_policy="tinylfu")
+    table_id = edges.new_table()
+    for i in range(N):
+        table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+    assert all(edges.lookup(table_id, f"n{i}")["weight"] == i
+               for i in range(N))
+    assert edges.lookup(table_id, "n0")["weight"] == 0
+
+    table_id = edges.insert(table_id, {"node": "n0", "weight": 42})
+    assert edges.lookup(table_id, "n0")["weight"] == 42
+
+
+def test_sizes():
+    N = 1000
+    edges = create_table(growth_factor=2)
+    table_id = edges.new_table()
+    for i in range(N):
+        table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+    table_id = edges.insert(table_id, {"node": "n0", "weight": 1})
+    assert edges.len(table_id) == N
+    for i in range(0, N, 2):
+        edges.delete(table_id, f"n{i}")
+    assert edges.len(table_id) == N // 2
+    assert edges.n_tombstones(table_id) == N // 2
+    table_id = edges.insert(table_id, {"node": "n0", "weight": 1})
+
+    db = InterlaceDB("test.db")
+    edges = db.datastructures["edges"]
+    assert edges.len(table_id) == N // 2 + 1
+    assert edges.len(table_id) == len(list(edges.iterate(table_id)))
+    assert 0 < edges.load_factor(table_id) < 1
+
+
+def test_insert_many():
+    N = 20000
+    for kwargs in ({}, {"bloom_fp_rate": .01}):
+        edges = create_table(growth_factor=4, probe_factor=.2, **kwargs)
+        table_id = edges.new_table()
+        for i in range(10):
+            table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+        edges.delete(table_id, "n1")
+        table_id = edges.insert_many(
+            table_id, [{"node": f"n{i}", "weight": i} for i in range(5)])
+        table_id = edges.insert_many(
+            table_id, [{"node": f"n{i}", "weight": 2 * i}
+                       for i in range(5, N)] + [{"node": "n0", "weight": 7}])
+
+        db = InterlaceDB("test.db")
+        edges = db.datastructures["edges"]
+        assert edges.len(table_id) == N
+        assert edges.lookup(table_id, "n0")["weight"] == 7
+        assert edges.lookup(table_id, "n1")["weight"] == 1
+        assert all(edges.lookup(table_id, f"n{i}")["weight"] == 2 * i
+                   for i in range(5, N))
+        assert len(list(edges.iterate(table_id))) == N
+
+        # scalar insertions keep working on top of a presized table
+        table_id = edges.insert(table_id, {"node": "extra", "weight": 1})
+        assert edges.lookup(table_id, "extra")["weight"] == 1
+        assert edges.len(table_id) == N + 1
+
+
+def test_compact():
+    N = 3000
+    edges = create_table(growth_factor=2, probe_factor=.2)
+    table_id = edges.new_table()
+    for i in range(N):
+        table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+    for i in range(0, N, 2):
+        edges.delete(table_id, f"n{i}")
+    other_id = edges.new_table()
+    assert len(edges._get_chain(table_id)) > 1
+
+    new_ids = edges.compact_many([table_id, other_id])
+    assert list(new_ids) == [table_id]
+    table_id = new_ids[table_id]
+    assert len(edges._get_chain(table_id)) == 1
+    assert edges.len(table_id) == N // 2
+    assert edges.n_tombstones(table_id) == 0
+    assert edges.load_factor(table_id) <= .5
+
+    db = InterlaceDB("test.db")
+    edges = db.datastructures["edges"]
+    assert all(edges.lookup(table_id, f"n{i}")["weight"] == i
+               for i in range(1, N, 2))
+    assert sorted(e["weight"] for e in edges.iterate(table_id)) == list(
+        range(1, N, 2))
+    table_id = edges.insert(table_id, {"node": "n0", "weight": 0})
+    assert edges.lookup(table_id, "n0")["weight"] == 0
+
+
+def test_insert_after_compact():
+    N = 2000
+    for kwargs in ({}, {"value_cache_size": 1000000}):
+        edges = create_table(growth_factor=2, probe_factor=.2, **kwargs)
+        old_id = edges.new_table()
+        for i in range(N):
+            old_id = edges.insert(old_id, {"node": f"n{i}", "weight": i})
+        table_id = edges.new_table()
+        edges.compact(old_id)
+
+        # the tables chained from now on reuse the released blocks, so the
+        # newest table of the chain may get a lower id than the previous one
+        heads = [table_id]
+        for i in range(N):
+            table_id = edges.insert(table_id, {"node": f"m{i}", "weight": i})
+            if table_id != heads[-1]:
+                heads.append(table_id)
+        assert any(new < old for old, new in zip(heads, heads[1:]))
+        assert edges.len(table_id) == N
+        assert edges.n_tombstones(table_id) == 0
+        assert all(edges.lookup(table_id, f"m{i}")["weight"] == i
+                   for i in range(N))
+        assert sorted(e["weight"] for e in edges.iterate(table_id)) == list(
+            range(N))
+
+        # updates of rows held in older tables are seen from the head
+        for i in range(N):
+            assert edges.insert(
+                table_id, {"node": f"m{i}", "weight": i + 1}) == table_id
+        assert all(edges.lookup(table_id, f"m{i}")["weight"] == i + 1
+                   for i in range(N))
+
+
+def test_iterate_array():
+    N = 2000
+    edges = create_table(growth_factor=2, probe_factor=.2)
+    table_id = edges.new_table()
+    for i in range(N):
+        table_id = edges.insert(table_id, {"node": f"n{i}", "weight": i})
+    for i in range(0, N, 3):
+        edges.delete(table_id, f"n{i}")
+    assert len(edges._get_chain(table_id)) > 1
+
+    db = InterlaceDB("test.db")
+    edges = db.datastructures["edges"]
+    weights = edges.iterate_array(table_id, "weight")
+    assert sorted(weights.tolist()) == [i for i in range(N) if i % 3 != 0]
+    nodes = edges.iterate_array(table_id, "node")
+    assert sorted(nodes.tolist()) == sorted(
+        e["node"] for e in edges.iterate(table_id))
+    assert len(edges.iterate_array(0, "node")) == 0
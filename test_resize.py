@@ -0,0 +1,75 @@
+from interlacedb import InterlaceDB
+
+
+def test_group_resize():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U20", value="uint64")
+        node_group = db.create_group("node_group", node, count="uint64")
+
+    block_id = node_group.new_block(10)
+    node_group[block_id, "count"] = 10
+    for i in range(10):
+        node_group[block_id, i] = {"key": f"key_{i}", "value": i}
+
+    # the block sits at the tail of the file: extended in place
+    assert node_group.resize(block_id, 20, 10) == block_id
+    node_group[block_id, 19] = {"key": "key_19", "value": 19}
+
+    # another block follows it: copied once
+    node_group.new_block(5)
+    new_block_id = node_group.resize(block_id, 40, 20)
+    assert new_block_id != block_id
+    assert node_group[new_block_id, "count"] == 10
+    assert node_group[new_block_id, 3]["value"] == 3
+    assert node_group[new_block_id, 19]["key"] == "key_19"
+
+    # the released block is handed out again
+    assert node_group.new_block(20) == block_id
+    assert node_group.status(block_id, 3) == 0
+
+    # a block right before released space grows into it
+    first_id = node_group.new_block(5)
+    second_id = node_group.new_block(5)
+    node_group.new_block(5)
+    assert node_group.resize(second_id, 10, 5) != second_id
+    assert node_group.resize(first_id, 8, 5) == first_id
+
+
+def test_release_merges():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U20", value="uint64")
+
+    size = len(node)
+    ids = [node.new_block(4) for _ in range(4)]
+    index = db.index
+    # released extents merge with both neighbours
+    db._release(ids[0], 4 * size)
+    db._release(ids[2], 4 * size)
+    db._release(ids[1], 4 * size)
+    assert db._free_blocks == {ids[0]: 12 * size}
+    # smaller allocations split a larger free extent
+    assert node.new_block(2) == ids[0]
+    assert db._free_blocks == {ids[0] + 2 * size: 10 * size}
+    # free space reaching the write head gives it back
+    db._release(ids[3], 4 * size)
+    assert db._free_blocks == {}
+    assert db.index == ids[0] + 2 * size < index
+
+
+def test_shrink_then_grow():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U20", value="uint64")
+        node_group = db.create_group("node_group", node, count="uint64")
+
+    block_id = node_group.new_block(8)
+    for i in range(8):
+        node_group[block_id, i] = {"key": f"key_{i}", "value": i}
+    # space given back to the write head comes back zeroed
+    assert node_group.resize(block_id, 2, 8) == block_id
+    assert node_group.resize(block_id, 8, 2) == block_id
+    assert [node_group.status(block_id, i) for i in range(8)] == [1] * 2 + [
+        0] * 6
+
+    node_group.resize(block_id, 2, 8)
+    size = 6 * len(node)
+    assert db._read_at(db._allocate(size), size) == bytes(size)
@@ -0,0 +1,48 @@
+import random
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import RobinHoodTable
+
+
+def test_robinhood():
+    N = 5000
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+        nodes = RobinHoodTable(node, key="key", p_init=6)
+        db.create_datastructure("nodes", nodes)
+
+    keys = list(range(N))
+    random.shuffle(keys)
+    for i in keys:
+        nodes[f"test_{i}"] = {"value": i}
+    nodes["test_3"] = {"value": 42}
+    assert len(nodes) == N
+    assert nodes.load_factor <= .9
+
+    for i in range(0, N, 2):
+        del nodes[f"test_{i}"]
+    assert len(nodes) == N // 2
+
+    db = InterlaceDB("test.db")
+    nodes = db.datastructures["nodes"]
+    assert len(nodes) == N // 2
+    assert nodes["test_3"]["value"] == 42
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(5, N, 2))
+    assert not any(f"test_{i}" in nodes for i in range(0, N, 2))
+    assert sorted(d["value"] for d in nodes) == sorted(
+        [42] + [i for i in range(1, N, 2) if i != 3])
+
+    nodes.rehash()
+    assert all(nodes[f"test_{i}"]["value"] == i for i in range(5, N, 2))
+    assert "test_0" not in nodes
+
+
+def test_max_load_factor():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U15", value="uint64")
+    for max_load_factor in (0, 1, 1.5):
+        try:
+            RobinHoodTable(node, key="key", max_load_factor=max_load_factor)
+            assert False
+        except ValueError:
+            pass
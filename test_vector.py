@@ -0,0 +1,27 @@
+import numpy as np
+
+from interlacedb import InterlaceDB
+from interlacedb.datastructure import Vector
+
+
+def test_vector():
+    with InterlaceDB("test.db", flag="n") as db:
+        postings = db.create_datastructure(
+            "postings", Vector("postings", "uint32", init_capacity=4))
+
+    a = postings.new_vector()
+    b = postings.new_vector()
+    for i in range(100):
+        postings.append(a, i)
+    postings.extend(b, np.arange(1000))
+    postings.extend(a, range(100, 150))
+
+    db = InterlaceDB("test.db")
+    postings = db.datastructures["postings"]
+    assert postings.length(a) == 150
+    assert list(postings[a]) == list(range(150))
+    assert list(postings[b, 10:15]) == list(range(10, 15))
+    assert postings[b, -1] == 999
+
+    postings[a, 0] = 42
+    assert postings[a, 0] == 42
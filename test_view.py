@@ -0,0 +1,59 @@
+import numpy as np
+
+from interlacedb import InterlaceDB
+
+
+def test_array_view():
+    with InterlaceDB("test.db", flag="n") as db:
+        counts = db.create_array("counts", "uint32")
+
+    block_id = counts.new_block(1000)
+    counts[block_id, 5] = 3
+    view = counts.view(block_id, 1000)
+    view[::2] += 1
+    view[5] += 1
+    assert counts[block_id, 4] == 1
+    assert counts[block_id, 5] == 4
+    assert counts.get_values(block_id, 0, 1000).sum() == 504
+
+
+def test_dataset_view():
+    with InterlaceDB("test.db", flag="n") as db:
+        node = db.create_dataset("node", key="U10", value="float32")
+        node_group = db.create_group("node_group", node, size="uint32")
+
+    block_id = node_group.new_block(10)
+    for i in range(10):
+        node_group[block_id, i] = {"key": f"key_{i}", "value": i}
+
+    view = node_group.view(block_id, 10)
+    view["value"][view["value"] > 4] *= 2
+    assert node_group[block_id, 8]["value"] == 16
+    assert node_group[block_id, 3]["value"] == 3
+    assert list(view["key"][:2]) == ["key_0", "key_1"]
+    assert np.all(view["prefix"] == node._identifier)
+
+
+def test_view_lifetime():
+    with InterlaceDB("test.db", flag="n") as db:
+        counts = db.create_array("counts", "uint32")
+
+    block_id = counts.new_block(10)
+    view = counts.view(block_id, 10)
+    # writes buffered by a transaction are visible through the view
+    db.begin_transaction()
+    counts[block_id, 3] = 7
+    assert view[3] == 7
+    view[4] = 9
+    assert counts[block_id, 4] == 9
+    db.end_transaction()
+
+    assert db._n_views == 1
+    # slices keep the mapping alive after the view itself is gone
+    part = view[2:6]
+    del view
+    assert db._n_views == 1
+    counts[block_id, 5] = 11
+    assert part[3] == 11
+    del part
+    assert db._n_views == 0